@@ -0,0 +1,66 @@
+# Content-addressed store for document bodies
+# Each text is zlib-compressed into blobs/<first two hex digits>/<sha256>.zlib, so the database only keeps a
+# 64-character hash per document and identical bodies are stored once
+import hashlib
+import logging
+import os
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text):
+    """SHA-256 hex digest of text's UTF-8 encoding, the key a body is stored under."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file's bytes, read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Compressed, write-once text blobs keyed by SHA-256."""
+
+    def __init__(self, folder, level=6):
+        self.folder = Path(folder)
+        self.level = level  # zlib compression level
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest):
+        return self.folder / digest[:2] / f"{digest}.zlib"
+
+    def __contains__(self, digest):
+        return self.path(digest).exists()
+
+    def put(self, text):
+        """Store text and return its digest; storing the same text again is a no-op."""
+        digest = content_hash(text)
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(text.encode("utf-8"), self.level))
+            os.replace(tmp_path, path)  # Readers never see a partially written blob
+        return digest
+
+    def get(self, digest):
+        """Return the text stored under digest, or "" if the blob is missing."""
+        try:
+            with open(self.path(digest), "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8")
+        except FileNotFoundError:
+            logger.warning(f"Missing content blob {digest}")
+            return ""
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
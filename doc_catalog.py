@@ -0,0 +1,140 @@
+# In-memory catalog of the documents table
+# Keeps name -> doc id plus the light metadata the document list shows (tags, category, created, size,
+# images), so hover tooltips, selection and duplicate checks never deserialize or scan the whole table.
+# At startup the catalog can instead be mapped from an index snapshot, which also carries the tag and
+# category facets and the list orderings, so showing the document list needs no pass over the entries.
+import logging
+import os
+import threading
+
+from index_snapshot import OverlayMapping
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ("Name", "Date", "Category")
+
+
+def sorted_names(entries, sort_key="Name"):
+    """Document names sorted by "Name", "Date" (newest first) or "Category"."""
+    items = list(entries.items())
+    if sort_key == "Date":
+        items.sort(key=lambda item: item[1]["created"], reverse=True)
+    elif sort_key == "Category":
+        items.sort(key=lambda item: item[1]["category"])
+    else:
+        items.sort(key=lambda item: item[0])
+    return [name for name, _ in items]
+
+
+class DocumentCatalog:
+    """Name-keyed metadata for every stored document; update it alongside every insert, delete and import."""
+
+    def __init__(self, folder=None):
+        self.folder = folder  # Where document files are copied; used to record their size
+        self.entries = {}  # name -> {"doc_id", "tags", "category", "created", "size", "images", "content_hash"}
+        self.mapped = None  # (snapshot, section name) while entries overlay a snapshot's records
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def make_entry(self, doc_id, doc):
+        size = None
+        if self.folder:
+            try:
+                size = os.path.getsize(os.path.join(self.folder, doc["name"]))
+            except OSError:
+                pass
+        return {
+            "doc_id": doc_id,
+            "tags": list(doc.get("tags", [])),
+            "category": doc.get("category", "Uncategorized"),
+            "created": doc.get("created", ""),
+            "size": size,
+            "images": list(doc.get("images", [])),
+            "content_hash": doc.get("content_hash"),
+        }
+
+    def load(self, docs):
+        """Replace the catalog with stored documents (records carrying a doc_id, as returned by all())."""
+        entries = {doc["name"]: self.make_entry(doc.doc_id, doc) for doc in docs}
+        with self.lock:
+            self.entries = entries
+            self.mapped = None
+        logger.info(f"Loaded catalog with {len(entries)} documents")
+
+    def add_to_snapshot(self, builder, name="catalog"):
+        """Add the entries, tag and category facets, and every list ordering to a SnapshotBuilder."""
+        with self.lock:
+            entries = dict(self.entries)
+        builder.add_records(name, entries)
+        builder.add_strings(f"{name}.tags", sorted(set(tag for entry in entries.values() for tag in entry["tags"])))
+        builder.add_strings(f"{name}.categories", sorted(set(entry["category"] for entry in entries.values())))
+        for sort_key in SORT_KEYS:
+            builder.add_strings(f"{name}.order.{sort_key}", sorted_names(entries, sort_key))
+
+    def attach(self, snapshot, name="catalog"):
+        """Serve entries from a snapshot written by add_to_snapshot; changes are kept on top of it in memory."""
+        with self.lock:
+            self.entries = OverlayMapping(snapshot.records(name))
+            self.mapped = (snapshot, name)
+        logger.info(f"Mapped catalog with {len(self.entries)} documents")
+
+    def facet(self, part):
+        """A precomputed list from the snapshot, or None once entries have changed since it was written."""
+        if self.mapped is None or self.entries.modified:
+            return None
+        snapshot, name = self.mapped
+        return list(snapshot.strings(f"{name}.{part}"))
+
+    def add(self, doc_id, doc):
+        entry = self.make_entry(doc_id, doc)
+        with self.lock:
+            self.entries[doc["name"]] = entry
+
+    def remove(self, name):
+        """Drop a document and return its entry, or None if it was not cataloged."""
+        with self.lock:
+            return self.entries.pop(name, None)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def references(self, digest):
+        """True if any cataloged document's body is stored under digest."""
+        with self.lock:
+            return any(entry["content_hash"] == digest for entry in self.entries.values())
+
+    def image_names(self):
+        """Every cataloged document's embedded image names, one per document holding it."""
+        with self.lock:
+            return [image for entry in self.entries.values() for image in entry["images"]]
+
+    def refresh_size(self, name):
+        """Re-read the file size after the document file has been copied into the folder."""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and self.folder:
+                try:
+                    entry["size"] = os.path.getsize(os.path.join(self.folder, name))
+                except OSError:
+                    entry["size"] = None
+
+    def names(self, sort_key="Name"):
+        """Document names sorted by "Name", "Date" (newest first) or "Category"."""
+        with self.lock:
+            names = self.facet(f"order.{sort_key if sort_key in SORT_KEYS else 'Name'}")
+            return names if names is not None else sorted_names(self.entries, sort_key)
+
+    def tags(self):
+        with self.lock:
+            tags = self.facet("tags")
+            return tags if tags is not None else sorted(set(tag for entry in self.entries.values() for tag in entry["tags"]))
+
+    def categories(self):
+        with self.lock:
+            categories = self.facet("categories")
+            return categories if categories is not None else sorted(set(entry["category"] for entry in self.entries.values()))
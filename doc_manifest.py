@@ -0,0 +1,188 @@
+# Source file manifest for incremental re-indexing
+# Records (path, size, mtime, SHA-256) for every source document. diff() stats each file and hashes only
+# the ones that are new or whose size or mtime moved, so rescanning an unchanged folder reads no file
+# contents. The delta lists files to add, re-index and remove, plus new files whose content is already
+# present under another name (renamed copies), which callers skip. A diff can be scoped to some folders, so
+# syncing one folder never reports the files recorded from another as removed. FolderWatcher polls a sync function
+# in the background so dropped, edited or deleted files are picked up without a manual scan.
+import json
+import logging
+import os
+import threading
+
+from blob_store import file_sha256
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+def list_documents(folder, extensions=SUPPORTED_EXTENSIONS):
+    """Absolute paths of the supported files directly inside folder."""
+    try:
+        names = sorted(os.listdir(folder))
+    except FileNotFoundError:
+        return []
+    return [os.path.abspath(os.path.join(folder, name)) for name in names
+            if name.lower().endswith(extensions) and os.path.isfile(os.path.join(folder, name))]
+
+
+class ManifestDelta:
+    """Result of SourceManifest.diff(); apply it with SourceManifest.commit() once the index is updated."""
+
+    def __init__(self, added, changed, removed, duplicates, entries):
+        self.added = added  # Paths not seen before
+        self.changed = changed  # Paths whose content hash changed
+        self.removed = removed  # Paths that are gone
+        self.duplicates = duplicates  # {new path: path already holding the same content}
+        self.entries = entries  # Manifest entries after the delta
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed or self.duplicates)
+
+    def summary(self):
+        return (f"{len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed, "
+                f"{len(self.duplicates)} duplicates skipped")
+
+
+class SourceManifest:
+    """Path -> {"size", "mtime_ns", "sha256"} for indexed source files, saved as JSON at path."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.entries = {}
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError as e:
+            logger.error(f"Ignoring unreadable manifest {self.path}: {str(e)}")
+            self.entries = {}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+
+    def find(self, sha256):
+        """Path of a recorded file with this content hash, or None."""
+        with self.lock:
+            for path, entry in self.entries.items():
+                if entry["sha256"] == sha256 and not entry.get("duplicate_of"):
+                    return path
+        return None
+
+    def record(self, path):
+        """Hash and record one file right away, e.g. after copying it into a watched folder."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            self.entries[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(path)}
+            self.save()
+        return self.entries[path]["sha256"]
+
+    def forget(self, path):
+        with self.lock:
+            if self.entries.pop(os.path.abspath(path), None) is not None:
+                self.save()
+
+    def diff(self, paths, roots=None) -> ManifestDelta:
+        """Compare the files at paths (the complete current listing of roots) with the manifest.
+
+        roots are the folders and files paths was listed from; recorded files outside them are kept as they are.
+        None means paths covers everything the manifest records.
+        """
+        with self.lock:
+            previous = dict(self.entries)
+        entries = {}
+        if roots is not None:
+            roots = {os.path.abspath(root) for root in roots}
+            entries = {path: entry for path, entry in previous.items()
+                       if path not in roots and os.path.dirname(path) not in roots}
+        added, changed, duplicates = [], [], {}
+        by_hash = {}  # Content hash -> path holding it, for duplicate detection
+        for path in sorted(os.path.abspath(p) for p in paths):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = previous.get(path)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                entries[path] = entry
+                continue
+            sha256 = file_sha256(path)
+            entries[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+            if entry is None:
+                added.append(path)
+            elif entry["sha256"] != sha256 or entry.get("duplicate_of"):
+                changed.append(path)
+        # Content held by more than one current file is indexed once, preferring the path that already holds it
+        def seniority(item):
+            path, entry = item
+            return path in added or path in changed, bool(entry.get("duplicate_of")), path
+
+        for path, entry in sorted(entries.items(), key=seniority):
+            original = by_hash.setdefault(entry["sha256"], path)
+            if original != path:
+                if entry.get("duplicate_of") != original:
+                    duplicates[path] = original
+                entries[path] = dict(entry, duplicate_of=original)
+            elif entry.get("duplicate_of"):
+                entries[path] = {key: value for key, value in entry.items() if key != "duplicate_of"}
+                if path not in added and path not in changed:
+                    added.append(path)  # Its original is gone, so this copy is now the indexed one
+        added = [path for path in added if path not in duplicates]
+        changed = [path for path in changed if path not in duplicates]
+        removed = [path for path, entry in previous.items() if path not in entries and not entry.get("duplicate_of")]
+        removed += [path for path in duplicates if path in previous and not previous[path].get("duplicate_of")]
+        return ManifestDelta(added, changed, removed, duplicates, entries)
+
+    def commit(self, delta):
+        with self.lock:
+            self.entries = delta.entries
+            self.save()
+
+
+class FolderWatcher:
+    """Call sync() every interval seconds on a daemon thread until stop(); sync does its own diffing.
+
+    on_change(result) is called, still on the watcher thread, whenever sync() returns something truthy.
+    """
+
+    def __init__(self, sync, interval=10.0, on_change=None):
+        self.sync = sync
+        self.interval = interval
+        self.on_change = on_change
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                result = self.sync()
+            except Exception as e:
+                logger.error(f"Folder sync failed: {str(e)}")
+                continue
+            if result and self.on_change:
+                self.on_change(result)
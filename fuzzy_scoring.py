@@ -0,0 +1,46 @@
+# Batch fuzzy scoring for the knowledge base search
+# Scores every (query word, candidate text) pair in one call and returns a NumPy matrix,
+# using rapidfuzz's C implementation when it is installed and fuzzywuzzy otherwise.
+# The two partial_ratio implementations do not score identically: rapidfuzz finds the best-aligned window,
+# fuzzywuzzy only tries windows at its matching blocks, so rapidfuzz scores many pairs a few points higher
+# (and "wifi" against a long sentence containing "wofi" 75 instead of 50). Rankings can therefore differ
+# between installs; tests/test_fuzzy_backends.py pins down how.
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from rapidfuzz import fuzz as rapid_fuzz, process as rapid_process
+except ImportError:  # rapidfuzz is optional; fall back to the per-pair fuzzywuzzy loop
+    rapid_process = None
+    from fuzzywuzzy import fuzz
+
+
+def batch_partial_ratio(words, texts, score_cutoff=70):
+    """Return a (len(words), len(texts)) matrix of partial_ratio scores.
+
+    Texts are expected to be lowercased already (cache them at index time). Pairs scoring below
+    score_cutoff are reported as 0, which lets rapidfuzz abandon losing candidates early.
+    """
+    words = [word.lower() for word in words]
+    if not words or not texts:
+        return np.zeros((len(words), len(texts)), dtype=np.float32)
+    if rapid_process is not None:
+        return rapid_process.cdist(words, texts, scorer=rapid_fuzz.partial_ratio,
+                                   score_cutoff=score_cutoff, dtype=np.float32, workers=-1)
+    scores = np.zeros((len(words), len(texts)), dtype=np.float32)
+    for i, word in enumerate(words):
+        for j, text in enumerate(texts):
+            score = fuzz.partial_ratio(word, text)
+            if score >= score_cutoff:
+                scores[i, j] = score
+    return scores
+
+
+def best_scores(words, texts, score_cutoff=70):
+    """Return each text's best score over all words, as ints like fuzz.partial_ratio."""
+    scores = batch_partial_ratio(words, texts, score_cutoff)
+    if not scores.size:
+        return np.zeros(len(texts), dtype=np.int32)
+    return np.rint(scores.max(axis=0)).astype(np.int32)
@@ -0,0 +1,97 @@
+# Content-addressed store for extracted document images
+# Each image is saved once as <sha256>.<ext> in the images folder, however many pages or documents embed it,
+# so a logo repeated on every page costs one file. Documents keep image names (or paths) as before; the
+# single writer reference-counts them, and a name whose count drops to zero is deleted by collect() after
+# the batch that released it, so an image another document in the same batch still uses is never lost.
+# Counts come from one application's records, so each application keeps its own folder (the Tk app uses
+# images/, the engine images/kb_engine/), and collect() re-reads the stored references before deleting,
+# so another process writing the same records cannot lose an image it has just started to use.
+import hashlib
+import logging
+import os
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+class ImageStore:
+    """Write-once image files keyed by SHA-256, with reference counts over the names documents hold.
+
+    put() is stateless and safe to call from extraction worker processes. acquire(), release() and collect()
+    belong to the process that writes document records; the counts are built on first use from
+    references(), a callable yielding every stored document's image names or paths, one per reference.
+    A bare name refers to a file in folder; a path (as the engine stores them) is used as it is.
+    """
+
+    def __init__(self, folder, references=None):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.references = references
+        self.counts = None  # Image reference -> number of documents holding it, loaded lazily
+        self.garbage = set()  # References released to zero since the last collect()
+
+    @staticmethod
+    def key(image):
+        return str(Path(image))
+
+    def path(self, image):
+        image = Path(image)
+        return image if image.parent != Path(".") else self.folder / image
+
+    def put(self, data, ext="png"):
+        """Store image bytes and return the file name; storing the same bytes again only returns the name."""
+        name = f"{hashlib.sha256(data).hexdigest()}.{ext.lower().lstrip('.') or 'png'}"
+        path = self.path(name)
+        if not path.exists():
+            tmp_path = path.with_name(f"{name}.{os.getpid()}.tmp")  # Worker processes may race on one image
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return name
+
+    def load_counts(self):
+        if self.counts is None:
+            self.counts = Counter(self.key(image) for image in (self.references() if self.references else []))
+        return self.counts
+
+    def reset(self):
+        """Forget the counts after documents were replaced wholesale (e.g. an import); they reload on next use."""
+        self.counts = None
+        self.garbage.clear()
+
+    def acquire(self, images):
+        counts = self.load_counts()
+        for image in images:
+            key = self.key(image)
+            counts[key] += 1
+            self.garbage.discard(key)
+
+    def release(self, images):
+        """Drop one reference to each image; unreferenced ones are deleted by the next collect()."""
+        counts = self.load_counts()
+        for image in images:
+            key = self.key(image)
+            counts[key] -= 1
+            if counts[key] <= 0:
+                del counts[key]
+                self.garbage.add(key)
+
+    def collect(self):
+        """Delete the released images no stored document references any more; returns how many were removed."""
+        if not self.garbage:
+            return 0
+        # Check against the records as stored now, not only this process's counts
+        live = set(self.key(image) for image in (self.references() if self.references else []))
+        removed = 0
+        for key in list(self.garbage):
+            self.garbage.discard(key)
+            if self.load_counts()[key] > 0 or key in live:
+                continue
+            try:
+                os.remove(self.path(key))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to delete image {key}: {str(e)}")
+        return removed
@@ -1,93 +1,54 @@
 
 # Retail Support Demo: Offline knowledge base app for managing and searching documents with embedded image support
-# Uses tkinter for GUI, TinyDB for storage, PyMuPDF/docx for document processing, PIL for images, fuzzywuzzy/scikit-learn for search/tags
+# Uses tkinter for GUI, TinyDB or SQLite (kb_storage) for storage, PyMuPDF/docx for document processing, PIL for images, fuzzywuzzy/scikit-learn for search/tags
 import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog  # Added simpledialog for askstring
 from tkinter.scrolledtext import ScrolledText
-from tinydb import TinyDB, Query
-from docx import Document as DocxDocument
-import fitz  # PyMuPDF
+import json
 from PIL import Image, ImageTk
 from fuzzywuzzy import fuzz
-from sklearn.feature_extraction.text import TfidfVectorizer
 import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import pickle
+from itertools import repeat
 import logging
+from search_index import InvertedIndex, TrigramIndex, may_score_above, tokenize
+from result_cache import QueryCache
+from kb_engine import extract_text
+from kb_storage import open_store
+from doc_catalog import DocumentCatalog
+from blob_store import BlobStore, file_sha256
+from image_store import ImageStore
+from vector_store import VectorStore
+from kb_snapshot import export_snapshot, import_snapshot, load_snapshot_state, save_snapshot_state
+from index_snapshot import IndexSnapshot, SnapshotBuilder
+from doc_manifest import FolderWatcher, SourceManifest, list_documents
 
 # Configure logging to save errors and events to app.log for offline debugging
 logging.basicConfig(filename="app.log", level=logging.INFO)
 
 # Initialize database and folders for storing documents and images
-db = TinyDB("knowledge_base.json")  # Database file for document metadata
-doc_table = db.table("documents")  # Table for organizing document records
+doc_table = open_store("knowledge_base.json", "documents")  # Document records; SQLite once migrated with `python kb.py migrate`
+search_index = InvertedIndex("knowledge_base_index.json", load=False)  # BM25 postings and corpus statistics for doc_table
+trigram_index = TrigramIndex(min_overlap=0.1)  # Shortlists likely fuzzy matches; the rest go through may_score_above
+result_cache = QueryCache()  # Ranked (score, doc id) results keyed by query, filters, and index generation
 kb_folder = "kb_documents"  # Folder for storing document files
 img_folder = "images"  # Folder for storing extracted and associated images
 os.makedirs(kb_folder, exist_ok=True)  # Create document folder if it doesn't exist
+catalog = DocumentCatalog(kb_folder)  # In-memory name -> doc id and list metadata, kept in sync with doc_table
 os.makedirs(img_folder, exist_ok=True)  # Create image folder if it doesn't exist
+blob_store = BlobStore("kb_blobs")  # Compressed document bodies keyed by SHA-256; records keep only content_hash
+image_store = ImageStore(img_folder, references=catalog.image_names)  # Reference counts for embedded images, stored once per content hash
+vector_store = VectorStore("knowledge_base_vectors")  # Memory-mapped term counts for tags and similar-document queries
+snapshot_state_path = "last_snapshot.json"  # Time and document names of the last export, for incremental snapshots
+index_snapshot_path = "knowledge_base_index.bin"  # Memory-mapped postings, catalog and facets, mapped at startup
+ingest_workers = os.cpu_count() or 1  # Extraction processes for Scan Document Folder; 1 extracts in the scan thread
+folder_manifest = SourceManifest("kb_documents_manifest.json")  # Size, mtime and SHA-256 of kb_folder files, for content duplicates and folder watching
+watch_interval = 10  # Seconds between kb_folder polls while Watch Document Folder is on
+write_lock = threading.RLock()  # Held by every writer (add, scan, folder sync, delete, import) across its whole change
 
 # Helper Functions
-def extract_text(file_path, max_images=5):
-    """Extract text and up to max_images embedded images from TXT, PDF, or DOCX files."""
-    ext = file_path.lower()
-    images = []  # List to store extracted image filenames
-    text = ""  # Extracted text content
-    try:
-        if ext.endswith(".txt"):
-            # Read plain text files
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-        elif ext.endswith(".docx"):
-            # Extract text and images from DOCX files
-            doc = DocxDocument(file_path)
-            text = "\n".join([p.text for p in doc.paragraphs])
-            img_count = 0
-            for rel in doc.part.rels.values():
-                if "image" in rel.reltype and img_count < max_images:
-                    img_data = rel.target_part.blob
-                    img_name = f"{os.path.splitext(os.path.basename(file_path))[0]}_img{img_count}.png"
-                    img_path = os.path.join(img_folder, img_name)
-                    with open(img_path, "wb") as f:
-                        f.write(img_data)
-                    images.append(img_name)
-                    img_count += 1
-        elif ext.endswith(".pdf"):
-            # Extract text and images from PDF files
-            doc = fitz.open(file_path)
-            text = "\n".join([page.get_text() for page in doc])
-            img_count = 0
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                for img_index, img in enumerate(page.get_images(full=True)):
-                    if img_count >= max_images:
-                        break
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    img_data = base_image["image"]
-                    img_name = f"{os.path.splitext(os.path.basename(file_path))[0]}_page{page_num}_img{img_index}.png"
-                    img_path = os.path.join(img_folder, img_name)
-                    with open(img_path, "wb") as f:
-                        f.write(img_data)
-                    images.append(img_name)
-                    img_count += 1
-    except Exception as e:
-        logging.error(f"Error extracting {file_path}: {str(e)}")
-    return text, images
-
-def generate_tags(text, top_n=5):
-    """Generate top_n tags from text using TF-IDF and return vector for caching."""
-    vectorizer = TfidfVectorizer(stop_words="english", max_features=50)
-    try:
-        X = vectorizer.fit_transform([text])
-        scores = X.toarray()[0]
-        words = vectorizer.get_feature_names_out()
-        top_indices = scores.argsort()[::-1][:top_n]
-        tags = [words[i] for i in top_indices if scores[i] > 0]
-        return tags, pickle.dumps((X, vectorizer))  # Cache vector for performance
-    except:
-        return [], None
-
 def highlight_text(text_widget, keyword, case_sensitive=False):
     """Highlight occurrences of keyword in text_widget, with optional case sensitivity."""
     text_widget.tag_remove("highlight", "1.0", tk.END)
@@ -102,9 +63,131 @@ def highlight_text(text_widget, keyword, case_sensitive=False):
             idx = lastidx
         text_widget.tag_config("highlight", background="yellow")
 
-def is_duplicate(file_name):
-    """Check if a document with file_name already exists in the database."""
-    return any(doc["name"] == file_name for doc in doc_table.all())
+def index_document(doc_id, name, text, tags):
+    """Add a document's name, content, and tags to the BM25, trigram, and vector indexes."""
+    search_index.add(doc_id, " ".join([name, text, " ".join(tags)]))
+    trigram_index.add(doc_id, name, text, *tags)
+    vector_store.add(doc_id, text)
+
+def load_content(doc):
+    """Return a document's body, reading it from the blob store (inline content predates the blob store)."""
+    if "content" in doc:
+        return doc["content"]
+    return blob_store.get(doc["content_hash"]) if doc.get("content_hash") else ""
+
+def upgrade_records():
+    """Move inline content to the blob store and drop legacy pickled vectors; returns the number of records changed."""
+    data = doc_table.dump()
+    records = data[doc_table.name]
+    changed = 0
+    for record in records.values():
+        if "content" in record or "vector" in record:
+            if "content" in record:
+                record["content_hash"] = blob_store.put(record.pop("content"))
+            record.pop("vector", None)  # Superseded by vector_store
+            changed += 1
+    if changed:
+        doc_table.load(data)
+        logging.info(f"Upgraded {changed} document records")
+    return changed
+
+def rebuild_search_index():
+    """Rebuild the BM25 index, corpus statistics, trigram index, and vector store from every record in doc_table."""
+    search_index.clear()
+    trigram_index.clear()
+    vector_store.clear()
+    for doc in doc_table.all():
+        index_document(doc.doc_id, doc["name"], load_content(doc), doc.get("tags", []))
+    save_search_index()
+    vector_store.save()
+    logging.info(f"Rebuilt search index with {len(search_index)} documents")
+
+def save_index_snapshot():
+    """Write the startup snapshot: BM25 and trigram postings plus the catalog with its facets and orderings."""
+    builder = SnapshotBuilder()
+    search_index.add_to_snapshot(builder, "index")
+    trigram_index.add_to_snapshot(builder, "trigrams")
+    catalog.add_to_snapshot(builder)
+    try:
+        builder.write(index_snapshot_path, doc_table.stamp())
+    except OSError as e:
+        logging.error(f"Index snapshot write error: {str(e)}")
+
+def save_search_index():
+    """Persist the BM25 index and regenerate the startup snapshot after documents change."""
+    search_index.save()
+    save_index_snapshot()
+
+def extract_texts(paths):
+    """Yield extract_text results in path order, extracting in ingest_workers processes when there are several files."""
+    if ingest_workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield extract_text(path, img_folder=img_folder)
+        return
+    executor = ProcessPoolExecutor(max_workers=min(ingest_workers, len(paths)))
+    try:
+        yield from executor.map(extract_text, paths, repeat(5), repeat(img_folder), chunksize=1)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def associated_images(record):
+    """Embedded images plus any image associated by file name (see associate_image)."""
+    base = os.path.splitext(record["name"])[0]
+    return list(record.get("images", [])) + [base + ext for ext in [".jpg", ".jpeg", ".png"]]
+
+def is_duplicate(file_name, path=None):
+    """Check if a document with file_name, or with the same content as the file at path, already exists."""
+    if file_name in catalog:
+        return True
+    return path is not None and folder_manifest.find(file_sha256(path)) is not None
+
+def add_record(name, text, images, category, created=None):
+    """Store a document's content and record and add it to the catalog and indexes; the caller holds write_lock and
+    saves the indexes. created keeps the original timestamp when a document is re-indexed."""
+    tags = vector_store.top_terms(text)
+    doc = {"name": name, "content_hash": blob_store.put(text), "tags": tags, "images": images,
+           "created": created or str(datetime.now()), "category": category}
+    image_store.acquire(images)  # Before catalog.add, which the counts are first built from
+    doc_id = doc_table.insert(doc)
+    catalog.add(doc_id, doc)
+    index_document(doc_id, name, text, tags)
+    return doc
+
+def copy_to_kb_folder(path, name):
+    """Copy a source file into kb_folder (unless already there) and record it in the folder manifest."""
+    dest = os.path.join(kb_folder, name)
+    if not os.path.exists(dest):
+        with open(dest, "wb") as f_out, open(path, "rb") as f_in:
+            f_out.write(f_in.read())
+    folder_manifest.record(dest)
+    catalog.refresh_size(name)
+
+def remove_document(name, delete_file=True, delete_images=True):
+    """Remove a document's record, content, and index entries and release its embedded images; its kb_folder file and
+    images associated by name go too unless told not to. The caller saves the indexes and runs image_store.collect()."""
+    entry = catalog.get(name)
+    if not entry:
+        return False
+    image_store.release(entry["images"])  # Before catalog.remove, which the counts are first built from
+    doc_table.remove([entry["doc_id"]])
+    catalog.remove(name)
+    if entry["content_hash"] and not catalog.references(entry["content_hash"]):
+        blob_store.delete(entry["content_hash"])
+    search_index.remove(entry["doc_id"])
+    trigram_index.remove(entry["doc_id"])
+    vector_store.remove(entry["doc_id"])
+    path = os.path.join(kb_folder, name)
+    if delete_file:
+        os.remove(path)
+        folder_manifest.forget(path)
+    if not delete_images:
+        return True
+    base = os.path.splitext(name)[0]
+    for ext in [".jpg", ".jpeg", ".png"]:
+        img_path = os.path.join(img_folder, base + ext)
+        if os.path.exists(img_path):
+            os.remove(img_path)
+    return True
 
 # Main Application Class
 class KnowledgeBaseApp:
@@ -130,7 +213,33 @@ class KnowledgeBaseApp:
         self.word_wrap_var = tk.BooleanVar(value=True)  # Word wrap toggle
         self.case_sensitive_var = tk.BooleanVar(value=False)  # Case-sensitive search
         self.sort_var = tk.StringVar(value="Name")  # Document sort criterion
+        self.rank_mode_var = tk.StringVar(value="BM25")  # Search ranking: BM25 or Fuzzy
+        self.fuzzy_fallback_var = tk.BooleanVar(value=True)  # Fall back to fuzzy matching when BM25 finds nothing
+        self.watch_var = tk.BooleanVar(value=False)  # Watch kb_folder and sync added, edited, and deleted files
+        self.folder_watcher = FolderWatcher(self.sync_document_folder, interval=watch_interval,
+                                            on_change=lambda delta: self.root.after(0, lambda: self.folder_synced(delta)))
+        
+        # Map the index snapshot if doc_table has not changed since it was written; startup then reads no records
+        snapshot = IndexSnapshot.open(index_snapshot_path, doc_table.stamp())
+        if snapshot is not None and len(snapshot.records("catalog")) == len(vector_store):
+            search_index.attach(snapshot, "index")
+            trigram_index.attach(snapshot, "trigrams")
+            catalog.attach(snapshot)
+        else:
+            self.load_database()
+        
+        # First run with a folder manifest: take kb_folder as it is now, so only later changes count as edits
+        if not os.path.exists(folder_manifest.path):
+            folder_manifest.commit(folder_manifest.diff(list_documents(kb_folder)))
         
+        # Setup GUI components
+        self.setup_menu()
+        self.setup_layout()
+        self.setup_context_menu()
+        self.load_documents()
+
+    def load_database(self):
+        """Check the database, rebuild the indexes if they are out of sync with it, and write a fresh snapshot."""
         # Check database integrity on startup
         try:
             doc_table.all()
@@ -142,11 +251,21 @@ class KnowledgeBaseApp:
                 self.status_var.set("Database error; some features may not work")
             logging.error(f"Database error on startup: {str(e)}")
         
-        # Setup GUI components
-        self.setup_menu()
-        self.setup_layout()
-        self.setup_context_menu()
-        self.load_documents()
+        # Rebuild the BM25 index if it is missing or out of sync with the database; the catalog and trigram index live in memory only
+        try:
+            upgrade_records()
+            docs = doc_table.all()
+            catalog.load(docs)
+            if os.path.exists(search_index.path):
+                search_index.load()
+            if len(search_index) != len(docs) or len(vector_store) != len(docs):
+                rebuild_search_index()
+            else:
+                for doc in docs:
+                    trigram_index.add(doc.doc_id, doc["name"], load_content(doc), *doc.get("tags", []))
+                save_index_snapshot()
+        except Exception as e:
+            logging.error(f"Search index rebuild error: {str(e)}")
 
     def setup_menu(self):
         """Configure the menu bar with File and Help options."""
@@ -154,8 +273,10 @@ class KnowledgeBaseApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Add KB Document", command=self.add_document, accelerator="Ctrl+O")
         file_menu.add_command(label="Scan Document Folder", command=self.scan_folder)
+        file_menu.add_checkbutton(label="Watch Document Folder", variable=self.watch_var, command=self.toggle_watch)
         file_menu.add_command(label="Associate Image", command=self.associate_image)
         file_menu.add_command(label="Export Database", command=self.export_database)
+        file_menu.add_command(label="Export Changes Since Last Export", command=lambda: self.export_database(incremental=True))
         file_menu.add_command(label="Import Database", command=self.import_database)
         file_menu.add_command(label="View All Documents", command=self.show_all_documents)
         file_menu.add_command(label="Toggle High Contrast", command=self.toggle_high_contrast)
@@ -238,6 +359,13 @@ class KnowledgeBaseApp:
         self.case_sensitive_check = ttk.Checkbutton(self.bottom_frame, text="Case Sensitive", variable=self.case_sensitive_var)
         self.case_sensitive_check.pack(side=tk.LEFT, padx=5)
 
+        self.rank_mode_combobox = ttk.Combobox(self.bottom_frame, textvariable=self.rank_mode_var, values=["BM25", "Fuzzy"], width=7, state="readonly")
+        self.rank_mode_combobox.pack(side=tk.LEFT, padx=5)
+        self.rank_mode_combobox.accessible_name = "Search ranking mode"
+
+        self.fuzzy_fallback_check = ttk.Checkbutton(self.bottom_frame, text="Fuzzy Fallback", variable=self.fuzzy_fallback_var)
+        self.fuzzy_fallback_check.pack(side=tk.LEFT, padx=5)
+
         ttk.Button(self.bottom_frame, text="+", command=self.increase_font_size).pack(side=tk.LEFT, padx=2)
         ttk.Button(self.bottom_frame, text="-", command=self.decrease_font_size).pack(side=tk.LEFT, padx=2)
 
@@ -260,6 +388,7 @@ class KnowledgeBaseApp:
     def setup_context_menu(self):
         """Setup right-click context menu for document listbox."""
         self.context_menu = tk.Menu(self.root, tearoff=0)
+        self.context_menu.add_command(label="Find Similar", command=self.find_similar_documents)
         self.context_menu.add_command(label="Delete", command=self.delete_document)
         self.doc_listbox.bind("<Button-3>", self.show_context_menu)
 
@@ -273,18 +402,21 @@ class KnowledgeBaseApp:
             try:
                 for path in file_paths:
                     name = os.path.basename(path)
-                    if is_duplicate(name):
+                    if is_duplicate(name, path):
                         self.status_var.set(f"Skipped duplicate: {name}")
                         continue
-                    text, images = extract_text(path)
-                    tags, vector = generate_tags(text)
+                    text, images = extract_text(path, img_folder=img_folder)
                     # Use simpledialog.askstring to prompt for category
                     category = simpledialog.askstring("Category", f"Enter category for {name}:", parent=self.root) or "Uncategorized"
-                    doc_table.insert({"name": name, "content": text, "tags": tags, "images": images, "created": str(datetime.now()), "category": category, "vector": vector})
-                    dest = os.path.join(kb_folder, name)
-                    if not os.path.exists(dest):
-                        with open(dest, "wb") as f_out, open(path, "rb") as f_in:
-                            f_out.write(f_in.read())
+                    with write_lock:
+                        if is_duplicate(name, path):  # Added by the folder watcher while the dialog was open
+                            self.status_var.set(f"Skipped duplicate: {name}")
+                            continue
+                        add_record(name, text, images, category)
+                        copy_to_kb_folder(path, name)
+                        save_search_index()
+                        vector_store.save()
+                        result_cache.bump_generation()
                     self.status_var.set(f"Added {name} with {len(images)} images")
                 self.root.after(0, self.load_documents)
             except Exception as e:
@@ -299,19 +431,31 @@ class KnowledgeBaseApp:
         """Scan a folder to import documents, extracting text, images, and tags."""
         def process_folder():
             try:
-                for file in os.listdir(folder):
-                    if file.lower().endswith((".txt", ".pdf", ".docx")):
-                        full_path = os.path.join(folder, file)
-                        if not is_duplicate(file):
-                            text, images = extract_text(full_path)
-                            tags, vector = generate_tags(text)
-                            # Use simpledialog.askstring to prompt for category
-                            category = simpledialog.askstring("Category", f"Enter category for {file}:", parent=self.root) or "Uncategorized"
-                            doc_table.insert({"name": file, "content": text, "tags": tags, "images": images, "created": str(datetime.now()), "category": category, "vector": vector})
-                            dest = os.path.join(kb_folder, file)
-                            if not os.path.exists(dest):
-                                with open(dest, "wb") as f_out, open(full_path, "rb") as f_in:
-                                    f_out.write(f_in.read())
+                files = [file for file in os.listdir(folder) if file.lower().endswith((".txt", ".pdf", ".docx"))]
+                # Skip names already in the database and content already in kb_folder, including copies within this folder
+                seen = set()
+                fresh = []
+                for file in files:
+                    digest = file_sha256(os.path.join(folder, file))
+                    if file not in catalog and digest not in seen and folder_manifest.find(digest) is None:
+                        fresh.append(file)
+                    seen.add(digest)
+                files = fresh
+                paths = [os.path.join(folder, file) for file in files]
+                # Extraction runs in worker processes; this thread is the only writer and commits in folder order
+                for file, full_path, (text, images) in zip(files, paths, extract_texts(paths)):
+                    self.status_var.set(f"Indexing {file}")
+                    # Use simpledialog.askstring to prompt for category
+                    category = simpledialog.askstring("Category", f"Enter category for {file}:", parent=self.root) or "Uncategorized"
+                    with write_lock:
+                        if is_duplicate(file, full_path):  # Added by the folder watcher during the scan
+                            continue
+                        add_record(file, text, images, category)
+                        copy_to_kb_folder(full_path, file)
+                with write_lock:
+                    save_search_index()
+                    vector_store.save()
+                    result_cache.bump_generation()
                 self.root.after(0, self.load_documents)
                 self.root.after(0, lambda: self.status_var.set("Folder scan completed"))
             except Exception as e:
@@ -322,21 +466,56 @@ class KnowledgeBaseApp:
         if folder:
             threading.Thread(target=process_folder, daemon=True).start()
 
+    def toggle_watch(self):
+        """Start or stop polling kb_folder for added, edited, and deleted files."""
+        if self.watch_var.get():
+            self.folder_watcher.start()
+            self.status_var.set(f"Watching {kb_folder} for changes")
+        else:
+            self.folder_watcher.stop()
+            self.status_var.set(f"Stopped watching {kb_folder}")
+
+    def sync_document_folder(self):
+        """Apply kb_folder changes since the last sync: re-index edited files, drop deleted ones, add new ones as Uncategorized.
+
+        Runs on the watcher thread; write_lock is held from the diff to the commit, so no file recorded by another
+        writer in between is overwritten.
+        """
+        with write_lock:
+            delta = folder_manifest.diff(list_documents(kb_folder))
+            if not delta:
+                return None
+            for path in delta.removed:
+                remove_document(os.path.basename(path), delete_file=False)
+            # New files already in the database were copied in by Add KB Document or Scan Document Folder
+            paths = [path for path in delta.added if os.path.basename(path) not in catalog] + delta.changed
+            for path, (text, images) in zip(paths, extract_texts(paths)):
+                name = os.path.basename(path)
+                entry = catalog.get(name)
+                category = entry["category"] if entry else "Uncategorized"
+                # An edited file replaces its old record but keeps its creation time and the images associated with it by name
+                remove_document(name, delete_file=False, delete_images=False)
+                add_record(name, text, images, category, created=entry["created"] if entry else None)
+                catalog.refresh_size(name)
+            save_search_index()
+            vector_store.save()
+            result_cache.bump_generation()
+            image_store.collect()
+            folder_manifest.commit(delta)
+            return delta
+
+    def folder_synced(self, delta):
+        """Show the result of a background folder sync; runs on the GUI thread."""
+        self.load_documents()
+        self.status_var.set(f"Document folder synced: {delta.summary()}")
+
     def load_documents(self):
         """Load and display documents in the listbox, sorted by name, date, or category."""
         self.doc_listbox.delete(0, tk.END)
-        docs = doc_table.all()
-        sort_key = self.sort_var.get()
-        if sort_key == "Date":
-            docs.sort(key=lambda x: x.get("created", ""), reverse=True)
-        elif sort_key == "Category":
-            docs.sort(key=lambda x: x.get("category", "Uncategorized"))
-        else:
-            docs.sort(key=lambda x: x["name"])
-        for doc in docs:
-            self.doc_listbox.insert(tk.END, doc["name"])
-        tags = ["All"] + sorted(set(tag for doc in doc_table.all() for tag in doc.get("tags", [])))
-        categories = ["All"] + sorted(set(doc.get("category", "Uncategorized") for doc in doc_table.all()))
+        for name in catalog.names(self.sort_var.get()):
+            self.doc_listbox.insert(tk.END, name)
+        tags = ["All"] + catalog.tags()
+        categories = ["All"] + catalog.categories()
         self.tag_filter.config(values=tags)
         self.category_filter.config(values=categories)
 
@@ -346,21 +525,22 @@ class KnowledgeBaseApp:
         if not selection:
             return
         name = self.doc_listbox.get(selection[0])
-        doc = next((d for d in doc_table.all() if d["name"] == name), None)
+        entry = catalog.get(name)
+        doc = doc_table.get(doc_id=entry["doc_id"]) if entry else None
         if doc:
             self.text_preview.delete("1.0", tk.END)
-            self.text_preview.insert(tk.END, doc["content"])
+            self.text_preview.insert(tk.END, load_content(doc))
             self.show_image(name)
-            self.status_var.set(f"Tags: {', '.join(doc['tags'])}, Category: {doc.get('category', 'Uncategorized')}, Size: {os.path.getsize(os.path.join(kb_folder, name))} bytes")
+            self.status_var.set(f"Tags: {', '.join(entry['tags'])}, Category: {entry['category']}, Size: {entry['size']} bytes")
 
     def show_image(self, doc_name):
         """Initialize image display for a document, prioritizing embedded images."""
         self.image_canvas.delete("all")
         self.current_images = []
         self.current_image_index = 0
-        doc = next((d for d in doc_table.all() if d["name"] == doc_name), None)
-        if doc and doc.get("images"):
-            self.current_images = doc["images"]
+        entry = catalog.get(doc_name)
+        if entry and entry["images"]:
+            self.current_images = entry["images"]
         else:
             base = os.path.splitext(doc_name)[0]
             for ext in [".jpg", ".jpeg", ".png"]:
@@ -453,49 +633,99 @@ class KnowledgeBaseApp:
         end_date = self.end_date_var.get().strip()
         if not query:
             return
-        results = []
-        for doc in doc_table.all():
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+        except ValueError:
+            self.status_var.set("Invalid start date format")
+            return
+        try:
+            end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
+        except ValueError:
+            self.status_var.set("Invalid end date format")
+            return
+
+        def matches_filters(doc):
+            """Apply the tag, category, and date filters to a document record."""
             if tag_filter != "All" and tag_filter not in doc.get("tags", []):
-                continue
+                return False
             if category_filter != "All" and doc.get("category", "Uncategorized") != category_filter:
-                continue
-            if start_date:
-                try:
-                    if datetime.strptime(doc["created"], "%Y-%m-%d %H:%M:%S.%f") < datetime.strptime(start_date, "%Y-%m-%d"):
+                return False
+            if start or end:
+                created = datetime.strptime(doc["created"], "%Y-%m-%d %H:%M:%S.%f")
+                if (start and created < start) or (end and created > end):
+                    return False
+            return True
+
+        filters = {"tag": tag_filter, "category": category_filter, "case_sensitive": case_sensitive, "start_date": start_date,
+                   "end_date": end_date, "rank_mode": self.rank_mode_var.get(), "fuzzy_fallback": self.fuzzy_fallback_var.get()}
+        cached = result_cache.get(query, filters)
+        if cached is not None:
+            docs = {doc.doc_id: doc for doc in doc_table.get(doc_ids=[doc_id for _, doc_id in cached])} if cached else {}
+            results = [(score, docs[doc_id]) for score, doc_id in cached if doc_id in docs]
+        else:
+            results = []
+            if self.rank_mode_var.get() == "BM25":
+                # BM25 only touches documents in the query terms' posting lists
+                scores = search_index.bm25_scores(tokenize(query))
+                if scores:
+                    for doc in doc_table.get(doc_ids=list(scores)):
+                        if matches_filters(doc):
+                            results.append((scores[doc.doc_id], doc))
+            if not results and (self.rank_mode_var.get() == "Fuzzy" or self.fuzzy_fallback_var.get()):
+                query_cmp = query if case_sensitive else query.lower()
+                # Documents sharing trigrams with the query are scored; the rest only if the character bound allows a match
+                shortlist = trigram_index.candidates(query) or ()
+                for doc in doc_table.all():
+                    if not matches_filters(doc):
                         continue
-                except ValueError:
-                    self.status_var.set("Invalid start date format")
-                    return
-            if end_date:
-                try:
-                    if datetime.strptime(doc["created"], "%Y-%m-%d %H:%M:%S.%f") > datetime.strptime(end_date, "%Y-%m-%d"):
+                    name = doc["name"] if case_sensitive else doc["name"].lower()
+                    content = load_content(doc)
+                    if not case_sensitive:
+                        content = content.lower()
+                    tags = [tag if case_sensitive else tag.lower() for tag in doc.get("tags", [])]
+                    if doc.doc_id not in shortlist and not may_score_above(query_cmp, [name, content, *tags]):
                         continue
-                except ValueError:
-                    self.status_var.set("Invalid end date format")
-                    return
-            name = doc["name"] if case_sensitive else doc["name"].lower()
-            content = doc["content"] if case_sensitive else doc["content"].lower()
-            query_cmp = query if case_sensitive else query.lower()
-            score = max(
-                fuzz.partial_ratio(query_cmp, name),
-                fuzz.partial_ratio(query_cmp, content),
-                max((fuzz.partial_ratio(query_cmp, tag if case_sensitive else tag.lower()) for tag in doc.get("tags", [])), default=0)
-            )
-            if score > 50:
-                results.append((score, doc))
-        results.sort(key=lambda x: x[0], reverse=True)
+                    score = max(
+                        fuzz.partial_ratio(query_cmp, name),
+                        fuzz.partial_ratio(query_cmp, content),
+                        max((fuzz.partial_ratio(query_cmp, tag) for tag in tags), default=0)
+                    )
+                    if score > 50:
+                        results.append((score, doc))
+            results.sort(key=lambda x: x[0], reverse=True)
+            result_cache.put(query, filters, [(score, doc.doc_id) for score, doc in results])
+        logging.info(result_cache.stats())
         self.doc_listbox.delete(0, tk.END)
         for _, doc in results:
             self.doc_listbox.insert(tk.END, doc["name"])
         if results:
             top_doc = results[0][1]
             self.text_preview.delete("1.0", tk.END)
-            self.text_preview.insert(tk.END, top_doc["content"])
+            self.text_preview.insert(tk.END, load_content(top_doc))
             highlight_text(self.text_preview, query, case_sensitive)
             self.show_image(top_doc["name"])
+            self.status_var.set(f"{len(results)} results | {result_cache.stats()}")
         else:
             self.status_var.set("No results found")
 
+    def find_similar_documents(self):
+        """List the documents most similar to the selected one by TF-IDF cosine similarity."""
+        selection = self.doc_listbox.curselection()
+        if not selection:
+            self.status_var.set("No document selected")
+            return
+        name = self.doc_listbox.get(selection[0])
+        entry = catalog.get(name)
+        if not entry:
+            return
+        names_by_id = {e["doc_id"]: n for n, e in list(catalog.entries.items())}
+        similar = [(names_by_id[doc_id], score) for doc_id, score in vector_store.similar(entry["doc_id"], 10) if doc_id in names_by_id]
+        self.doc_listbox.delete(0, tk.END)
+        self.doc_listbox.insert(tk.END, name)
+        for similar_name, _ in similar:
+            self.doc_listbox.insert(tk.END, similar_name)
+        self.status_var.set(f"{len(similar)} documents similar to {name}")
+
     def clear_search(self):
         """Clear search query, filters, and reset the document list."""
         self.search_var.set("")
@@ -511,59 +741,101 @@ class KnowledgeBaseApp:
     def delete_document(self):
         """Delete selected documents and their associated images."""
         selections = self.doc_listbox.curselection()
-        for index in selections[::-1]:
-            name = self.doc_listbox.get(index)
-            doc = next((d for d in doc_table.all() if d["name"] == name), None)
-            if doc:
+        failures = []
+        with write_lock:
+            for index in selections[::-1]:
+                name = self.doc_listbox.get(index)
                 try:
-                    doc_table.remove(Query().name == name)
-                    os.remove(os.path.join(kb_folder, name))
-                    for img_name in doc.get("images", []):
-                        img_path = os.path.join(img_folder, img_name)
-                        if os.path.exists(img_path):
-                            os.remove(img_path)
-                    base = os.path.splitext(name)[0]
-                    for ext in [".jpg", ".jpeg", ".png"]:
-                        img_path = os.path.join(img_folder, base + ext)
-                        if os.path.exists(img_path):
-                            os.remove(img_path)
+                    remove_document(name)
                 except Exception as e:
-                    messagebox.showerror("Error", f"Failed to delete {name}: {str(e)}")
+                    failures.append((name, str(e)))
                     logging.error(f"Delete document error: {str(e)}")
+            save_search_index()
+            vector_store.save()
+            result_cache.bump_generation()
+            image_store.collect()
+        for name, error in failures:
+            messagebox.showerror("Error", f"Failed to delete {name}: {error}")
         self.load_documents()
         self.status_var.set(f"Deleted {len(selections)} documents")
 
-    def export_database(self):
-        """Export the database to a JSON file."""
-        try:
-            export_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
-            if export_path:
-                with open(export_path, "w") as f:
-                    f.write(doc_table.storage.read())
-                self.status_var.set(f"Database exported to {export_path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to export database: {str(e)}")
-            logging.error(f"Export database error: {str(e)}")
+    def report_progress(self, label, done, total, message):
+        """Show snapshot progress in the status bar; safe to call from worker threads."""
+        count = f"{done}/{total}" if total else str(done)
+        self.root.after(0, lambda: self.status_var.set(f"{label} {count}: {message}"))
+
+    def export_database(self, incremental=False):
+        """Export documents, content, images, and files to a compressed snapshot in the background."""
+        def process_export():
+            try:
+                started = str(datetime.now())
+                state = load_snapshot_state(snapshot_state_path) if incremental else None
+                since = state["created"] if state else None
+                records = [dict(doc) for doc in doc_table.all()]
+                names = [record["name"] for record in records]
+                deleted = []
+                if since:
+                    deleted = sorted(set(state["names"]) - set(names))
+                    records = [record for record in records if record.get("created", "") > since]
+                manifest = export_snapshot(export_path, records, blob_store, img_folder, kb_folder, image_names=associated_images,
+                                           since=since, deleted=deleted, progress=lambda done, total, message: self.report_progress("Exporting", done, total, message))
+                save_snapshot_state(snapshot_state_path, started, names)
+                summary = f"Exported {manifest['records']} documents"
+                if since:
+                    summary += f" changed since {since} ({len(deleted)} deleted)"
+                self.root.after(0, lambda: self.status_var.set(f"{summary} to {export_path}"))
+            except Exception as e:
+                self.root.after(0, lambda error=str(e): messagebox.showerror("Error", f"Failed to export database: {error}"))
+                logging.error(f"Export database error: {str(e)}")
+
+        if incremental and load_snapshot_state(snapshot_state_path) is None:
+            messagebox.showinfo("Export", "No previous export found; exporting everything.")
+        export_path = filedialog.asksaveasfilename(defaultextension=".tar.gz", filetypes=[("KB Snapshots", "*.tar.gz *.tar.xz")])
+        if export_path:
+            threading.Thread(target=process_export, daemon=True).start()  # Large KBs export without freezing the GUI
 
     def import_database(self):
-        """Import a database from a JSON file."""
-        try:
-            import_path = filedialog.askopenfilename(filetypes=[("JSON Files", "*.json")])
-            if import_path:
-                doc_table.storage.write(open(import_path, "r").read())
-                self.load_documents()
-                self.status_var.set(f"Database imported from {import_path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to import database: {str(e)}")
-            logging.error(f"Import database error: {str(e)}")
+        """Import a snapshot (full or incremental, verified by checksum) or a legacy JSON export in the background."""
+        def process_import():
+            try:
+                with write_lock:
+                    if import_path.lower().endswith(".json"):
+                        with open(import_path, "r") as f:
+                            doc_table.load(json.load(f))
+                        summary = f"Database imported from {import_path}"
+                    else:
+                        manifest, records = import_snapshot(import_path, blob_store, img_folder, kb_folder,
+                                                            progress=lambda done, total, message: self.report_progress("Importing", done, total, message))
+                        with doc_table.buffered():
+                            if manifest["kind"] == "full":
+                                doc_table.truncate()
+                            else:
+                                # Incremental snapshots replace changed documents by name and drop deleted ones
+                                for name in manifest["deleted"] + [record["name"] for record in records]:
+                                    doc_table.remove_key(name)
+                            doc_table.insert_multiple(records)
+                        summary = f"Imported {manifest['kind']} snapshot with {len(records)} documents from {import_path}"
+                    upgrade_records()
+                    catalog.load(doc_table.all())
+                    image_store.reset()
+                    rebuild_search_index()
+                    result_cache.bump_generation()
+                self.root.after(0, self.load_documents)
+                self.root.after(0, lambda: self.status_var.set(summary))
+            except Exception as e:
+                self.root.after(0, lambda error=str(e): messagebox.showerror("Error", f"Failed to import database: {error}"))
+                logging.error(f"Import database error: {str(e)}")
+
+        import_path = filedialog.askopenfilename(filetypes=[("KB Snapshots", "*.tar.gz *.tar.xz"), ("JSON Files", "*.json")])
+        if import_path:
+            threading.Thread(target=process_import, daemon=True).start()
 
     def show_all_documents(self):
         """Display a list of all document names in a dialog."""
-        all_docs = doc_table.all()
-        if not all_docs:
+        if not len(catalog):
             messagebox.showinfo("Documents", "No documents in the database.")
             return
-        doc_names = "\n".join(doc["name"] for doc in all_docs)
+        doc_names = "\n".join(catalog.names())
         messagebox.showinfo("All Documents", doc_names)
 
     def toggle_high_contrast(self):
@@ -599,9 +871,9 @@ class KnowledgeBaseApp:
         index = self.doc_listbox.nearest(event.y)
         if index >= 0:
             name = self.doc_listbox.get(index)
-            doc = next((d for d in doc_table.all() if d["name"] == name), None)
-            if doc:
-                tooltip_text = f"Name: {doc['name']}\nTags: {', '.join(doc['tags'])}\nCategory: {doc.get('category', 'Uncategorized')}\nCreated: {doc['created']}"
+            entry = catalog.get(name)
+            if entry:
+                tooltip_text = f"Name: {name}\nTags: {', '.join(entry['tags'])}\nCategory: {entry['category']}\nCreated: {entry['created']}"
                 if self.tooltip:
                     self.tooltip.destroy()
                 self.tooltip = tk.Toplevel(self.root)
@@ -621,13 +893,15 @@ class KnowledgeBaseApp:
         help_text = (
             "Retail Support Demo\n\n"
             "- Add documents: File > Add KB Document (Ctrl+O)\n"
-            "- Scan folder: File > Scan Document Folder\n"
+            "- Scan folder: File > Scan Document Folder (files already in the knowledge base by name or content are skipped)\n"
+            "- Watch folder: File > Watch Document Folder re-indexes files edited, added, or deleted in kb_documents\n"
             "- Associate image: File > Associate Image\n"
-            "- Export/Import database: File > Export/Import Database\n"
+            "- Export/Import database: File > Export/Import Database (compressed snapshots with images and files; export only changes since the last export to sync another site)\n"
             "- Search: Enter query in search bar (Ctrl+F), use tag/category filters\n"
+            "- Ranking: BM25 ranks by keyword relevance; enable Fuzzy Fallback to catch typos when BM25 finds nothing\n"
             "- Filter by date: Enter dates in YYYY-MM-DD format\n"
             "- Sort documents: Use sort dropdown (Name, Date, Category)\n"
-            "- Delete documents: Right-click on document in list\n"
+            "- Delete documents or find similar ones: Right-click on document in list\n"
             "- Navigate images: Use Prev/Next buttons, zoom with mouse wheel, pan with drag\n"
             "- Adjust text: Toggle word wrap, change font size with +/- buttons"
         )
@@ -0,0 +1,272 @@
+# Read-only binary index snapshots for fast startup
+# A snapshot is one file: a JSON header naming each array's dtype, length and offset, followed by the arrays
+# themselves (string tables, CSR postings, id lists). Opening it memory-maps the file and wraps the arrays
+# without parsing them, so startup costs the same for ten documents or ten thousand, and every process
+# that maps the same file shares its pages. Snapshots are rewritten whole (temp file + os.replace) after
+# ingestion and carry a stamp of the data they were built from; a stale or unreadable snapshot is ignored.
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Mapping, MutableMapping, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"KBSNAP01"
+ALIGNMENT = 16
+
+
+class StringTable(Sequence):
+    """Strings stored as one UTF-8 blob plus offsets; find() binary-searches tables written in sorted order."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.raw(i).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.raw(i).decode("utf-8")
+
+    def find(self, value):
+        """Index of value in a sorted table, or -1; UTF-8 byte order matches Python's str order."""
+        target = value.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.raw(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self.raw(lo) == target else -1
+
+
+class MappedTexts(Mapping):
+    """Read-only {int id: value} over a sorted id array and an aligned string table or value array."""
+
+    def __init__(self, ids, values):
+        self.ids = ids
+        self.values = values
+
+    def position(self, key):
+        i = int(np.searchsorted(self.ids, key)) if isinstance(key, (int, np.integer)) else len(self.ids)
+        return i if i < len(self.ids) and self.ids[i] == key else -1
+
+    def __contains__(self, key):
+        return self.position(key) >= 0
+
+    def __getitem__(self, key):
+        i = self.position(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.values[i]
+
+    def __iter__(self):
+        return (int(doc_id) for doc_id in self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class MappedRecords(Mapping):
+    """Read-only {str key: record} over a sorted key table and aligned JSON records, decoded on access."""
+
+    def __init__(self, keys, values):
+        self.keys_table = keys
+        self.values = values
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.keys_table.find(key) >= 0
+
+    def __getitem__(self, key):
+        i = self.keys_table.find(key) if isinstance(key, str) else -1
+        if i < 0:
+            raise KeyError(key)
+        return json.loads(self.values[i])
+
+    def __iter__(self):
+        return iter(self.keys_table)
+
+    def __len__(self):
+        return len(self.keys_table)
+
+
+class OverlayMapping(MutableMapping):
+    """Writable view over a read-only mapping: changes and removals are kept in memory on top of it."""
+
+    def __init__(self, base):
+        self.base = base
+        self.changed = {}
+        self.removed = set()  # Base keys deleted through the overlay
+        self.decoded = {}  # Base records already decoded, so in-place edits to them stick
+
+    @property
+    def modified(self):
+        return bool(self.changed or self.removed)
+
+    def __contains__(self, key):
+        return key in self.changed or (key not in self.removed and key in self.base)
+
+    def __getitem__(self, key):
+        if key in self.changed:
+            return self.changed[key]
+        if key in self.removed:
+            raise KeyError(key)
+        if key in self.decoded:
+            return self.decoded[key]
+        value = self.base[key]
+        if isinstance(value, (dict, list)):
+            self.decoded[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.changed[key] = value
+        self.removed.discard(key)
+        self.decoded.pop(key, None)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.changed.pop(key, None)
+        self.decoded.pop(key, None)
+        if key in self.base:
+            self.removed.add(key)
+
+    def __iter__(self):
+        for key in self.base:
+            if key not in self.removed and key not in self.changed:
+                yield key
+        yield from list(self.changed)
+
+    def __len__(self):
+        return len(self.base) - len(self.removed) + sum(1 for key in self.changed if key not in self.base)
+
+
+class SnapshotBuilder:
+    """Collect named arrays for a snapshot, then write them to one file."""
+
+    def __init__(self):
+        self.arrays = {}
+        self.meta = {}
+
+    def add_array(self, name, values, dtype):
+        self.arrays[name] = np.ascontiguousarray(np.asarray(values, dtype=dtype))
+
+    def add_strings(self, name, strings):
+        encoded = [s.encode("utf-8") for s in strings]
+        self.add_array(f"{name}.offsets", np.concatenate([[0], np.cumsum([len(b) for b in encoded])]), np.int64)
+        self.add_array(f"{name}.blob", np.frombuffer(b"".join(encoded), dtype=np.uint8), np.uint8)
+
+    def add_lists(self, name, lists, dtype=np.int64):
+        """Store a list of id lists as CSR: name.offsets plus the flattened name.values."""
+        self.add_array(f"{name}.offsets", np.concatenate([[0], np.cumsum([len(ids) for ids in lists])]), np.int64)
+        self.add_array(f"{name}.values", [value for ids in lists for value in ids], dtype)
+
+    def add_texts(self, name, texts):
+        """Store {int id: str} for MappedTexts."""
+        ids = sorted(texts)
+        self.add_array(f"{name}.ids", ids, np.int64)
+        self.add_strings(f"{name}.values", [texts[doc_id] for doc_id in ids])
+
+    def add_values(self, name, values, dtype=np.int64):
+        """Store {int id: number} for MappedTexts."""
+        ids = sorted(values)
+        self.add_array(f"{name}.ids", ids, np.int64)
+        self.add_array(f"{name}.values", [values[doc_id] for doc_id in ids], dtype)
+
+    def add_records(self, name, records):
+        """Store {str key: JSON-able record} for MappedRecords."""
+        keys = sorted(records)
+        self.add_strings(f"{name}.keys", keys)
+        self.add_strings(f"{name}.values", [json.dumps(records[key]) for key in keys])
+
+    def write(self, path, stamp):
+        header = {"stamp": stamp, "meta": self.meta, "arrays": {}}
+        offset = 0
+        for name, array in self.arrays.items():
+            header["arrays"][name] = [array.dtype.str, len(array), offset]
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header_bytes = json.dumps(header).encode("utf-8")
+        start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+            for name, array in self.arrays.items():
+                f.seek(start + header["arrays"][name][2])
+                f.write(array.tobytes())
+            f.truncate(start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)  # Processes that mapped the old file keep reading it undisturbed
+        logger.info(f"Wrote index snapshot {path} ({start + offset} bytes)")
+
+
+class IndexSnapshot:
+    """A memory-mapped snapshot; arrays are NumPy views onto the shared mapping."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapping[:len(MAGIC)] != MAGIC:
+            raise ValueError("not an index snapshot")
+        (header_length,) = struct.unpack_from("<Q", self.mapping, len(MAGIC))
+        header_end = len(MAGIC) + 8 + header_length
+        header = json.loads(self.mapping[len(MAGIC) + 8:header_end])
+        self.start = -(-header_end // ALIGNMENT) * ALIGNMENT
+        self.stamp = header["stamp"]
+        self.meta = header["meta"]
+        self.layout = header["arrays"]
+
+    @classmethod
+    def open(cls, path, stamp):
+        """Map the snapshot at path if it exists and was built from data matching stamp, else return None."""
+        try:
+            snapshot = cls(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable index snapshot {path}: {str(e)}")
+            return None
+        if snapshot.stamp != json.loads(json.dumps(stamp)):
+            logger.info(f"Index snapshot {path} is out of date")
+            return None
+        return snapshot
+
+    def __contains__(self, name):
+        return f"{name}.offsets" in self.layout or f"{name}.ids" in self.layout or name in self.layout
+
+    def array(self, name):
+        dtype, count, offset = self.layout[name]
+        return np.frombuffer(self.mapping, dtype=np.dtype(dtype), count=count, offset=self.start + offset)
+
+    def strings(self, name):
+        return StringTable(self.array(f"{name}.blob"), self.array(f"{name}.offsets"))
+
+    def lists(self, name):
+        """(offsets, values) of a CSR list; row i is values[offsets[i]:offsets[i + 1]]."""
+        return self.array(f"{name}.offsets"), self.array(f"{name}.values")
+
+    def texts(self, name):
+        return MappedTexts(self.array(f"{name}.ids"), self.strings(f"{name}.values"))
+
+    def values(self, name):
+        return MappedTexts(self.array(f"{name}.ids"), self.array(f"{name}.values"))
+
+    def records(self, name):
+        return MappedRecords(self.strings(f"{name}.keys"), self.strings(f"{name}.values"))
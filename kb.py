@@ -0,0 +1,12 @@
+# Command line entry point for the headless knowledge base engine, e.g.
+#   python kb.py index docs/
+#   python kb.py sync docs/     # or: python kb.py watch docs/ --interval 5
+#   python kb.py search --json "printer offline"
+#   python kb.py migrate
+#   python kb.py serve --port 8765 && python kb.py --remote http://127.0.0.1:8765 search "printer offline"
+import sys
+
+from kb_engine import main
+
+if __name__ == "__main__":
+    sys.exit(main())
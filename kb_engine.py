@@ -0,0 +1,1058 @@
+# Headless knowledge base engine: document extraction, tagging, indexing and search without any GUI
+# The Qt and Tk apps are thin clients of this module; it can also be scripted or run from the command line:
+#   python kb.py index docs/
+#   python kb.py search --json "printer offline"
+#   python kb.py watch docs/                      # keep the index in step with a folder
+# Searches may run on worker threads while another thread ingests, so the public methods share a
+# re-entrant read-write lock: rankings read concurrently, indexing, deletes and synonym changes write.
+import argparse
+import functools
+import heapq
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from operator import itemgetter
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import nltk
+from docx import Document
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize, sent_tokenize
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from blob_store import file_sha256
+from doc_manifest import FolderWatcher, SourceManifest
+from fuzzy_scoring import best_scores
+from image_store import ImageStore
+from index_snapshot import IndexSnapshot, OverlayMapping, SnapshotBuilder
+from kb_storage import migrate_known_databases, open_store
+from result_cache import QueryCache
+from search_index import InvertedIndex, line_offsets, required_literals, tokenize
+from synonym_map import SynonymMap, highlight_pattern
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+SECTION_PARAGRAPHS = 200  # DOCX/TXT paragraphs per extraction section; PDFs are sectioned by page
+STREAM_BYTES = 32 << 20  # Files larger than this are indexed section by section instead of whole
+FALLBACK_PARAGRAPHS = 5000  # Paragraphs scored when no term matches a query (see InvertedIndex.related)
+SCHEMA_VERSION = 2  # 1: paragraphs repeat their document's fields; 2: paragraphs point at a documents record
+
+
+class ReadWriteLock:
+    """Many readers or one writer; a waiting writer blocks new readers so ingestion is not starved.
+
+    A thread already holding the lock may take it again (a write holder may also read), so locked methods can
+    call one another; asking to write while only reading raises RuntimeError instead of deadlocking.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.write_held = False
+        self.writers_waiting = 0
+        self.held = threading.local()  # This thread's hold depth and whether it is the writer
+
+    def depth(self):
+        return getattr(self.held, "depth", 0)
+
+    def acquire_read(self):
+        if self.depth():
+            self.held.depth += 1
+            return
+        with self.condition:
+            while self.write_held or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        self.held.depth, self.held.writer = 1, False
+
+    def release_read(self):
+        self.held.depth -= 1
+        if self.held.depth:
+            return
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        if self.depth():
+            if not self.held.writer:
+                raise RuntimeError("Cannot take the write lock while holding the read lock")
+            self.held.depth += 1
+            return
+        with self.condition:
+            self.writers_waiting += 1
+            while self.write_held or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.write_held = True
+        self.held.depth, self.held.writer = 1, True
+
+    def release_write(self):
+        self.held.depth -= 1
+        if self.held.depth:
+            return
+        self.held.writer = False
+        with self.condition:
+            self.write_held = False
+            self.condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def reads(method):
+    """Run an engine method under its read lock."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.reading():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def writes(method):
+    """Run an engine method under its write lock."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.writing():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def ensure_nltk_data():
+    """Download the NLTK tokenizer and stopword data on first use."""
+    try:
+        nltk.data.find('tokenizers/punkt')
+        nltk.data.find('corpora/stopwords')
+    except LookupError:
+        nltk.download('punkt', quiet=True)
+        nltk.download('stopwords', quiet=True)
+
+
+# Document-level helpers used by the Tk knowledge base apps
+def extract_text(file_path, max_images=5, img_folder="images"):
+    """Extract text and up to max_images distinct embedded images from TXT, PDF, or DOCX files.
+
+    Images are saved by content hash (see ImageStore), so an image repeated across pages or documents is one file.
+    """
+    ext = file_path.lower()
+    images = []  # List to store extracted image filenames
+    text = ""  # Extracted text content
+    image_store = ImageStore(img_folder)
+    try:
+        if ext.endswith(".txt"):
+            # Read plain text files
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        elif ext.endswith(".docx"):
+            # Extract text and images from DOCX files
+            doc = Document(file_path)
+            text = "\n".join([p.text for p in doc.paragraphs])
+            for rel in doc.part.rels.values():
+                if "image" in rel.reltype and len(images) < max_images:
+                    img_name = image_store.put(rel.target_part.blob, os.path.splitext(rel.target_ref)[1] or "png")
+                    if img_name not in images:
+                        images.append(img_name)
+        elif ext.endswith(".pdf"):
+            # Extract text and images from PDF files
+            doc = fitz.open(file_path)
+            text = "\n".join([page.get_text() for page in doc])
+            xref_names = {}  # xref -> stored image name; a logo on every page is extracted once
+            for page in doc:
+                for img in page.get_images(full=True):
+                    if len(images) >= max_images:
+                        break
+                    xref = img[0]
+                    if xref not in xref_names:
+                        base_image = doc.extract_image(xref)
+                        xref_names[xref] = image_store.put(base_image["image"], base_image.get("ext", "png")) if base_image else None
+                    img_name = xref_names[xref]
+                    if img_name and img_name not in images:
+                        images.append(img_name)
+    except Exception as e:
+        logger.error(f"Error extracting {file_path}: {str(e)}")
+    return text, images
+
+
+def generate_tags(text, top_n=5):
+    """Generate top_n tags from text using TF-IDF."""
+    vectorizer = TfidfVectorizer(stop_words="english", max_features=50)
+    try:
+        X = vectorizer.fit_transform([text])
+        scores = X.toarray()[0]
+        words = vectorizer.get_feature_names_out()
+        top_indices = scores.argsort()[::-1][:top_n]
+        return [words[i] for i in top_indices if scores[i] > 0]
+    except:
+        return []
+
+
+# Paragraph-level extraction for KnowledgeBaseEngine. These are module-level so ingestion worker processes
+# can run them; they only read the source file and write its images, and return errors instead of reporting.
+def split_sentences(text) -> list:
+    """Split page text on blank lines, then into sentences longer than 20 characters."""
+    sentences = []
+    for para in text.split('\n\n'):
+        if para.strip():
+            sentences.extend(sentence.strip() for sentence in sent_tokenize(para.strip()) if len(sentence) > 20)
+    return sentences
+
+
+def iter_pdf_pages(doc):
+    """Yield (page number, text, sentences, image xrefs) per page of an open PyMuPDF document."""
+    for page_num, page in enumerate(doc):
+        text = page.get_text()
+        yield page_num, text, split_sentences(text), [img[0] for img in page.get_images()]
+
+
+def chunked(items, size):
+    """Yield lists of up to size items from an iterable, reading no further ahead than one list."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_pdf_sections(file_path, images_dir, errors):
+    """One section per PDF page: its 1-based page number, sentence paragraphs and images first seen on it."""
+    image_store = ImageStore(images_dir)
+    xref_paths = {}  # xref -> stored image path (None if unextractable); each xref is extracted once per document
+    try:
+        with fitz.open(file_path) as doc:
+            for page_num, _, sentences, xrefs in iter_pdf_pages(doc):
+                image_paths = []
+                for xref in xrefs:
+                    if xref not in xref_paths:
+                        image = doc.extract_image(xref)
+                        xref_paths[xref] = str(image_store.path(image_store.put(image["image"], image["ext"]))) if image else None
+                        if xref_paths[xref]:
+                            image_paths.append(xref_paths[xref])
+                yield {'page': page_num + 1, 'paragraphs': sentences, 'image_paths': image_paths}
+    except Exception as e:
+        errors.append(f"Error processing PDF: {str(e)}")
+
+
+def iter_docx_sections(file_path, images_dir, errors):
+    """DOCX paragraphs in sections of SECTION_PARAGRAPHS, from one parse; the images come with the first section."""
+    try:
+        doc = Document(file_path)
+        image_store = ImageStore(images_dir)
+        image_paths = []
+        for rel in doc.part.rels.values():
+            if "image" in rel.target_ref:
+                image_path = str(image_store.path(image_store.put(rel.target_part.blob, rel.target_ref.split('.')[-1])))
+                if image_path not in image_paths:
+                    image_paths.append(image_path)
+        paragraphs = (para.text.strip() for para in doc.paragraphs if para.text.strip())
+        for chunk in chunked(paragraphs, SECTION_PARAGRAPHS):
+            yield {'page': None, 'paragraphs': chunk, 'image_paths': image_paths}
+            image_paths = []
+        if image_paths:
+            yield {'page': None, 'paragraphs': [], 'image_paths': image_paths}
+    except Exception as e:
+        errors.append(f"Error processing DOCX: {str(e)}")
+
+
+def iter_txt_sections(file_path, errors):
+    """Non-blank lines of a text file in sections of SECTION_PARAGRAPHS, read as they are needed."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for chunk in chunked((line.strip() for line in f if line.strip()), SECTION_PARAGRAPHS):
+                yield {'page': None, 'paragraphs': chunk, 'image_paths': []}
+    except Exception as e:
+        errors.append(f"Error processing TXT: {str(e)}")
+
+
+def iter_document_sections(file_path, images_dir, errors):
+    """Yield {'page', 'paragraphs', 'image_paths'} sections of a document in order; errors collects messages.
+
+    Only one section is held at a time, so callers that write each section before asking for the next
+    extract documents of any length in bounded memory. page is the PDF page number, None for DOCX and TXT.
+    """
+    suffix = Path(file_path).suffix.lower()
+    if suffix == '.pdf':
+        return iter_pdf_sections(file_path, images_dir, errors)
+    if suffix == '.docx':
+        return iter_docx_sections(file_path, images_dir, errors)
+    return iter_txt_sections(file_path, errors)
+
+
+def document_record(file_path, image_paths, tag_counts) -> dict:
+    file_path = Path(file_path)
+    return {
+        'filename': file_path.name,
+        'filetype': {'.pdf': 'pdf', '.docx': 'docx'}.get(file_path.suffix.lower(), 'txt'),
+        'hash': file_sha256(file_path),
+        'image_paths': image_paths,
+        'tag_counts': tag_counts
+    }
+
+
+def paragraph_tags(text: str, filename: str, stop_words=None) -> list:
+    stop_words = stop_words if stop_words is not None else set(stopwords.words('english'))
+    words = word_tokenize(text.lower())
+    words = [word for word in words if word.isalpha() and word not in stop_words]
+    filename_tags = re.findall(r'\w+', filename.lower())
+    word_counts = Counter(words)
+    tags = [word for word, _ in word_counts.most_common(5)] + filename_tags
+    return list(set(tags))
+
+
+def extract_document(file_path, images_dir) -> dict:
+    """Extract, split and tag one file; the CPU-bound half of ingestion, safe to run in a worker process.
+
+    Returns the document record, its paragraphs with their page numbers and tags, and any extraction error
+    messages. Files over the engine's stream_bytes skip this and go through stream_document() instead.
+    """
+    filename = Path(file_path).name
+    errors = []
+    paragraphs, pages, image_paths = [], [], []
+    for section in iter_document_sections(file_path, images_dir, errors):
+        paragraphs.extend(section['paragraphs'])
+        pages.extend([section['page']] * len(section['paragraphs']))
+        image_paths.extend(path for path in section['image_paths'] if path not in image_paths)
+
+    stop_words = set(stopwords.words('english'))
+    tags = [paragraph_tags(para, filename, stop_words) for para in paragraphs]
+    document = document_record(file_path, image_paths, dict(Counter(tag for para_tags in tags for tag in para_tags)))
+    return {'document': document, 'paragraphs': paragraphs, 'pages': pages, 'tags': tags, 'errors': errors}
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+class KnowledgeBaseEngine:
+    """Paragraph-level knowledge base on a pluggable store, with inverted-index, fuzzy and regex search.
+
+    Documents (filename, filetype, file hash, image paths, tag counts) and their paragraphs (doc_id, text,
+    tags, and PDF page) live in separate tables; the documents table is small enough to keep in memory.
+    """
+
+    def __init__(self, data_dir="data", images_dir="images", docs_dir="docs", on_error=None, storage=None,
+                 ingest_workers=None, stream_bytes=STREAM_BYTES):
+        ensure_nltk_data()
+        self.DOCS_DIR = Path(docs_dir)
+        self.DATA_DIR = Path(data_dir)
+        self.IMAGES_DIR = Path(images_dir)
+        self.DATA_DIR.mkdir(exist_ok=True)
+        self.IMAGES_DIR.mkdir(exist_ok=True)
+        self.DB_PATH = self.DATA_DIR / "knowledge_db.json"
+        self.SYNONYMS_PATH = self.DATA_DIR / "synonyms.json"
+        self.INDEX_PATH = self.DATA_DIR / "search_index.json"
+        self.SNAPSHOT_PATH = self.DATA_DIR / "index_snapshot.bin"
+        self.MANIFEST_PATH = self.DATA_DIR / "source_manifest.json"
+        self.on_error = on_error  # Optional callback(message) so front-ends can surface extraction errors
+        self.ingest_workers = ingest_workers or os.cpu_count() or 1  # Extraction processes for index_paths
+        self.stream_bytes = stream_bytes  # Larger files are indexed a section at a time (see stream_document)
+        self.lock = ReadWriteLock()  # Searches on worker threads read while ingestion and deletes write
+
+        # TinyDB JSON or its migrated SQLite database; storage forces "tinydb", "journal" or "sqlite"
+        self.documents_table = open_store(self.DB_PATH, 'documents', backend=storage)
+        self.paragraphs_table = open_store(self.DB_PATH, 'paragraphs', backend=storage)
+        self.meta_table = open_store(self.DB_PATH, 'meta', backend=storage)
+
+        # The document catalog, postings, lowercased paragraph text (for the batch fuzzy scorer and regex
+        # prefilter) and each paragraph's document id and tags (for the search filters) come from the
+        # memory-mapped snapshot when its stamp matches the tables' stamps, which cost a stat or a counter read,
+        # so a warm start reads no table; otherwise they are loaded and the snapshot rebuilt. A snapshot is only
+        # written by a migrated store, so a matching one needs no migration either.
+        self.search_index = InvertedIndex(self.INDEX_PATH, load=False)
+        self.line_offsets = {}  # Paragraph id -> line start offsets, filled lazily by regex search
+        snapshot = IndexSnapshot.open(self.SNAPSHOT_PATH, self.snapshot_stamp())
+        if snapshot is not None and 'paragraph_tags' not in snapshot:
+            snapshot = None  # Written before the filter fields were kept in it
+        if snapshot is not None:
+            self.documents = {int(doc_id): doc for doc_id, doc in snapshot.records('documents').items()}
+        else:
+            self.migrate_schema()
+            self.documents = {doc.doc_id: dict(doc) for doc in self.documents_table.all()}  # Document id -> record
+        self.document_ids = {doc['filename']: doc_id for doc_id, doc in self.documents.items()}
+        if snapshot is not None:
+            self.search_index.attach(snapshot, 'index')
+            self.lower_texts = OverlayMapping(snapshot.texts('texts'))
+            self.paragraph_documents = OverlayMapping(snapshot.values('paragraph_documents'))
+            self.paragraph_tags = OverlayMapping(snapshot.texts('paragraph_tags'))
+        else:
+            if self.INDEX_PATH.exists():
+                self.search_index.load()
+            self.lower_texts = {}
+            self.paragraph_documents = {}  # Paragraph id -> document id
+            self.paragraph_tags = {}  # Paragraph id -> its tags joined by newlines
+            for doc in self.paragraphs_table.all():
+                self.track_paragraph(doc.doc_id, doc['text'], doc['doc_id'], doc.get('tags', []))
+            if len(self.search_index) != len(self.lower_texts):
+                self.rebuild_search_index()
+            else:
+                self.save_snapshot()
+
+        # Load synonyms
+        try:
+            with open(self.SYNONYMS_PATH, 'r') as f:
+                self.synonyms = json.load(f)
+        except FileNotFoundError:
+            self.synonyms = {}
+            with open(self.SYNONYMS_PATH, 'w') as f:
+                json.dump(self.synonyms, f, indent=4)
+        self.synonym_map = SynonymMap(self.synonyms)
+
+        self.result_cache = QueryCache()  # Ranked results keyed by query, filters and index generation
+        self.source_manifest = SourceManifest(self.MANIFEST_PATH)  # Size, mtime and hash of synced source files
+        # Extracted images are shared by content hash in a folder of the engine's own (the Tk app stores hashed
+        # images in IMAGES_DIR itself); the stored documents' image_paths are the references counted
+        self.image_store = ImageStore(self.IMAGES_DIR / "kb_engine", references=lambda: [
+            path for document in self.documents_table.all() for path in document['image_paths']])
+
+    def report_error(self, message: str):
+        logger.error(message)
+        if self.on_error:
+            self.on_error(message)
+
+    def migrate_schema(self) -> int:
+        """Split legacy paragraph rows, which repeated filename, filetype and image_paths, into documents.
+
+        Paragraph ids are kept, so the saved search index stays valid. The schema version is recorded in the
+        meta table afterwards, so a current store is not read at all. Returns the number of documents created.
+        """
+        if self.schema_version() >= SCHEMA_VERSION:
+            return 0
+        data = self.paragraphs_table.dump()
+        legacy = [record for record in data['paragraphs'].values() if 'doc_id' not in record]
+        if not legacy:
+            self.set_schema_version(SCHEMA_VERSION)
+            return 0
+        documents = {}  # Filename -> new document record, in first-seen order
+        for record in legacy:
+            filename = record.pop('filename', '')
+            document = documents.get(filename)
+            if document is None:
+                source = self.DOCS_DIR / filename
+                document = documents[filename] = {
+                    'filename': filename,
+                    'filetype': record.get('filetype'),
+                    'hash': file_sha256(source) if source.is_file() else None,
+                    'image_paths': record.get('image_paths', []),
+                    'tag_counts': {}
+                }
+            record.pop('filetype', None)
+            record.pop('image_paths', None)
+            for tag in record.get('tags', []):
+                document['tag_counts'][tag] = document['tag_counts'].get(tag, 0) + 1
+            record['doc_id'] = filename  # Replaced with the document id below
+        with self.documents_table.buffered():
+            doc_ids = dict(zip(documents, self.documents_table.insert_multiple(list(documents.values()))))
+        for record in legacy:
+            record['doc_id'] = doc_ids[record['doc_id']]
+        self.paragraphs_table.load(data)
+        self.set_schema_version(SCHEMA_VERSION)
+        logger.info(f"Migrated {len(legacy)} paragraphs into {len(documents)} documents")
+        return len(documents)
+
+    def schema_version(self) -> int:
+        records = self.meta_table.find('schema')
+        return records[0]['version'] if records else 1
+
+    def set_schema_version(self, version: int):
+        if self.meta_table.find('schema'):
+            self.meta_table.update_key('schema', {'version': version})
+        else:
+            self.meta_table.insert({'name': 'schema', 'version': version})
+
+    # Ingestion
+    @writes
+    def index_file(self, file_path) -> int:
+        """Extract, tag and index one document; returns the number of paragraphs stored."""
+        return self.store_document(extract_document(file_path, self.image_store.folder))
+
+    def store_document(self, extracted: dict) -> int:
+        """Commit one extract_document result: the single writer for the tables and in-memory indexes."""
+        for message in extracted['errors']:
+            self.report_error(message)
+        document = extracted['document']
+        filename = document['filename']
+        # Take the new references first, so images shared with the copy being replaced survive its removal
+        self.image_store.acquire(document['image_paths'])
+        if filename in self.document_ids:
+            self.unindex(filename)  # Re-indexing replaces the stored copy
+        document_id = self.documents_table.insert(document)
+        self.documents[document_id] = document
+        self.document_ids[filename] = document_id
+        # One write per document: TinyDB would otherwise rewrite the whole JSON file for every paragraph
+        self.store_paragraphs(document_id, extracted['paragraphs'], extracted['pages'], extracted['tags'])
+        return len(extracted['paragraphs'])
+
+    def store_paragraphs(self, document_id, paragraphs, pages, tags):
+        """Write paragraph rows (with their page number, when known) in one batch and add them to the indexes."""
+        rows = []
+        for para, page, para_tags in zip(paragraphs, pages, tags):
+            row = {'doc_id': document_id, 'text': para, 'tags': para_tags}
+            if page is not None:
+                row['page'] = page
+            rows.append(row)
+        with self.paragraphs_table.buffered():
+            para_ids = self.paragraphs_table.insert_multiple(rows)
+        for para_id, para, para_tags in zip(para_ids, paragraphs, tags):
+            self.search_index.add(para_id, para)
+            self.track_paragraph(para_id, para, document_id, para_tags)
+
+    def track_paragraph(self, para_id, text, document_id, tags):
+        """Keep a paragraph's lowercased text and its search filter fields in memory."""
+        self.lower_texts[para_id] = text.lower()
+        self.paragraph_documents[para_id] = document_id
+        self.paragraph_tags[para_id] = "\n".join(tags)
+
+    def stream_document(self, file_path) -> int:
+        """Index one file section by section (a PDF page at a time) in the writer; returns the paragraphs stored.
+
+        Each section is tagged and written before the next is read, so a 3,000-page manual costs one page of
+        extraction memory instead of its whole text. The document record is written first and its hash, image
+        paths and tag counts are filled in at the end, so a record left without a hash (the run stopped midway)
+        is seen as not indexed and streamed again.
+        """
+        file_path = Path(file_path)
+        filename = file_path.name
+        if filename in self.document_ids:
+            self.unindex(filename)  # Released images are only deleted by finish_changes(), after this document
+        document = document_record(file_path, [], {})
+        content_hash, document['hash'] = document['hash'], None
+        document_id = self.documents_table.insert(document)
+        self.documents[document_id] = document
+        self.document_ids[filename] = document_id
+        stop_words = set(stopwords.words('english'))
+        tag_counts = Counter()
+        errors = []
+        stored = 0
+        for section in iter_document_sections(file_path, self.image_store.folder, errors):
+            paragraphs = section['paragraphs']
+            tags = [paragraph_tags(para, filename, stop_words) for para in paragraphs]
+            self.store_paragraphs(document_id, paragraphs, [section['page']] * len(paragraphs), tags)
+            tag_counts.update(tag for para_tags in tags for tag in para_tags)
+            new_images = [path for path in section['image_paths'] if path not in document['image_paths']]
+            self.image_store.acquire(new_images)
+            document['image_paths'].extend(new_images)
+            stored += len(paragraphs)
+        document['tag_counts'] = dict(tag_counts)
+        document['hash'] = content_hash
+        self.documents_table.update_key(filename, {'image_paths': document['image_paths'],
+                                                   'tag_counts': document['tag_counts'], 'hash': content_hash})
+        for message in errors:
+            self.report_error(message)
+        return stored
+
+    def collect_files(self, paths) -> list:
+        """Expand files and directories into the supported document files they contain."""
+        files = []
+        for path in paths:
+            path = Path(path)
+            if path.is_dir():
+                for ext in SUPPORTED_EXTENSIONS:
+                    files.extend(sorted(path.glob(f"*{ext}")))
+            elif path.suffix.lower() in SUPPORTED_EXTENSIONS:
+                files.append(path)
+            else:
+                logger.warning(f"Skipping unsupported file {path}")
+        return files
+
+    def extract_all(self, files):
+        """Yield extract_document results in file order, extracting in a process pool when workers allow."""
+        if self.ingest_workers <= 1 or len(files) <= 1:
+            for file_path in files:
+                yield extract_document(file_path, self.image_store.folder)
+            return
+        executor = ProcessPoolExecutor(max_workers=min(self.ingest_workers, len(files)))
+        try:
+            # map() extracts in parallel but yields in submission order, so the writer commits files in order
+            yield from executor.map(extract_document, files, repeat(self.image_store.folder), chunksize=1)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def indexed_hashes(self) -> dict:
+        """Content hash -> filename of every indexed document."""
+        return {doc['hash']: doc['filename'] for doc in self.documents.values() if doc['hash']}
+
+    @writes
+    def index_paths(self, paths, skip_indexed=True, progress=None) -> list:
+        """Index every supported file under paths; progress(done, total, filename) is called per file.
+
+        With skip_indexed, files already indexed with the same content, under their own name or another, are
+        skipped; an edited file keeps its name but not its hash, so it is re-indexed.
+        """
+        files = self.collect_files(paths)
+        if skip_indexed:
+            indexed_hashes = self.indexed_hashes()
+            fresh = []
+            for file_path in files:
+                holder = indexed_hashes.get(file_sha256(file_path))
+                if holder is not None and holder != file_path.name:
+                    logger.info(f"Skipping {file_path.name}: same content as {holder}")
+                elif holder is None:
+                    fresh.append(file_path)
+            files = fresh
+        self.store_all(files, progress)
+        if files:
+            self.finish_changes()
+        return [f.name for f in files]
+
+    def should_stream(self, file_path) -> bool:
+        try:
+            return Path(file_path).stat().st_size > self.stream_bytes
+        except OSError:
+            return False
+
+    def store_all(self, files, progress=None):
+        """Extract and store files in order; the caller finishes with finish_changes().
+
+        Files over stream_bytes are streamed by the writer itself; the rest are extracted in the process pool.
+        """
+        streamed = {file_path for file_path in files if self.should_stream(file_path)}
+        extracted = self.extract_all([file_path for file_path in files if file_path not in streamed])
+        for i, file_path in enumerate(files):
+            if progress:
+                progress(i + 1, len(files), file_path.name)
+            if file_path in streamed:
+                self.stream_document(file_path)
+            else:
+                self.store_document(next(extracted))
+
+    def finish_changes(self):
+        """After a batch of stores and removals: save the index, invalidate cached results, free unused images."""
+        self.save_index()
+        self.result_cache.bump_generation()
+        self.image_store.collect()
+
+    @writes
+    def sync_sources(self, folders=None, progress=None) -> dict:
+        """Bring the index in line with the supported files in folders (default: the docs folder).
+
+        The source manifest tells which files were added, changed or removed since the last sync, hashing only
+        files whose size or mtime moved; nothing else is read. New files whose content is already indexed under
+        another name are skipped. Only files recorded under folders can be removed. Documents whose streaming
+        never finished are re-indexed. Returns the affected filenames under 'added', 'changed', 'removed' and
+        'duplicates'.
+        """
+        folders = folders or [self.DOCS_DIR]
+        delta = self.source_manifest.diff(self.collect_files(folders), roots=folders)
+        incomplete = {doc['filename'] for doc in self.documents.values() if not doc['hash']}
+        delta.changed += [path for path, entry in delta.entries.items()
+                          if Path(path).name in incomplete and not entry.get('duplicate_of') and os.path.isfile(path)
+                          and path not in delta.added and path not in delta.changed]
+        current = {Path(path).name for path, entry in delta.entries.items() if not entry.get('duplicate_of')}
+        removed = [Path(path).name for path in delta.removed if Path(path).name not in current]
+        for filename in removed:
+            self.unindex(filename)
+        indexed_hashes = self.indexed_hashes()
+        changes = {'added': [], 'changed': [], 'removed': removed,
+                   'duplicates': [Path(path).name for path in delta.duplicates]}
+        files = []
+        for kind, paths in (('added', delta.added), ('changed', delta.changed)):
+            for path in paths:
+                file_path = Path(path)
+                holder = indexed_hashes.get(delta.entries[path]['sha256'])
+                if holder == file_path.name:
+                    continue  # Indexed before the manifest knew about it
+                if holder is not None:
+                    changes['duplicates'].append(file_path.name)
+                    continue
+                changes[kind].append(file_path.name)
+                files.append(file_path)
+        self.store_all(files, progress)
+        if removed or files:
+            self.finish_changes()
+        self.source_manifest.commit(delta)
+        if any(changes.values()):
+            logger.info("Synced sources: " + ", ".join(f"{len(names)} {kind}" for kind, names in changes.items()))
+        return changes
+
+    @writes
+    def delete(self, filename: str) -> int:
+        """Remove a document's paragraphs and unshared images; returns the number of paragraphs removed."""
+        removed = self.unindex(filename)
+        if removed is not None:
+            self.finish_changes()
+        return removed or 0
+
+    def unindex(self, filename: str):
+        """Drop a document from the tables and indexes and release its images, without saving; None if unknown."""
+        document_id = self.document_ids.pop(filename, None)
+        if document_id is None:
+            return None
+        self.image_store.release(self.documents[document_id]['image_paths'])  # Counts are built from self.documents
+        del self.documents[document_id]
+        self.documents_table.remove([document_id])
+        docs_to_delete = self.paragraphs_table.remove_key(document_id)
+        for doc in docs_to_delete:
+            self.search_index.remove(doc.doc_id, doc['text'])
+            for paragraph_map in (self.lower_texts, self.paragraph_documents, self.paragraph_tags, self.line_offsets):
+                paragraph_map.pop(doc.doc_id, None)
+        return len(docs_to_delete)
+
+    def rebuild_search_index(self):
+        self.search_index.clear()
+        self.lower_texts = {}
+        self.paragraph_documents = {}
+        self.paragraph_tags = {}
+        self.line_offsets = {}
+        for doc in self.paragraphs_table.all():
+            self.search_index.add(doc.doc_id, doc['text'])
+            self.track_paragraph(doc.doc_id, doc['text'], doc['doc_id'], doc.get('tags', []))
+        self.save_index()
+        logger.info(f"Rebuilt search index with {len(self.search_index)} paragraphs")
+
+    # Startup snapshot
+    def snapshot_stamp(self) -> list:
+        """Identify the stored tables by their change stamps (file size and mtime, or a change counter)."""
+        return [self.documents_table.stamp(), self.paragraphs_table.stamp()]
+
+    def save_snapshot(self):
+        """Rewrite the memory-mapped postings and paragraph texts other processes and the next start map."""
+        builder = SnapshotBuilder()
+        self.search_index.add_to_snapshot(builder, 'index')
+        builder.add_texts('texts', dict(self.lower_texts))
+        builder.add_values('paragraph_documents', dict(self.paragraph_documents))
+        builder.add_texts('paragraph_tags', dict(self.paragraph_tags))
+        builder.add_records('documents', {str(doc_id): doc for doc_id, doc in self.documents.items()})
+        try:
+            builder.write(self.SNAPSHOT_PATH, self.snapshot_stamp())
+        except OSError as e:
+            logger.warning(f"Failed to write index snapshot: {str(e)}")
+
+    def save_index(self):
+        self.search_index.save()
+        self.save_snapshot()
+
+    # Catalog
+    @reads
+    def all_tags(self) -> list:
+        tags = set()
+        for document in self.documents.values():
+            tags.update(document['tag_counts'])
+        return sorted(tags)
+
+    @reads
+    def indexed_documents(self) -> list:
+        return sorted(self.document_ids)
+
+    @reads
+    def stats(self) -> dict:
+        return {
+            'documents': len(self.documents),
+            'paragraphs': len(self.lower_texts),
+            'terms': self.search_index.term_count(),
+            'tags': len(self.all_tags()),
+            'storage': self.paragraphs_table.backend,
+            'synonym_groups': len(self.synonyms),
+            'cache': self.result_cache.stats()
+        }
+
+    # Synonyms
+    @writes
+    def save_synonyms(self):
+        """Persist self.synonyms and recompile the lookup; cached results are invalidated."""
+        with open(self.SYNONYMS_PATH, 'w') as f:
+            json.dump(self.synonyms, f, indent=4)
+        self.synonym_map.compile(self.synonyms)
+        self.result_cache.bump_generation()
+
+    @writes
+    def set_synonym_group(self, key: str, words: list):
+        """Add or replace one synonym group, leaving the others as they are, and save."""
+        self.synonyms[key] = list(words)
+        self.save_synonyms()
+
+    @writes
+    def delete_synonym_group(self, key: str) -> bool:
+        """Remove one synonym group and save; False if there was no such group."""
+        if self.synonyms.pop(key, None) is None:
+            return False
+        self.save_synonyms()
+        return True
+
+    # Search
+    @staticmethod
+    def search_params(regex=False, case_sensitive=False, filetype="All", tag="") -> dict:
+        return {'regex': regex, 'case_sensitive': case_sensitive, 'filetype': filetype, 'tag': tag}
+
+    def passes_filters(self, para_id, params: dict) -> bool:
+        """Check a paragraph against the filetype and tag filters using the in-memory filter fields."""
+        document = self.documents.get(self.paragraph_documents.get(para_id))
+        if document is None:
+            return False
+        if params['filetype'] != "All" and document['filetype'] != params['filetype']:
+            return False
+        if params['tag'] and params['tag'] not in self.paragraph_tags[para_id].split("\n"):
+            return False
+        return True
+
+    def regex_candidates(self, literals) -> list:
+        """Return ids of paragraphs containing every literal a regex match requires."""
+        doc_ids = None
+        for literal in literals:
+            # Runs of word characters always sit inside one indexed term, so the vocabulary narrows the search
+            for fragment in tokenize(literal):
+                matched = self.search_index.containing(fragment)
+                doc_ids = matched if doc_ids is None else doc_ids & matched
+        pool = self.lower_texts if doc_ids is None else doc_ids
+        return [doc_id for doc_id in pool if all(literal in self.lower_texts[doc_id] for literal in literals)]
+
+    @reads
+    def rank(self, query: str, params: dict, cancelled=None) -> list:
+        """Return lightweight (score, paragraph id, line number) tuples for every match.
+
+        Raises re.error for bad patterns and SearchCancelled once the cancelled event is set.
+        """
+        def check_cancelled():
+            if cancelled is not None and cancelled.is_set():
+                raise SearchCancelled()
+
+        ranked = []
+        if params['regex']:
+            flags = 0 if params['case_sensitive'] else re.IGNORECASE
+            pattern = re.compile(query, flags)
+            literals = required_literals(query)
+            # Filters are checked in memory; only the remaining candidates' original text is read
+            candidates = [doc_id for doc_id in self.regex_candidates(literals) if self.passes_filters(doc_id, params)]
+            for doc in self.paragraphs_table.get(doc_ids=candidates):
+                check_cancelled()
+                text = doc['text']
+                offsets = self.line_offsets.get(doc.doc_id)
+                if offsets is None:
+                    offsets = self.line_offsets[doc.doc_id] = line_offsets(text)
+                for i, start in enumerate(offsets, 1):
+                    end = offsets[i] - 1 if i < len(offsets) else len(text)
+                    line = text[start:end]
+                    if literals and not all(literal in line.lower() for literal in literals):
+                        continue
+                    if pattern.search(line):
+                        ranked.append((100, doc.doc_id, i))
+        else:
+            expanded_query = self.synonym_map.expand(query)
+            candidate_ids = self.search_index.candidates(expanded_query)
+            # SQLite's FTS5 mirror adds stemmed matches (printers -> printer) the term index does not link
+            fulltext_ids = self.paragraphs_table.fulltext(expanded_query)
+            if fulltext_ids:
+                candidate_ids |= fulltext_ids
+            if not candidate_ids and expanded_query:
+                # No term matched; the scorer may still match across words, so try the paragraphs holding the
+                # terms that share the most trigrams with the query, up to FALLBACK_PARAGRAPHS of them
+                candidate_ids = self.search_index.related(expanded_query, FALLBACK_PARAGRAPHS)
+            check_cancelled()
+            candidates = [doc_id for doc_id in sorted(candidate_ids or ()) if self.passes_filters(doc_id, params)]
+            check_cancelled()
+            # Score every (word, paragraph) pair in one batch; pairs below the cutoff exit early
+            scores = best_scores(expanded_query, [self.lower_texts[doc_id] for doc_id in candidates], score_cutoff=70)
+            ranked = [(int(score), doc_id, None) for doc_id, score in zip(candidates, scores) if score > 70]
+        return ranked
+
+    @reads
+    def cached_rank(self, query: str, params: dict) -> list:
+        ranked = self.result_cache.get(query, params)
+        if ranked is None:
+            ranked = self.rank(query, params)
+            self.result_cache.put(query, params, ranked)
+        return ranked
+
+    @staticmethod
+    def top_page(ranked: list, offset: int, limit: int) -> list:
+        # Bounded heap keeps only the best offset + limit tuples; nlargest is stable like sorted()
+        return heapq.nlargest(offset + limit, ranked, key=itemgetter(0))[offset:]
+
+    @reads
+    def materialize(self, query: str, params: dict, page: list) -> list:
+        """Load text, highlight matches and gather images for the ranked tuples on one page only."""
+        docs = {doc.doc_id: doc for doc in self.paragraphs_table.get(doc_ids=list({doc_id for _, doc_id, _ in page}))}
+        if params['regex']:
+            pattern = re.compile(query, 0 if params['case_sensitive'] else re.IGNORECASE)
+        else:
+            highlighter = highlight_pattern(self.synonym_map.expand(query))
+        results = []
+        for score, doc_id, line_number in page:
+            doc = docs.get(doc_id)
+            document = self.documents.get(doc['doc_id']) if doc else None
+            if document is None:
+                continue
+            if line_number:
+                text = doc['text']
+                offsets = self.line_offsets.get(doc_id) or line_offsets(text)
+                if line_number > len(offsets):
+                    continue
+                end = offsets[line_number] - 1 if line_number < len(offsets) else len(text)
+                matched_text = pattern.sub(lambda m: f"<b>{m.group()}</b>", text[offsets[line_number - 1]:end])
+            else:
+                matched_text = highlighter.sub(r'<b>\1</b>', doc['text']) if highlighter else doc['text']
+            results.append({
+                'filename': document['filename'],
+                'matched_text': matched_text,
+                'line_number': line_number,
+                'page': doc.get('page'),
+                'tags': doc['tags'],
+                'score': score,
+                'image_paths': document['image_paths']
+            })
+        return results
+
+    @reads
+    def search(self, query: str, regex=False, case_sensitive=False, filetype="All", tag="", limit=10, offset=0) -> dict:
+        """Run a search and return {'total': n, 'results': [...]} for one page of results."""
+        params = self.search_params(regex, case_sensitive, filetype, tag)
+        ranked = self.cached_rank(query, params)
+        page = self.top_page(ranked, offset, limit)
+        return {'total': len(ranked), 'results': self.materialize(query, params, page)}
+
+
+def main(argv=None):
+    """Command line entry point: index, sync, watch, search, delete, stats, migrate and serve subcommands."""
+    parser = argparse.ArgumentParser(prog="kb", description="Headless knowledge base indexer and search")
+    parser.add_argument("--data-dir", default="data", help="Directory holding knowledge_db.json (default: data)")
+    parser.add_argument("--images-dir", default="images", help="Directory for extracted images (default: images)")
+    parser.add_argument("--storage", choices=["tinydb", "journal", "sqlite"],
+                        help="Storage backend (default: SQLite once migrated, otherwise TinyDB; journal is single-process)")
+    parser.add_argument("--remote", default=os.environ.get("KB_ENGINE_URL"),
+                        help="Use a running daemon (http://host:port or unix:///path) instead of opening the data "
+                             "directory (default: $KB_ENGINE_URL)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="Index documents from files or folders")
+    index_parser.add_argument("paths", nargs="+")
+    index_parser.add_argument("--reindex", action="store_true", help="Also index files whose content is already indexed")
+    index_parser.add_argument("--workers", type=int, help="Extraction processes (default: one per CPU)")
+    index_parser.add_argument("--stream", action="store_true",
+                              help="Index every file a page or section at a time, not only files over 32 MB")
+
+    sync_parser = subparsers.add_parser("sync", help="Index added and changed files in folders, drop removed ones")
+    sync_parser.add_argument("folders", nargs="*", help="Folders to sync (default: docs)")
+    sync_parser.add_argument("--workers", type=int, help="Extraction processes (default: one per CPU)")
+
+    watch_parser = subparsers.add_parser("watch", help="Sync folders now and again whenever their files change")
+    watch_parser.add_argument("folders", nargs="*", help="Folders to watch (default: docs)")
+    watch_parser.add_argument("--interval", type=float, default=10.0, help="Seconds between polls (default: 10)")
+    watch_parser.add_argument("--workers", type=int, help="Extraction processes (default: one per CPU)")
+
+    search_parser = subparsers.add_parser("search", help="Search the knowledge base")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    search_parser.add_argument("--regex", action="store_true")
+    search_parser.add_argument("--case-sensitive", action="store_true")
+    search_parser.add_argument("--filetype", default="All", choices=["All", "pdf", "docx", "txt"])
+    search_parser.add_argument("--tag", default="")
+    search_parser.add_argument("--limit", type=int, default=10)
+    search_parser.add_argument("--offset", type=int, default=0)
+
+    delete_parser = subparsers.add_parser("delete", help="Delete indexed documents by filename")
+    delete_parser.add_argument("filenames", nargs="+")
+
+    stats_parser = subparsers.add_parser("stats", help="Show knowledge base statistics")
+    stats_parser.add_argument("--json", action="store_true")
+
+    migrate_parser = subparsers.add_parser("migrate", help="Copy the apps' TinyDB files into SQLite databases")
+    migrate_parser.add_argument("--root", default=".", help="Directory the apps run from (default: .)")
+    migrate_parser.add_argument("--overwrite", action="store_true", help="Replace SQLite databases that already exist")
+
+    serve_parser = subparsers.add_parser("serve", help="Run the shared index daemon other clients connect to")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    serve_parser.add_argument("--token", default=os.environ.get("KB_ENGINE_TOKEN"),
+                              help="Shared token clients must send; required off loopback (default: $KB_ENGINE_TOKEN)")
+    serve_parser.add_argument("--root", action="append", dest="roots",
+                              help="Folder clients may index or sync; repeatable (default: the docs folder)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "migrate":
+        try:
+            migrated = migrate_known_databases(args.root, overwrite=args.overwrite)
+        except FileExistsError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+        for json_path, counts in migrated.items():
+            print(f"{json_path}: " + ", ".join(f"{table} {count} records" for table, count in counts.items()))
+        return 0
+    # kb_server imports this module, so it is loaded only for the commands that need it
+    import kb_server
+    if args.remote and args.command != "serve":
+        engine = kb_server.RemoteEngine(args.remote)
+    else:
+        engine = KnowledgeBaseEngine(data_dir=args.data_dir, images_dir=args.images_dir, storage=args.storage,
+                                     ingest_workers=getattr(args, "workers", None),
+                                     stream_bytes=0 if getattr(args, "stream", False) else STREAM_BYTES)
+
+    if args.command == "serve":
+        try:
+            kb_server.serve(engine, host=args.host, port=args.port, socket_path=args.socket, token=args.token,
+                            roots=args.roots)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+        return 0
+
+    if args.command == "index":
+        indexed = engine.index_paths(args.paths, skip_indexed=not args.reindex,
+                                     progress=lambda done, total, name: print(f"[{done}/{total}] {name}", file=sys.stderr))
+        print(f"Indexed {len(indexed)} new or changed documents")
+    elif args.command in ("sync", "watch"):
+        progress = lambda done, total, name: print(f"[{done}/{total}] {name}", file=sys.stderr)
+        sync = lambda: engine.sync_sources(args.folders or None, progress=progress)
+        report = lambda changes: print(", ".join(f"{len(names)} {kind}" for kind, names in changes.items()))
+        report(sync())
+        if args.command == "watch":
+            watcher = FolderWatcher(sync, interval=args.interval,
+                                    on_change=lambda changes: any(changes.values()) and report(changes))
+            watcher.start()
+            try:
+                watcher.thread.join()
+            except KeyboardInterrupt:
+                watcher.stop()
+    elif args.command == "search":
+        try:
+            response = engine.search(args.query, regex=args.regex, case_sensitive=args.case_sensitive,
+                                     filetype=args.filetype, tag=args.tag, limit=args.limit, offset=args.offset)
+        except re.error:
+            print("Invalid regex pattern", file=sys.stderr)
+            return 2
+        if args.json:
+            print(json.dumps(response, indent=2))
+        else:
+            for result in response['results']:
+                line = f" (line {result['line_number']})" if result['line_number'] else ""
+                line += f" (page {result['page']})" if result.get('page') else ""
+                print(f"{result['score']:3d}  {result['filename']}{line}: {re.sub(r'</?b>', '', result['matched_text'])}")
+            print(f"{len(response['results'])} of {response['total']} results")
+    elif args.command == "delete":
+        for filename in args.filenames:
+            print(f"Deleted {engine.delete(filename)} paragraphs from {filename}")
+    elif args.command == "stats":
+        stats = engine.stats()
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        else:
+            for key, value in stats.items():
+                print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,456 @@
+# Shared knowledge base daemon and its client
+# One process owns a KnowledgeBaseEngine (storage, search index, synonyms, result cache) and answers JSON
+# requests over localhost HTTP or a Unix socket, one thread per request. Searches share a read lock and run
+# concurrently; indexing, deletes and synonym changes take the write lock. RemoteEngine offers the subset of
+# the engine API the front-ends use, so a desk client can swap its local engine for a warm shared one.
+#   python kb.py serve --port 8765            # or: python kb.py serve --socket /tmp/kb.sock
+#   KB_ENGINE_URL=http://127.0.0.1:8765 python retail_demo_bot.py
+# Document paths sent for indexing are opened by the daemon, so clients must share its filesystem; it only
+# indexes and syncs under its roots (the docs folder unless --root is given). It listens on loopback or a Unix
+# socket unless a shared token is set, and with a token every request must carry it (KB_ENGINE_TOKEN).
+import hmac
+import http.client
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, unquote
+
+from kb_engine import KnowledgeBaseEngine, ReadWriteLock, SearchCancelled
+from result_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+
+# Body fields each request needs; they are checked before the handler runs, so a KeyError raised inside the
+# engine is reported as a server error rather than blamed on the client
+REQUIRED_FIELDS = {
+    "rank": ("query", "params"),
+    "materialize": ("query", "params", "page"),
+    "search": ("query",),
+    "index": ("paths",),
+    "delete": ("filename",),
+    "set_synonym_group": ("key", "words"),
+    "delete_synonym_group": ("key",),
+}
+
+
+# Search filter fields (KnowledgeBaseEngine.search_params) and the keyword options search() accepts
+PARAM_TYPES = {"regex": bool, "case_sensitive": bool, "filetype": str, "tag": str}
+OPTION_TYPES = dict(PARAM_TYPES, limit=int, offset=int)
+
+# Requests that only read, so a client may resend one whose connection failed mid-flight
+IDEMPOTENT_REQUESTS = {"info", "rank", "materialize", "search"}
+
+
+class RemoteEngineError(Exception):
+    pass
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_page_entry(item):
+    """A ranked tuple as rank() returns it: (score, paragraph id, line number or None)."""
+    return (isinstance(item, list) and len(item) == 3 and isinstance(item[0], (int, float))
+            and not isinstance(item[0], bool) and is_int(item[1])
+            and (item[2] is None or (is_int(item[2]) and item[2] >= 1)))
+
+
+def check_types(name, values, types):
+    for key, value in values.items():
+        expected = types[key]
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise RequestError(f"{name}.{key} must be {expected.__name__}")
+
+
+class RequestError(Exception):
+    """A request the daemon refuses before running it; status is the HTTP status to reply with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class EngineService:
+    """The daemon's request handlers: each takes the decoded JSON body and returns a JSON-able value."""
+
+    def __init__(self, engine, roots=None):
+        self.engine = engine
+        # Folders clients may index or sync; anything else on the daemon's filesystem is refused
+        self.roots = [Path(root).resolve() for root in (roots or [engine.DOCS_DIR])]
+        self.lock = engine.lock  # Shared with the engine's own methods, which lock again re-entrantly
+        self.readers = {
+            "info": self.info,
+            "rank": self.rank,
+            "materialize": self.materialize,
+            "search": self.search,
+        }
+        self.writers = {
+            "index": self.index,
+            "sync": self.sync,
+            "delete": self.delete,
+            "set_synonym_group": self.set_synonym_group,
+            "delete_synonym_group": self.delete_synonym_group,
+        }
+
+    def validate(self, name, body):
+        if name not in self.readers and name not in self.writers:
+            raise RequestError(f"Unknown request {name}", 404)
+        if not isinstance(body, dict):
+            raise RequestError("Request body must be a JSON object")
+        missing = [field for field in REQUIRED_FIELDS.get(name, ()) if field not in body]
+        if missing:
+            raise RequestError(f"Missing field {', '.join(missing)}")
+        for field in ("query", "filename", "key"):
+            if field in body and not isinstance(body[field], str):
+                raise RequestError(f"{field} must be a string")
+        for field in ("paths", "folders"):
+            if body.get(field) is not None and not is_string_list(body[field]):
+                raise RequestError(f"{field} must be a list of strings")
+        if "params" in body:
+            params = body["params"]
+            if not isinstance(params, dict) or set(params) != set(PARAM_TYPES):
+                raise RequestError(f"params must have exactly the fields {', '.join(sorted(PARAM_TYPES))}")
+            check_types("params", params, PARAM_TYPES)
+        if "options" in body:
+            options = body["options"]
+            if not isinstance(options, dict):
+                raise RequestError("options must be an object")
+            unknown = sorted(set(options) - set(OPTION_TYPES))
+            if unknown:
+                raise RequestError(f"Unknown search option {', '.join(unknown)}")
+            check_types("options", options, OPTION_TYPES)
+            if options.get("limit", 0) < 0 or options.get("offset", 0) < 0:
+                raise RequestError("limit and offset must not be negative")
+        if "page" in body:
+            page = body["page"]
+            if not isinstance(page, list) or not all(is_page_entry(item) for item in page):
+                raise RequestError("page must be a list of [score, paragraph id, line number or null]")
+
+    def check_paths(self, paths):
+        for path in paths:
+            resolved = Path(path).resolve()
+            if not any(resolved == root or root in resolved.parents for root in self.roots):
+                raise RequestError(f"{path} is outside the folders this daemon serves", 403)
+
+    def handle(self, name, body):
+        self.validate(name, body)
+        if name in self.readers:
+            self.lock.acquire_read()
+            try:
+                return self.readers[name](body)
+            finally:
+                self.lock.release_read()
+        self.lock.acquire_write()
+        try:
+            return self.writers[name](body)
+        finally:
+            self.lock.release_write()
+
+    def info(self, body):
+        """Everything a client shows outside search results, in one round trip."""
+        return {
+            "generation": self.engine.result_cache.generation,
+            "documents": self.engine.indexed_documents(),
+            "tags": self.engine.all_tags(),
+            "synonyms": dict(self.engine.synonyms),  # Copied, as the reply is encoded after the lock is released
+            "docs_dir": str(self.engine.DOCS_DIR.resolve()),
+            "stats": self.engine.stats(),
+        }
+
+    def rank(self, body):
+        ranked = self.engine.cached_rank(body["query"], body["params"])
+        return {"generation": self.engine.result_cache.generation, "ranked": ranked}
+
+    def materialize(self, body):
+        page = [tuple(item) for item in body["page"]]
+        return {"results": self.engine.materialize(body["query"], body["params"], page)}
+
+    def search(self, body):
+        return self.engine.search(body["query"], **body.get("options", {}))
+
+    def index(self, body):
+        self.check_paths(body["paths"])
+        indexed = self.engine.index_paths(body["paths"], skip_indexed=body.get("skip_indexed", True))
+        return {"indexed": indexed, "generation": self.engine.result_cache.generation}
+
+    def sync(self, body):
+        self.check_paths(body.get("folders") or [])
+        changes = self.engine.sync_sources(body.get("folders"))
+        return {"changes": changes, "generation": self.engine.result_cache.generation}
+
+    def delete(self, body):
+        return {"removed": self.engine.delete(body["filename"]), "generation": self.engine.result_cache.generation}
+
+    # One group per request, so desks editing different groups do not overwrite each other
+    def set_synonym_group(self, body):
+        if not isinstance(body["words"], list) or not all(isinstance(word, str) for word in body["words"]):
+            raise RequestError("words must be a list of strings")
+        self.engine.set_synonym_group(str(body["key"]), body["words"])
+        return {"synonyms": dict(self.engine.synonyms), "generation": self.engine.result_cache.generation}
+
+    def delete_synonym_group(self, body):
+        self.engine.delete_synonym_group(str(body["key"]))
+        return {"synonyms": dict(self.engine.synonyms), "generation": self.engine.result_cache.generation}
+
+
+class EngineRequestHandler(BaseHTTPRequestHandler):
+    """POST /<handler> with a JSON body; replies with JSON, or {"error", "kind"} and a 4xx/5xx status."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, so a client reuses one connection
+
+    def do_POST(self):
+        name = self.path.strip("/")
+        try:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as e:
+                raise RequestError(f"Malformed request body: {str(e)}")
+            token = self.server.token
+            if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+                raise RequestError("Missing or wrong token", 401)
+            self.reply(200, self.server.service.handle(name, body))
+        except RequestError as e:
+            self.reply(e.status, {"error": str(e), "kind": "request"})
+        except re.error as e:
+            self.reply(400, {"error": str(e), "kind": "regex"})
+        except Exception as e:
+            logger.exception(f"Request {name} failed")
+            self.reply(500, {"error": str(e), "kind": "server"})
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)  # Left behind by a daemon that did not shut down cleanly
+        socketserver.UnixStreamServer.server_bind(self)
+        os.chmod(self.server_address, 0o660)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def make_server(engine, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, token=None, roots=None):
+    """Build a threaded server for engine on a Unix socket if socket_path is given, else on host:port.
+
+    A host other than loopback needs a token, which clients then send as "Authorization: Bearer <token>".
+    roots are the folders index and sync requests may reach (default: the engine's docs folder).
+    """
+    if socket_path:
+        server = UnixHTTPServer(str(socket_path), EngineRequestHandler)
+    else:
+        if not is_loopback(host) and not token:
+            raise ValueError(f"Refusing to listen on {host} without a token; set --token or KB_ENGINE_TOKEN")
+        server = ThreadingHTTPServer((host, port), EngineRequestHandler)
+    server.service = EngineService(engine, roots)
+    server.token = token
+    return server
+
+
+def serve(engine, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, token=None, roots=None):
+    server = make_server(engine, host, port, socket_path, token, roots)
+    logger.info(f"Serving knowledge base on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RemoteEngine:
+    """Client for a running daemon, offering the engine calls the front-ends make.
+
+    url is http://host:port or unix:///path/to/socket. Ranked results are cached locally, and the cache is
+    invalidated whenever a response shows the daemon's index generation has moved on.
+    """
+
+    def __init__(self, url, timeout=60, token=None):
+        self.url = url
+        self.timeout = timeout
+        self.token = token or os.environ.get("KB_ENGINE_TOKEN")  # Sent when the daemon requires one
+        self.local = threading.local()  # One keep-alive connection per thread
+        self.result_cache = QueryCache()
+        self.server_generation = None
+        self.refresh()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            parts = urlsplit(self.url)
+            if parts.scheme == "unix":
+                conn = UnixHTTPConnection(unquote(parts.path), timeout=self.timeout)
+            elif parts.scheme == "http":
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or DEFAULT_PORT, timeout=self.timeout)
+            else:
+                raise ValueError(f"Unsupported engine URL {self.url}")
+            self.local.conn = conn
+        return conn
+
+    def call(self, name, body=None):
+        data = json.dumps(body or {}).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        # A kept-alive connection may have been closed by a restarted daemon, so reads retry once on a new one.
+        # Writes are never resent (the daemon may have applied them); they start on a fresh connection instead.
+        retries = 2 if name in IDEMPOTENT_REQUESTS else 1
+        if retries == 1 and getattr(self.local, "conn", None) is not None:
+            self.local.conn.close()
+            self.local.conn = None
+        for attempt in range(retries):
+            conn = self.connection()
+            try:
+                conn.request("POST", f"/{name}", data, headers)
+                response = conn.getresponse()
+                payload = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException, OSError) as e:
+                conn.close()
+                self.local.conn = None
+                if attempt == retries - 1:
+                    raise RemoteEngineError(f"Knowledge base daemon at {self.url} is unreachable: {str(e)}")
+        if response.status != 200:
+            if payload.get("kind") == "regex":
+                raise re.error(payload["error"])
+            raise RemoteEngineError(payload.get("error", f"HTTP {response.status}"))
+        self.observe(payload.get("generation"))
+        return payload
+
+    def observe(self, generation):
+        """Drop locally cached rankings once another client has changed the daemon's index."""
+        if generation is not None and generation != self.server_generation:
+            if self.server_generation is not None:
+                self.result_cache.bump_generation()
+            self.server_generation = generation
+
+    def refresh(self):
+        info = self.call("info")
+        self.documents = info["documents"]
+        self.tags = info["tags"]
+        self.synonyms = info["synonyms"]
+        self.DOCS_DIR = Path(info["docs_dir"])
+        self.server_stats = info["stats"]
+
+    # Catalog
+    def indexed_documents(self) -> list:
+        self.refresh()
+        return list(self.documents)
+
+    def all_tags(self) -> list:
+        return list(self.tags)
+
+    def stats(self) -> dict:
+        self.refresh()
+        return dict(self.server_stats, remote=self.url)
+
+    # Ingestion
+    collect_files = KnowledgeBaseEngine.collect_files  # Plain filesystem walk, runs on the client
+
+    def index_paths(self, paths, skip_indexed=True, progress=None) -> list:
+        """Ask the daemon to index paths (resolved to absolute paths it can open); progress fires once at the end."""
+        paths = [str(Path(path).resolve()) for path in paths]
+        indexed = self.call("index", {"paths": paths, "skip_indexed": skip_indexed})["indexed"]
+        if progress and paths:
+            progress(len(paths), len(paths), Path(paths[-1]).name)
+        self.refresh()
+        return indexed
+
+    def sync_sources(self, folders=None, progress=None) -> dict:
+        """Ask the daemon to sync folders (default: its docs folder) against its source manifest."""
+        body = {"folders": [str(Path(folder).resolve()) for folder in folders]} if folders else {}
+        changes = self.call("sync", body)["changes"]
+        if progress and changes["added"] + changes["changed"]:
+            names = changes["added"] + changes["changed"]
+            progress(len(names), len(names), names[-1])
+        self.refresh()
+        return changes
+
+    def delete(self, filename: str) -> int:
+        removed = self.call("delete", {"filename": filename})["removed"]
+        self.refresh()
+        return removed
+
+    def set_synonym_group(self, key: str, words: list):
+        self.synonyms = self.call("set_synonym_group", {"key": key, "words": list(words)})["synonyms"]
+
+    def delete_synonym_group(self, key: str) -> bool:
+        existed = key in self.synonyms
+        self.synonyms = self.call("delete_synonym_group", {"key": key})["synonyms"]
+        return existed
+
+    # Search
+    def rank(self, query: str, params: dict, cancelled=None) -> list:
+        """Ranked (score, paragraph id, line number) tuples, computed and cached by the daemon."""
+        ranked = [tuple(item) for item in self.call("rank", {"query": query, "params": params})["ranked"]]
+        if cancelled is not None and cancelled.is_set():
+            raise SearchCancelled()
+        return ranked
+
+    def cached_rank(self, query: str, params: dict) -> list:
+        ranked = self.result_cache.get(query, params)
+        if ranked is None:
+            ranked = self.rank(query, params)
+            self.result_cache.put(query, params, ranked)
+        return ranked
+
+    top_page = staticmethod(KnowledgeBaseEngine.top_page)
+
+    def materialize(self, query: str, params: dict, page: list) -> list:
+        return self.call("materialize", {"query": query, "params": params, "page": page})["results"]
+
+    def search(self, query: str, regex=False, case_sensitive=False, filetype="All", tag="", limit=10, offset=0) -> dict:
+        options = {"regex": regex, "case_sensitive": case_sensitive, "filetype": filetype, "tag": tag,
+                   "limit": limit, "offset": offset}
+        return self.call("search", {"query": query, "options": options})
@@ -0,0 +1,208 @@
+# Streaming knowledge base snapshots
+# A snapshot is a gzip- or xz-compressed tar stream holding document records in chunks of JSON lines, the
+# content blobs and images they reference, the original document files, and a closing manifest.json with
+# the SHA-256 of every member. Nothing is held in memory beyond one record chunk or file buffer, and imports
+# are staged to disk and verified against the manifest before anything is applied.
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+
+from blob_store import file_sha256
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+RECORDS_PER_CHUNK = 500
+COMPRESSION = {".gz": "gz", ".tgz": "gz", ".xz": "xz", ".txz": "xz"}  # Suffix -> tarfile stream compression
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}$")
+SECTIONS = ("records", "blobs", "images", "documents")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def load_snapshot_state(path):
+    """Return {"created": timestamp, "names": [...]} from the last export, or None before the first one."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_snapshot_state(path, created, names):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"created": created, "names": sorted(names)}, f)
+    os.replace(tmp_path, path)
+
+
+class SnapshotWriter:
+    """Write members to a compressed tar stream, recording each member's SHA-256 for the manifest."""
+
+    def __init__(self, path):
+        compression = next((mode for suffix, mode in COMPRESSION.items() if str(path).endswith(suffix)), "gz")
+        self.tar = tarfile.open(path, f"w|{compression}")
+        self.checksums = {}
+
+    def add_bytes(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.checksums[name] = hashlib.sha256(data).hexdigest()
+
+    def add_file(self, name, path):
+        self.checksums[name] = file_sha256(path)
+        info = self.tar.gettarinfo(path, arcname=name)
+        with open(path, "rb") as f:
+            self.tar.addfile(info, f)
+
+    def close(self, manifest):
+        """Append the manifest, which lists every member's checksum, and finish the stream."""
+        manifest["members"] = self.checksums
+        data = json.dumps(manifest, indent=2).encode("utf-8")
+        info = tarfile.TarInfo("manifest.json")
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.tar.close()
+
+
+def export_snapshot(path, records, blob_store, image_folder, document_folder, image_names=None, since=None,
+                    deleted=(), progress=None):
+    """Stream records and the files they reference into a snapshot at path; returns the manifest.
+
+    records are plain dicts (no database ids). since marks an incremental snapshot, and deleted lists the
+    names removed since then. image_names(record) lists a record's images (default: record["images"]).
+    progress(done, total, message) is called after every record chunk and file.
+    """
+    image_names = image_names or (lambda record: record.get("images", []))
+    blobs, images, documents = set(), set(), set()
+    for record in records:
+        if record.get("content_hash"):
+            blobs.add(record["content_hash"])
+        images.update(name for name in image_names(record) if os.path.exists(os.path.join(image_folder, name)))
+        if os.path.exists(os.path.join(document_folder, record["name"])):
+            documents.add(record["name"])
+    chunks = [records[i:i + RECORDS_PER_CHUNK] for i in range(0, len(records), RECORDS_PER_CHUNK)]
+    total = len(chunks) + len(blobs) + len(images) + len(documents)
+    done = 0
+
+    def step(message):
+        nonlocal done
+        done += 1
+        if progress:
+            progress(done, total, message)
+
+    writer = SnapshotWriter(path)
+    try:
+        for i, chunk in enumerate(chunks):
+            data = "".join(json.dumps(record) + "\n" for record in chunk).encode("utf-8")
+            writer.add_bytes(f"records/{i:05d}.jsonl", data)
+            step(f"Records {i * RECORDS_PER_CHUNK + len(chunk)} of {len(records)}")
+        for digest in sorted(blobs):
+            if digest in blob_store:
+                writer.add_file(f"blobs/{digest}", blob_store.path(digest))
+            step(f"Blob {digest[:12]}")
+        for name in sorted(images):
+            writer.add_file(f"images/{name}", os.path.join(image_folder, name))
+            step(f"Image {name}")
+        for name in sorted(documents):
+            writer.add_file(f"documents/{name}", os.path.join(document_folder, name))
+            step(f"Document {name}")
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "kind": "incremental" if since else "full",
+            "created": str(datetime.now()),
+            "since": since,
+            "records": len(records),
+            "deleted": sorted(deleted),
+        }
+        writer.close(manifest)
+    except BaseException:
+        writer.tar.close()
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    logger.info(f"Exported {manifest['kind']} snapshot {path}: {len(records)} records, {len(blobs)} blobs, "
+                f"{len(images)} images, {len(documents)} documents")
+    return manifest
+
+
+def safe_member_name(name):
+    """Split a member name into (section, file name), rejecting anything that could escape its folder."""
+    section, _, filename = name.partition("/")
+    if section not in SECTIONS or not filename or "/" in filename or "\\" in filename or filename in (".", ".."):
+        raise SnapshotError(f"Unexpected snapshot member {name}")
+    if section == "blobs" and not BLOB_NAME.match(filename):
+        raise SnapshotError(f"Unexpected blob name {filename}")
+    return section, filename
+
+
+def import_snapshot(path, blob_store, image_folder, document_folder, progress=None):
+    """Stage and verify a snapshot, then install its files; returns (manifest, records).
+
+    Every member is checked against the manifest's SHA-256 before any blob, image or document is installed;
+    a SnapshotError leaves the knowledge base untouched. Applying the returned records is up to the caller.
+    """
+    staging_root = os.path.dirname(os.path.abspath(document_folder))
+    with tempfile.TemporaryDirectory(prefix=".snapshot-", dir=staging_root) as staging:
+        checksums = {}
+        manifest = None
+        done = 0
+        with tarfile.open(path, "r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                if member.name == "manifest.json":
+                    manifest = json.load(tar.extractfile(member))
+                    continue
+                section, filename = safe_member_name(member.name)
+                staged_path = os.path.join(staging, section, filename)
+                os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+                digest = hashlib.sha256()
+                with tar.extractfile(member) as source, open(staged_path, "wb") as target:
+                    for chunk in iter(lambda: source.read(1 << 20), b""):
+                        digest.update(chunk)
+                        target.write(chunk)
+                checksums[member.name] = digest.hexdigest()
+                done += 1
+                if progress:
+                    progress(done, None, f"Read {member.name}")
+        if manifest is None:
+            raise SnapshotError("Snapshot has no manifest; it may be truncated")
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot version {manifest.get('version')}")
+        if checksums != manifest["members"]:
+            bad = sorted(name for name in set(checksums) | set(manifest["members"])
+                         if checksums.get(name) != manifest["members"].get(name))
+            raise SnapshotError(f"Checksum mismatch for {', '.join(bad[:5])}")
+
+        records = []
+        for name in sorted(checksums):
+            section, filename = safe_member_name(name)
+            staged_path = os.path.join(staging, section, filename)
+            if section == "records":
+                with open(staged_path, "r", encoding="utf-8") as f:
+                    records.extend(json.loads(line) for line in f if line.strip())
+            elif section == "blobs":
+                target = blob_store.path(filename)
+                if not target.exists():
+                    target.parent.mkdir(exist_ok=True)
+                    shutil.move(staged_path, target)
+            elif section == "images":
+                shutil.move(staged_path, os.path.join(image_folder, filename))
+            elif section == "documents":
+                shutil.move(staged_path, os.path.join(document_folder, filename))
+    logger.info(f"Imported {manifest['kind']} snapshot {path}: {len(records)} records")
+    return manifest, records
@@ -0,0 +1,793 @@
+# Pluggable record storage for the knowledge base apps
+# Every table is reached through the same small store interface, backed either by the original TinyDB JSON
+# file or by a SQLite database next to it. The SQLite backend keeps each record as a JSON row with an indexed
+# key column (document name, filename or FAQ id) and mirrors the searchable text into an FTS5 table, so
+# lookups and deletes by name are index seeks and the KB no longer has to fit in one JSON blob. Files only one
+# process writes default to a journaled TinyDB store instead: changes are appended to <file>.journal and folded
+# back into the JSON file in the background, so a write no longer rewrites the whole file. A journaled file is
+# locked to the process that opened it; a second process gets StorageLockedError instead of losing writes.
+#   python kb.py migrate    # one-shot copy of the TinyDB files into SQLite; the apps switch over automatically
+import atexit
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so the journal relies on SHARED_DATABASES alone
+    fcntl = None
+
+from tinydb import TinyDB, Query
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import Storage
+from tinydb.table import Document
+
+from search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# (database file stem, table name) -> (key field with an index, fields mirrored into the full-text index)
+TABLE_SPECS = {
+    ("knowledge_base", "documents"): ("name", ("name", "tags")),  # Bodies live in the blob store, records keep content_hash
+    ("knowledge_base", "_default"): ("name", ("name", "content")),
+    ("knowledge_db", "documents"): ("filename", ("filename",)),
+    ("knowledge_db", "paragraphs"): ("doc_id", ("text",)),
+    ("knowledge_db", "meta"): ("name", ()),  # Store-level settings such as the schema version
+    ("support_bot_db", "faqs"): ("id", ("question", "answer")),
+}
+
+# Files written by more than one process at a time; these keep the read-through TinyDB store by default, since
+# the journaled store holds its tables in memory and would not see the other process's writes. knowledge_db is
+# written by the Qt bot and by `kb.py index/sync/watch/serve`, knowledge_base by both Tk apps.
+SHARED_DATABASES = {"knowledge_base", "knowledge_db"}
+
+# TinyDB files the apps ship with and the tables each one holds
+KNOWN_DATABASES = {
+    "knowledge_base.json": ("documents", "_default"),
+    "data/knowledge_db.json": ("documents", "paragraphs", "meta"),
+    "data/support_bot_db.json": ("faqs",),
+}
+
+
+class StorageLockedError(RuntimeError):
+    pass
+
+
+def table_spec(path, table):
+    """Key field and full-text fields for a table, looked up by its database's file stem."""
+    return TABLE_SPECS[(Path(path).stem, table)]
+
+
+def sqlite_path_for(json_path):
+    """SQLite database that replaces a TinyDB JSON file after migration."""
+    return Path(json_path).with_suffix(".sqlite3")
+
+
+def journal_path_for(json_path):
+    """Append-only change log that the journaled store keeps next to a TinyDB JSON file."""
+    return Path(f"{json_path}.journal")
+
+
+def open_store(json_path, table, backend=None):
+    """Open a table on the configured backend.
+
+    backend is "tinydb", "journal" or "sqlite"; by default the KB_STORAGE environment variable decides,
+    then whether the migrated SQLite database exists, then whether other apps share the file.
+    """
+    backend = backend or os.environ.get("KB_STORAGE")
+    if backend is None:
+        if sqlite_path_for(json_path).exists():
+            backend = "sqlite"
+        else:
+            backend = "tinydb" if Path(json_path).stem in SHARED_DATABASES else "journal"
+    if backend == "sqlite":
+        return SQLiteStore(sqlite_path_for(json_path), table)
+    if backend == "journal":
+        return JournalStore(json_path, table)
+    if backend == "tinydb":
+        fold_journal(json_path)
+        return TinyDBStore(json_path, table)
+    raise ValueError(f"Unknown storage backend {backend!r}")
+
+
+class AtomicJSONStorage(Storage):
+    """TinyDB storage that replaces the JSON file in one rename, so a crash mid-write keeps the old file."""
+
+    def __init__(self, path, **kwargs):
+        self.path = Path(path)
+        self.kwargs = kwargs  # Passed to json.dumps, like JSONStorage
+
+    def read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(text) if text.strip() else None
+
+    def write(self, data):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, **self.kwargs))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        pass
+
+
+class TinyDBStore:
+    """Store interface over a TinyDB table; key lookups scan the whole table.
+
+    Outside buffered() every call reads the file and writes it back on change, like plain TinyDB. Inside
+    buffered() the parsed database stays in memory and is written once when the outermost block exits.
+    """
+
+    backend = "tinydb"
+
+    def __init__(self, json_path, table):
+        self.key_field, self.text_fields = table_spec(json_path, table)
+        self.name = table
+        self.path = Path(json_path)
+        self.db = TinyDB(json_path, storage=CachingMiddleware(AtomicJSONStorage))
+        self.table = self.db.table(table)
+        self.buffer_depth = 0
+        self.lock = threading.RLock()
+        atexit.register(self.flush)  # Buffered rows still reach disk on a normal interpreter exit
+
+    @contextmanager
+    def buffered(self):
+        """Batch every write in the block into one file write, e.g. a whole document's paragraphs."""
+        with self.lock:
+            self.buffer_depth += 1
+            try:
+                yield self
+            finally:
+                self.buffer_depth -= 1
+                self.release()
+
+    def release(self):
+        """End of a call: outside buffered(), write pending changes and drop the cached file contents."""
+        if self.buffer_depth == 0:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.db.storage.flush()
+            self.db.storage.cache = None  # Next read sees writes made by other processes
+
+    def __len__(self):
+        with self.lock:
+            try:
+                return len(self.table)
+            finally:
+                self.release()
+
+    def insert(self, record) -> int:
+        with self.lock:
+            try:
+                return self.table.insert(record)
+            finally:
+                self.release()
+
+    def insert_multiple(self, records) -> list:
+        with self.lock:
+            try:
+                return self.table.insert_multiple(records)
+            finally:
+                self.release()
+
+    def all(self) -> list:
+        with self.lock:
+            try:
+                return self.table.all()
+            finally:
+                self.release()
+
+    def get(self, doc_id=None, doc_ids=None):
+        with self.lock:
+            try:
+                if doc_ids is not None:
+                    return self.table.get(doc_ids=list(doc_ids)) if doc_ids else []
+                return self.table.get(doc_id=doc_id)
+            finally:
+                self.release()
+
+    def find(self, value) -> list:
+        """Records whose key field equals value."""
+        with self.lock:
+            try:
+                return self.table.search(Query()[self.key_field] == value)
+            finally:
+                self.release()
+
+    def keys(self) -> list:
+        return sorted({doc[self.key_field] for doc in self.all() if self.key_field in doc})
+
+    def update_key(self, value, fields):
+        with self.lock:
+            try:
+                self.table.update(fields, Query()[self.key_field] == value)
+            finally:
+                self.release()
+
+    def remove(self, doc_ids):
+        with self.lock:
+            try:
+                self.table.remove(doc_ids=list(doc_ids))
+            finally:
+                self.release()
+
+    def remove_key(self, value) -> list:
+        """Delete records whose key field equals value and return them."""
+        with self.buffered():
+            docs = self.find(value)
+            if docs:
+                self.remove([doc.doc_id for doc in docs])
+            return docs
+
+    def truncate(self):
+        with self.lock:
+            try:
+                self.table.truncate()
+            finally:
+                self.release()
+
+    def fulltext(self, words):
+        """Full-text lookup is not available on TinyDB; callers fall back to their in-memory indexes."""
+        return None
+
+    def dump(self) -> dict:
+        """Return the table in TinyDB's on-disk layout, {table: {id: record}}."""
+        return {self.name: {str(doc.doc_id): dict(doc) for doc in self.all()}}
+
+    def load(self, data: dict):
+        """Replace the table with records in TinyDB's on-disk layout, keeping their ids."""
+        records = data.get(self.name, {})
+        with self.buffered():
+            self.table.truncate()
+            self.table.insert_multiple(Document(record, doc_id=int(doc_id)) for doc_id, record in records.items())
+
+    def stamp(self):
+        """Value that changes whenever the table may have changed: the file's size and modification time."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        self.db.close()
+
+
+class SQLiteStore:
+    """Store interface over one SQLite table plus an FTS5 mirror of its text fields."""
+
+    backend = "sqlite"
+
+    def __init__(self, db_path, table):
+        self.key_field, self.text_fields = table_spec(db_path, table)
+        self.name = table
+        self.table = f'"{table}"'
+        self.fts_table = f'"{table}_fts"'
+        # Searches run on worker threads; one shared connection is serialized by the lock
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                              "(id INTEGER PRIMARY KEY, key TEXT, data TEXT NOT NULL)")
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_key" ON {self.table} (key)')
+            try:
+                self.conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} "
+                                  "USING fts5(body, tokenize='porter unicode61')")
+                self.has_fts = True
+            except sqlite3.OperationalError as e:  # SQLite built without FTS5
+                logger.warning(f"FTS5 unavailable, full-text lookups disabled: {str(e)}")
+                self.has_fts = False
+            # Change counter bumped by triggers, so writes from any process show up in stamp(). It starts at a
+            # random value so a recreated database never repeats an old database's stamps.
+            self.conn.execute("CREATE TABLE IF NOT EXISTS _changes (name TEXT PRIMARY KEY, counter INTEGER NOT NULL)")
+            self.conn.execute("INSERT OR IGNORE INTO _changes (name, counter) VALUES (?, ?)",
+                              (table, random.getrandbits(62)))
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                self.conn.execute(f'CREATE TRIGGER IF NOT EXISTS "{table}_changes_{event.lower()}" '
+                                  f"AFTER {event} ON {self.table} BEGIN "
+                                  f"UPDATE _changes SET counter = counter + 1 WHERE name = '{table}'; END")
+
+    @contextmanager
+    def buffered(self):
+        """Hold the connection for a batch of writes; each write already commits as one transaction."""
+        with self.lock:
+            yield self
+
+    def flush(self):
+        pass
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def fts_body(self, record) -> str:
+        parts = []
+        for field in self.text_fields:
+            value = record.get(field)
+            if isinstance(value, (list, tuple)):
+                parts.extend(str(v) for v in value)
+            elif value:
+                parts.append(str(value))
+        return "\n".join(parts)
+
+    def write_rows(self, rows):
+        """Insert (id or None, record) rows in the current transaction and return their ids."""
+        ids = []
+        for doc_id, record in rows:
+            cursor = self.conn.execute(f"INSERT INTO {self.table} (id, key, data) VALUES (?, ?, ?)",
+                                       (doc_id, record.get(self.key_field), json.dumps(record)))
+            if self.has_fts:
+                self.conn.execute(f"INSERT INTO {self.fts_table} (rowid, body) VALUES (?, ?)",
+                                  (cursor.lastrowid, self.fts_body(record)))
+            ids.append(cursor.lastrowid)
+        return ids
+
+    def insert(self, record) -> int:
+        return self.insert_multiple([record])[0]
+
+    def insert_multiple(self, records) -> list:
+        with self.lock, self.conn:
+            return self.write_rows((None, dict(record)) for record in records)
+
+    def documents(self, rows) -> list:
+        return [Document(json.loads(data), doc_id=doc_id) for doc_id, data in rows]
+
+    def all(self) -> list:
+        with self.lock:
+            return self.documents(self.conn.execute(f"SELECT id, data FROM {self.table} ORDER BY id"))
+
+    def get(self, doc_id=None, doc_ids=None):
+        if doc_ids is None:
+            docs = self.get(doc_ids=[doc_id])
+            return docs[0] if docs else None
+        doc_ids = list(doc_ids)
+        docs = []
+        with self.lock:
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                docs.extend(self.documents(self.conn.execute(
+                    f"SELECT id, data FROM {self.table} WHERE id IN ({placeholders})", chunk)))
+        order = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        return sorted(docs, key=lambda doc: order[doc.doc_id])
+
+    def find(self, value) -> list:
+        """Records whose key field equals value, via the key index."""
+        with self.lock:
+            return self.documents(self.conn.execute(
+                f"SELECT id, data FROM {self.table} WHERE key = ? ORDER BY id", (value,)))
+
+    def keys(self) -> list:
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                f"SELECT DISTINCT key FROM {self.table} WHERE key IS NOT NULL ORDER BY key")]
+
+    def update_key(self, value, fields):
+        with self.lock, self.conn:
+            for doc in self.find(value):
+                doc.update(fields)
+                self.conn.execute(f"UPDATE {self.table} SET key = ?, data = ? WHERE id = ?",
+                                  (doc.get(self.key_field), json.dumps(dict(doc)), doc.doc_id))
+                if self.has_fts:
+                    self.conn.execute(f"UPDATE {self.fts_table} SET body = ? WHERE rowid = ?",
+                                      (self.fts_body(doc), doc.doc_id))
+
+    def remove(self, doc_ids):
+        rows = [(doc_id,) for doc_id in doc_ids]
+        with self.lock, self.conn:
+            self.conn.executemany(f"DELETE FROM {self.table} WHERE id = ?", rows)
+            if self.has_fts:
+                self.conn.executemany(f"DELETE FROM {self.fts_table} WHERE rowid = ?", rows)
+
+    def remove_key(self, value) -> list:
+        """Delete records whose key field equals value and return them."""
+        with self.lock:
+            docs = self.find(value)
+            if docs:
+                self.remove([doc.doc_id for doc in docs])
+            return docs
+
+    def truncate(self):
+        with self.lock, self.conn:
+            self.conn.execute(f"DELETE FROM {self.table}")
+            if self.has_fts:
+                self.conn.execute(f"DELETE FROM {self.fts_table}")
+
+    def fulltext(self, words):
+        """Return ids of records whose text contains any of words (porter-stemmed), or None without FTS5."""
+        if not self.has_fts:
+            return None
+        terms = sorted(set(tokenize(" ".join(words))))
+        if not terms:
+            return set()
+        expression = " OR ".join(f'"{term}"' for term in terms)
+        with self.lock:
+            return {row[0] for row in self.conn.execute(
+                f"SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH ?", (expression,))}
+
+    def dump(self) -> dict:
+        """Return the table in TinyDB's on-disk layout, {table: {id: record}}."""
+        return {self.name: {str(doc.doc_id): dict(doc) for doc in self.all()}}
+
+    def load(self, data: dict):
+        """Replace the table with records in TinyDB's on-disk layout, keeping their ids."""
+        records = data.get(self.name, {})
+        with self.lock, self.conn:
+            self.conn.execute(f"DELETE FROM {self.table}")
+            if self.has_fts:
+                self.conn.execute(f"DELETE FROM {self.fts_table}")
+            self.write_rows((int(doc_id), record) for doc_id, record in records.items())
+
+    def stamp(self):
+        """Value that changes whenever the table may have changed: its trigger-maintained change counter."""
+        with self.lock:
+            return ["sqlite", self.conn.execute("SELECT counter FROM _changes WHERE name = ?", (self.name,)).fetchone()[0]]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class JournaledDatabase:
+    """Every table of one TinyDB JSON file, held in memory and persisted as snapshot plus change journal.
+
+    Each insert, update, remove or truncate appends one JSON line to <file>.journal and fsyncs it, so a
+    write costs O(record) and a crash can at worst lose a half-written last line. Once the journal passes
+    compact_bytes and compact_ratio times the snapshot size, a background thread writes a fresh snapshot
+    (still TinyDB's layout, replaced atomically) and drops the journal lines it covers. Journal entries set
+    or delete whole records, so replaying some that the snapshot already contains gives the same state.
+    """
+
+    def __init__(self, json_path, compact_bytes=1 << 20, compact_ratio=0.5):
+        self.path = Path(json_path)
+        self.journal_path = journal_path_for(json_path)
+        self.compact_bytes = compact_bytes
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.tables = {}  # Table name -> {doc id: record}
+        self.buffer = None  # Journal lines held back inside buffered()
+        self.compacting = False
+        self.compact_lock = threading.Lock()  # One snapshot writer at a time (background or on close)
+        self.closed = False
+        self.owner = self.lock_owner()
+        self.load()
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        atexit.register(self.close)
+
+    def lock_owner(self):
+        """Take an exclusive lock on <file>.journal.lock for as long as this process has the file open.
+
+        Tables live in this process's memory and compaction rewrites the snapshot from it, so a second
+        writer's appends would be overwritten; it is refused instead.
+        """
+        owner = open(self.journal_path.with_name(self.journal_path.name + ".lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(owner.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                owner.close()
+                raise StorageLockedError(f"{self.path} is open in another process's journal; use the tinydb or "
+                                         f"sqlite backend for files several processes write")
+        return owner
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = ""
+        data = json.loads(text) if text.strip() else {}
+        self.snapshot_bytes = len(text)
+        self.tables = {name: {int(doc_id): record for doc_id, record in table.items()} for name, table in data.items()}
+        replayed = 0
+        good_offset = 0
+        try:
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        self.apply(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"Ignoring incomplete journal entry in {self.journal_path}")
+                        break
+                    good_offset += len(line)
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        if self.journal_path.exists() and self.journal_path.stat().st_size != good_offset:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_offset)  # Drop the torn line so later appends start on a clean line
+        self.journal_bytes = good_offset
+        if replayed:
+            logger.info(f"Replayed {replayed} journal entries for {self.path}")
+
+    def apply(self, entry):
+        table = self.tables.setdefault(entry["table"], {})
+        op = entry["op"]
+        if op == "set":
+            for doc_id, record in entry["records"].items():
+                table[int(doc_id)] = record
+        elif op == "remove":
+            for doc_id in entry["ids"]:
+                table.pop(doc_id, None)
+        elif op == "truncate":
+            table.clear()
+
+    def record(self, entry):
+        """Apply a change in memory and journal it."""
+        with self.lock:
+            self.apply(entry)
+            line = json.dumps(entry) + "\n"
+            if self.buffer is not None:
+                self.buffer.append(line)
+            else:
+                self.write_journal([line])
+
+    def write_journal(self, lines):
+        if not lines:
+            return
+        data = "".join(lines)
+        self.journal.write(data)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_bytes += len(data.encode("utf-8"))
+        self.maybe_compact()
+
+    @contextmanager
+    def buffered(self):
+        """Collect the block's journal lines and write them with one fsync."""
+        with self.lock:
+            if self.buffer is not None:
+                yield
+                return
+            self.buffer = []
+            try:
+                yield
+            finally:
+                lines, self.buffer = self.buffer, None
+                self.write_journal(lines)
+
+    def next_id(self, table):
+        rows = self.tables.get(table)
+        return max(rows) + 1 if rows else 1
+
+    def maybe_compact(self):
+        if self.compacting or self.journal_bytes < self.compact_bytes:
+            return
+        if self.journal_bytes < self.compact_ratio * self.snapshot_bytes:
+            return
+        self.compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Write a fresh snapshot and trim the journal entries it includes."""
+        with self.compact_lock:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        try:
+            with self.lock:
+                text = json.dumps({name: {str(doc_id): record for doc_id, record in table.items()}
+                                   for name, table in self.tables.items()})
+                covered = self.journal_bytes
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            with self.lock:
+                # Keep only entries appended while the snapshot was being written
+                self.journal.close()
+                with open(self.journal_path, "rb") as f:
+                    f.seek(covered)
+                    tail = f.read()
+                tmp_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.journal_path)
+                self.journal = open(self.journal_path, "a", encoding="utf-8")
+                self.journal_bytes = len(tail)
+                self.snapshot_bytes = len(text)
+            logger.info(f"Compacted {self.path} ({covered} journal bytes folded in)")
+        except Exception as e:
+            logger.error(f"Journal compaction failed for {self.path}: {str(e)}")
+        finally:
+            self.compacting = False
+
+    def close(self):
+        """Fold the journal into the snapshot so plain TinyDB readers see every change."""
+        with self.compact_lock, self.lock:  # Same lock order as a background compaction still running
+            if self.closed:
+                return
+            if self.journal_bytes:
+                self.write_snapshot()
+            self.journal.close()
+            self.owner.close()  # Releases the lock
+            self.closed = True
+            JOURNALS.pop(str(self.path.resolve()), None)
+        atexit.unregister(self.close)
+
+
+JOURNALS = {}  # Resolved JSON path -> JournaledDatabase shared by every table opened on that file
+JOURNALS_LOCK = threading.Lock()
+
+
+def journal_for(json_path):
+    key = str(Path(json_path).resolve())
+    with JOURNALS_LOCK:
+        database = JOURNALS.get(key)
+        if database is None:
+            database = JOURNALS[key] = JournaledDatabase(json_path)
+        return database
+
+
+def fold_journal(json_path):
+    """Compact a leftover journal into its JSON file before the file is read some other way."""
+    if journal_path_for(json_path).exists():
+        journal_for(json_path).close()
+
+
+class JournalStore:
+    """Store interface over one table of a JournaledDatabase; key lookups scan the in-memory table."""
+
+    backend = "journal"
+
+    def __init__(self, json_path, table):
+        self.key_field, self.text_fields = table_spec(json_path, table)
+        self.name = table
+        self.database = journal_for(json_path)
+        self.lock = self.database.lock
+        with self.lock:
+            self.rows = self.database.tables.setdefault(table, {})
+
+    def buffered(self):
+        return self.database.buffered()
+
+    def flush(self):
+        pass
+
+    def __len__(self):
+        return len(self.rows)
+
+    def documents(self, items) -> list:
+        return [Document(json.loads(json.dumps(record)), doc_id=doc_id) for doc_id, record in items]
+
+    def insert(self, record) -> int:
+        return self.insert_multiple([record])[0]
+
+    def insert_multiple(self, records) -> list:
+        with self.lock:
+            doc_id = self.database.next_id(self.name)
+            new_rows = {}
+            for record in records:
+                record_id = getattr(record, "doc_id", None) or doc_id
+                new_rows[record_id] = dict(record)
+                doc_id = max(doc_id, record_id) + 1
+            self.database.record({"op": "set", "table": self.name, "records": new_rows})
+            return list(new_rows)
+
+    def all(self) -> list:
+        with self.lock:
+            return self.documents(list(self.rows.items()))
+
+    def get(self, doc_id=None, doc_ids=None):
+        with self.lock:
+            if doc_ids is None:
+                record = self.rows.get(doc_id)
+                return self.documents([(doc_id, record)])[0] if record is not None else None
+            return self.documents([(i, self.rows[i]) for i in doc_ids if i in self.rows])
+
+    def find(self, value) -> list:
+        """Records whose key field equals value."""
+        with self.lock:
+            return self.documents([(i, r) for i, r in self.rows.items() if r.get(self.key_field) == value])
+
+    def keys(self) -> list:
+        with self.lock:
+            return sorted({r[self.key_field] for r in self.rows.values() if self.key_field in r})
+
+    def update_key(self, value, fields):
+        with self.lock:
+            changed = {i: {**r, **fields} for i, r in self.rows.items() if r.get(self.key_field) == value}
+            if changed:
+                self.database.record({"op": "set", "table": self.name, "records": changed})
+
+    def remove(self, doc_ids):
+        doc_ids = list(doc_ids)
+        if doc_ids:
+            self.database.record({"op": "remove", "table": self.name, "ids": doc_ids})
+
+    def remove_key(self, value) -> list:
+        """Delete records whose key field equals value and return them."""
+        with self.lock:
+            docs = self.find(value)
+            self.remove([doc.doc_id for doc in docs])
+            return docs
+
+    def truncate(self):
+        self.database.record({"op": "truncate", "table": self.name})
+
+    def fulltext(self, words):
+        """Full-text lookup is not available; callers fall back to their in-memory indexes."""
+        return None
+
+    def dump(self) -> dict:
+        """Return the table in TinyDB's on-disk layout, {table: {id: record}}."""
+        return {self.name: {str(doc.doc_id): dict(doc) for doc in self.all()}}
+
+    def load(self, data: dict):
+        """Replace the table with records in TinyDB's on-disk layout, keeping their ids."""
+        records = data.get(self.name, {})
+        with self.buffered():
+            self.truncate()
+            if records:
+                self.database.record({"op": "set", "table": self.name, "records": {int(i): r for i, r in records.items()}})
+
+    def stamp(self):
+        """Value that changes whenever the table may have changed: a digest of its in-memory records."""
+        with self.lock:
+            data = json.dumps(sorted(self.rows.items()), sort_keys=True)
+        return ["journal", hashlib.sha256(data.encode("utf-8")).hexdigest()]
+
+    def close(self):
+        self.database.close()
+
+
+def migrate_tinydb(json_path, tables, overwrite=False) -> dict:
+    """Copy tables from a TinyDB JSON file into its SQLite replacement, keeping record ids.
+
+    Returns {table: records copied}. The JSON file is left untouched so the migration can be undone by
+    deleting the .sqlite3 file.
+    """
+    json_path = Path(json_path)
+    db_path = sqlite_path_for(json_path)
+    if db_path.exists():
+        if not overwrite:
+            raise FileExistsError(f"{db_path} already exists; pass overwrite=True to replace it")
+        db_path.unlink()
+    fold_journal(json_path)
+    source = TinyDB(json_path)
+    counts = {}
+    try:
+        for table in tables:
+            store = SQLiteStore(db_path, table)
+            try:
+                store.load({table: {str(doc.doc_id): dict(doc) for doc in source.table(table).all()}})
+                counts[table] = len(store)
+            finally:
+                store.close()
+    finally:
+        source.close()
+    logger.info(f"Migrated {json_path} to {db_path}: {counts}")
+    return counts
+
+
+def migrate_known_databases(root=".", overwrite=False) -> dict:
+    """Migrate every TinyDB file the apps use that exists under root; returns {json path: {table: count}}."""
+    migrated = {}
+    for relative_path, tables in KNOWN_DATABASES.items():
+        json_path = Path(root) / relative_path
+        if json_path.exists():
+            migrated[str(json_path)] = migrate_tinydb(json_path, tables, overwrite=overwrite)
+    return migrated
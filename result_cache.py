@@ -0,0 +1,78 @@
+# LRU cache for search results
+# Keys combine the normalized query, the active filters and an index generation counter; bumping the
+# generation after any upload/delete/import makes every older entry unreachable
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(value):
+    """Rough memory footprint of a cached value (a list of result tuples) in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            size += sys.getsizeof(item)
+            if isinstance(item, tuple):
+                size += sum(sys.getsizeof(part) for part in item)
+    return size
+
+
+class QueryCache:
+    """LRU result cache bounded by entry count and approximate memory use."""
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size in bytes)
+        self.total_bytes = 0
+        self.generation = 0  # Bumped whenever the indexed documents change
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, query, filters):
+        """Normalize whitespace, and case unless the search is case sensitive; regex patterns are kept as typed."""
+        if not filters.get("regex"):
+            query = " ".join(query.split())
+            if not filters.get("case_sensitive"):
+                query = query.lower()
+        return query, tuple(sorted(filters.items())), self.generation
+
+    def get(self, query, filters):
+        """Return the cached value, or None on a miss."""
+        key = self.make_key(query, filters)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query, filters, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        key = self.make_key(query, filters)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def bump_generation(self):
+        """Invalidate every cached result after the index changes."""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return f"Cache: {self.hits} hits, {self.misses} misses, {len(self.entries)} entries"
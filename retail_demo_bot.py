@@ -1,35 +1,21 @@
 from PyQt5.QtWidgets import QMainWindow, QTabWidget, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QCheckBox, QComboBox, QTextEdit, QScrollArea, QLabel, QDialog, QSlider, QFileDialog, QProgressBar, QMessageBox, QTreeView, QMenu, QToolBar, QAction
 from PyQt5.QtGui import QFont, QPixmap, QStandardItemModel, QStandardItem
-from PyQt5.QtCore import Qt
-from tinydb import TinyDB, Query
-from fuzzywuzzy import fuzz
-from docx import Document
-import pdfplumber
-import fitz  # PyMuPDF
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize, sent_tokenize
-from collections import Counter
-import json
-import os
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, QFileSystemWatcher, pyqtSignal
 from pathlib import Path
+import os
 import re
 import uuid
 import logging
+import threading
 from PIL import Image
+from kb_engine import KnowledgeBaseEngine, SearchCancelled
+from kb_server import RemoteEngine, RemoteEngineError
+from kb_storage import open_store
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Download NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
-
 class ImageZoomDialog(QDialog):
     def __init__(self, image_path, parent=None):
         super().__init__(parent)
@@ -92,7 +78,39 @@ class ImageZoomDialog(QDialog):
                 return True
         return super().eventFilter(obj, event)
 
+class SearchSignals(QObject):
+    finished = pyqtSignal(int, object)  # search id, ranked results
+    failed = pyqtSignal(int, str)  # search id, error message
+
+class SearchWorker(QRunnable):
+    # Runs a ranking function on the thread pool and reports back through signals
+    def __init__(self, search_id, rank, query, params):
+        super().__init__()
+        self.search_id = search_id
+        self.rank = rank
+        self.query = query
+        self.params = params
+        self.cancelled = threading.Event()
+        self.signals = SearchSignals()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            ranked = self.rank(self.query, self.params, self.cancelled)
+        except SearchCancelled:
+            return
+        except Exception as e:
+            logger.error(f"Search failed: {str(e)}")
+            self.signals.failed.emit(self.search_id, str(e))
+            return
+        if not self.cancelled.is_set():
+            self.signals.finished.emit(self.search_id, ranked)
+
 class RetailSupportBotApp(QMainWindow):
+    RESULTS_PER_PAGE = 10
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Retail Support Bot - Knowledge Base Chatbot")
@@ -100,33 +118,35 @@ class RetailSupportBotApp(QMainWindow):
         self.is_dark_mode = False
 
         # Initialize paths
-        self.DOCS_DIR = Path("docs")
         self.DATA_DIR = Path("data")
-        self.IMAGES_DIR = Path("images")
         self.DATA_DIR.mkdir(exist_ok=True)
-        self.IMAGES_DIR.mkdir(exist_ok=True)
-        self.DB_PATH = self.DATA_DIR / "knowledge_db.json"
         self.FAQ_DB_PATH = self.DATA_DIR / "support_bot_db.json"
-        self.SYNONYMS_PATH = self.DATA_DIR / "synonyms.json"
 
-        # Initialize TinyDB
-        self.db = TinyDB(self.DB_PATH)
-        self.paragraphs_table = self.db.table('paragraphs')
-        self.faq_db = TinyDB(self.FAQ_DB_PATH)
-        self.faq_table = self.faq_db.table('faqs')
+        # Knowledge base engine owns the paragraphs table, search index, synonyms and result cache; with
+        # KB_ENGINE_URL set, a shared daemon (`python kb.py serve`) does instead
+        engine_url = os.environ.get("KB_ENGINE_URL")
+        self.remote = bool(engine_url)  # DOCS_DIR is then the daemon's folder, which this process may not own
+        if engine_url:
+            self.engine = RemoteEngine(engine_url)
+            self.setWindowTitle(f"{self.windowTitle()} (remote engine {engine_url})")
+        else:
+            self.engine = KnowledgeBaseEngine(data_dir=self.DATA_DIR, images_dir="images", docs_dir="docs",
+                                              on_error=lambda message: QMessageBox.critical(self, "Error", message))
 
-        # Load synonyms
-        try:
-            with open(self.SYNONYMS_PATH, 'r') as f:
-                self.synonyms = json.load(f)
-        except FileNotFoundError:
-            self.synonyms = {}
-            with open(self.SYNONYMS_PATH, 'w') as f:
-                json.dump(self.synonyms, f, indent=4)
+        # FAQ table on TinyDB, or SQLite once migrated with `python kb.py migrate`
+        self.faq_table = open_store(self.FAQ_DB_PATH, 'faqs')
 
         # Chat history
         self.chat_history = []
         self.image_refs = []
+        self.last_search = None  # (query, filter params) of the results on screen, for paging
+
+        # Background search: only the newest search id is rendered, older workers are cancelled
+        self.thread_pool = QThreadPool.globalInstance()
+        self.search_worker = None
+        self.search_id = 0
+        self.pending_search = None
+        self.result_offset = 0
 
         # Central widget
         central_widget = QWidget()
@@ -141,10 +161,24 @@ class RetailSupportBotApp(QMainWindow):
         upload_action = QAction("Upload Document", self)
         upload_action.triggered.connect(self.upload_document)
         self.toolbar.addAction(upload_action)
+        self.watch_action = QAction("Watch docs/", self)
+        self.watch_action.setCheckable(True)
+        self.watch_action.toggled.connect(self.toggle_watch)
+        self.toolbar.addAction(self.watch_action)
         self.theme_action = QAction("Toggle Dark Mode", self)
         self.theme_action.triggered.connect(self.toggle_theme)
         self.toolbar.addAction(self.theme_action)
 
+        # Folder watch: QFileSystemWatcher (inotify on Linux) reports changes in docs/, and a short timer
+        # coalesces a burst of them (a copy in progress, a folder of drops) into one incremental sync
+        self.docs_watcher = QFileSystemWatcher(self)
+        self.docs_watcher.directoryChanged.connect(self.schedule_sync)
+        self.docs_watcher.fileChanged.connect(self.schedule_sync)
+        self.sync_timer = QTimer(self)
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.setInterval(1500)
+        self.sync_timer.timeout.connect(self.sync_watched)
+
         # Tabs
         self.tabs = QTabWidget()
         main_layout.addWidget(self.tabs)
@@ -182,114 +216,6 @@ class RetailSupportBotApp(QMainWindow):
         self.is_dark_mode = not self.is_dark_mode
         self.apply_theme()
 
-    def extract_from_pdf(self, file_path: str, doc_id: str) -> dict:
-        try:
-            with pdfplumber.open(file_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            doc = fitz.open(file_path)
-            image_paths = []
-            for page_num in range(len(doc)):
-                for img in doc[page_num].get_images():
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    if base_image:
-                        image_path = self.IMAGES_DIR / f"{doc_id}_img{len(image_paths)}.png"
-                        with open(image_path, "wb") as f:
-                            f.write(base_image["image"])
-                        image_paths.append(str(image_path))
-            doc.close()
-            return {"text": text, "image_paths": image_paths}
-        except Exception as e:
-            logger.error(f"Error processing PDF: {str(e)}")
-            QMessageBox.critical(self, "Error", f"Error processing PDF: {str(e)}")
-            return {"text": "", "image_paths": []}
-
-    def extract_from_docx(self, file_path: str, doc_id: str) -> dict:
-        try:
-            doc = Document(file_path)
-            text = "\n".join([para.text for para in doc.paragraphs])
-            image_paths = []
-            for rel in doc.part.rels.values():
-                if "image" in rel.target_ref:
-                    image_bytes = rel.target_part.blob
-                    image_ext = rel.target_ref.split('.')[-1]
-                    image_path = self.IMAGES_DIR / f"{doc_id}_img{len(image_paths)}.{image_ext}"
-                    with open(image_path, "wb") as f:
-                        f.write(image_bytes)
-                    image_paths.append(str(image_path))
-            return {"text": text, "image_paths": image_paths}
-        except Exception as e:
-            logger.error(f"Error processing DOCX: {str(e)}")
-            QMessageBox.critical(self, "Error", f"Error processing DOCX: {str(e)}")
-            return {"text": "", "image_paths": []}
-
-    def extract_from_txt(self, file_path: str) -> dict:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            return {"text": text, "image_paths": []}
-        except Exception as e:
-            logger.error(f"Error processing TXT: {str(e)}")
-            QMessageBox.critical(self, "Error", f"Error processing TXT: {str(e)}")
-            return {"text": "", "image_paths": []}
-
-    def extract_pdf_paragraphs(self, file_path: Path) -> list:
-        try:
-            with pdfplumber.open(file_path) as pdf:
-                paragraphs = []
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        paras = text.split('\n\n')
-                        for para in paras:
-                            if para.strip():
-                                sentences = sent_tokenize(para.strip())
-                                for sentence in sentences:
-                                    if len(sentence) > 20:
-                                        paragraphs.append(sentence.strip())
-                return paragraphs
-        except Exception as e:
-            logger.error(f"Error processing PDF {file_path}: {str(e)}")
-            return []
-
-    def extract_docx_paragraphs(self, file_path: Path) -> list:
-        try:
-            doc = Document(file_path)
-            return [para.text.strip() for para in doc.paragraphs if para.text.strip()]
-        except Exception as e:
-            logger.error(f"Error processing DOCX {file_path}: {str(e)}")
-            return []
-
-    def extract_txt_paragraphs(self, file_path: Path) -> list:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return [line.strip() for line in f if line.strip()]
-        except Exception as e:
-            logger.error(f"Error processing TXT {file_path}: {str(e)}")
-            return []
-
-    def generate_tags(self, text: str, filename: str) -> list:
-        stop_words = set(stopwords.words('english'))
-        words = word_tokenize(text.lower())
-        words = [word for word in words if word.isalpha() and word not in stop_words]
-        filename_tags = re.findall(r'\w+', filename.lower())
-        word_counts = Counter(words)
-        tags = [word for word, _ in word_counts.most_common(5)] + filename_tags
-        return list(set(tags))
-
-    def get_all_tags(self):
-        tags = set()
-        for doc in self.paragraphs_table.all():
-            tags.update(doc['tags'])
-        return sorted(list(tags))
-
-    def get_indexed_documents(self):
-        return sorted(set(doc['filename'] for doc in self.paragraphs_table.all()))
-
     def setup_search_tab(self):
         chat_widget = QWidget()
         chat_layout = QVBoxLayout(chat_widget)
@@ -315,7 +241,7 @@ class RetailSupportBotApp(QMainWindow):
         filter_layout = QHBoxLayout()
         filter_layout.addWidget(QLabel("Filter by Tag:"))
         self.tag_combo = QComboBox()
-        self.tag_combo.addItems(self.get_all_tags())
+        self.tag_combo.addItems(self.engine.all_tags())
         self.tag_combo.setCurrentIndex(-1)
         filter_layout.addWidget(self.tag_combo)
         filter_layout.addWidget(QLabel("File Type:"))
@@ -330,6 +256,8 @@ class RetailSupportBotApp(QMainWindow):
         self.preset_combo.addItems(["Custom", "Email", "Phone"])
         self.preset_combo.currentTextChanged.connect(self.set_regex_preset)
         filter_layout.addWidget(self.preset_combo)
+        self.live_search_check = QCheckBox("Search as you type")
+        filter_layout.addWidget(self.live_search_check)
         main_layout.addLayout(filter_layout)
 
         # Results
@@ -354,6 +282,11 @@ class RetailSupportBotApp(QMainWindow):
         self.query_input.setFont(QFont("Helvetica", 12))
         self.query_input.setFixedWidth(600)
         self.query_input.returnPressed.connect(self.search)
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(300)
+        self.debounce_timer.timeout.connect(self.live_search)
+        self.query_input.textChanged.connect(self.schedule_live_search)
         chat_input_layout.addWidget(self.query_input)
         send_button = QPushButton("Send")
         send_button.clicked.connect(self.search)
@@ -361,6 +294,10 @@ class RetailSupportBotApp(QMainWindow):
         clear_button = QPushButton("Clear")
         clear_button.clicked.connect(self.clear_chat)
         chat_input_layout.addWidget(clear_button)
+        self.more_button = QPushButton("More Results")
+        self.more_button.setEnabled(False)
+        self.more_button.clicked.connect(self.show_more_results)
+        chat_input_layout.addWidget(self.more_button)
         main_layout.addLayout(chat_input_layout)
 
         # Combine FAQ and main content
@@ -509,7 +446,7 @@ class RetailSupportBotApp(QMainWindow):
 
     def load_synonym_list(self):
         self.synonym_model.removeRows(0, self.synonym_model.rowCount())
-        for key, words in self.synonyms.items():
+        for key, words in self.engine.synonyms.items():
             item = QStandardItem(f"{key}: {', '.join(words)}")
             item.setData(key, Qt.UserRole)
             self.synonym_model.appendRow(item)
@@ -523,7 +460,7 @@ class RetailSupportBotApp(QMainWindow):
 
     def load_documents_list(self):
         self.documents_model.removeRows(0, self.documents_model.rowCount())
-        for filename in self.get_indexed_documents():
+        for filename in self.engine.indexed_documents():
             self.documents_model.appendRow(QStandardItem(filename))
 
     def filter_history(self, text):
@@ -577,78 +514,116 @@ class RetailSupportBotApp(QMainWindow):
         self.chat_history.append(query)
         self.load_history_list()
         self.tabs.setCurrentIndex(0)
+        self.show_results(query, self.search_params(), 0)
 
-        expanded_query = set(query.lower().split())
-        for word in query.lower().split():
-            for group in self.synonyms.values():
-                if word in group:
-                    expanded_query.update(group)
-        expanded_query = list(expanded_query)
+    def schedule_live_search(self, text):
+        if self.live_search_check.isChecked():
+            self.debounce_timer.start()  # Restarting the timer debounces fast typing
 
-        results = []
-        image_paths = set()
-        if self.regex_check.isChecked():
+    def live_search(self):
+        query = self.query_input.text().strip()
+        if query:
+            self.show_results(query, self.search_params(), 0, interactive=False)
+
+    def show_more_results(self):
+        if self.last_search:
+            query, params = self.last_search
+            self.show_results(query, params, self.result_offset + self.RESULTS_PER_PAGE)
+
+    def search_params(self) -> dict:
+        return {
+            'regex': self.regex_check.isChecked(),
+            'case_sensitive': self.case_sensitive_check.isChecked(),
+            'filetype': self.filetype_combo.currentText(),
+            'tag': self.tag_combo.currentText()
+        }
+
+    def show_results(self, query: str, params: dict, offset: int, interactive: bool = True):
+        ranked = self.engine.result_cache.get(query, params)
+        if ranked is not None:
+            self.cancel_search()
+            self.render_results(query, params, offset, ranked)
+            return
+        if params['regex']:
             try:
-                flags = 0 if self.case_sensitive_check.isChecked() else re.IGNORECASE
-                pattern = re.compile(query, flags)
-                for doc in self.paragraphs_table.all():
-                    if self.filetype_combo.currentText() != "All" and doc['filetype'] != self.filetype_combo.currentText():
-                        continue
-                    if self.tag_combo.currentText() and self.tag_combo.currentText() not in doc['tags']:
-                        continue
-                    lines = doc['text'].split('\n')
-                    for i, line in enumerate(lines, 1):
-                        if pattern.search(line):
-                            matched_text = line
-                            for match in pattern.finditer(line):
-                                matched_text = matched_text[:match.start()] + f"<b>{match.group()}</b>" + matched_text[match.end():]
-                            results.append({
-                                'filename': doc['filename'],
-                                'matched_text': matched_text,
-                                'line_number': i,
-                                'tags': doc['tags'],
-                                'score': 100,
-                                'image_paths': doc['image_paths']
-                            })
-                            image_paths.update(doc['image_paths'])
+                re.compile(query)
             except re.error:
-                QMessageBox.critical(self, "Error", "Invalid regex pattern")
+                if interactive:
+                    QMessageBox.critical(self, "Error", "Invalid regex pattern")
+                else:
+                    self.statusBar().showMessage("Invalid regex pattern", 3000)
                 return
+
+        # Hand the scan to the thread pool so the window stays responsive; a newer query cancels this one
+        self.cancel_search()
+        self.search_id += 1
+        self.pending_search = (query, params, offset, interactive, self.engine.result_cache.generation)
+        self.search_worker = SearchWorker(self.search_id, self.engine.rank, query, params)
+        self.search_worker.signals.finished.connect(self.on_search_finished)
+        self.search_worker.signals.failed.connect(self.on_search_failed)
+        self.statusBar().showMessage("Searching...")
+        self.thread_pool.start(self.search_worker)
+
+    def cancel_search(self):
+        if self.search_worker is not None:
+            self.search_worker.cancel()
+            self.search_worker = None
+        self.pending_search = None
+
+    def on_search_finished(self, search_id, ranked):
+        if search_id != self.search_id or self.pending_search is None:
+            return  # A newer query replaced this one
+        query, params, offset, _, generation = self.pending_search
+        self.search_worker = None
+        self.pending_search = None
+        if generation == self.engine.result_cache.generation:
+            self.engine.result_cache.put(query, params, ranked)
+        self.render_results(query, params, offset, ranked)
+
+    def on_search_failed(self, search_id, message):
+        if search_id != self.search_id or self.pending_search is None:
+            return
+        interactive = self.pending_search[3]
+        self.search_worker = None
+        self.pending_search = None
+        if interactive:
+            QMessageBox.critical(self, "Error", f"Search failed: {message}")
         else:
-            for doc in self.paragraphs_table.all():
-                if self.filetype_combo.currentText() != "All" and doc['filetype'] != self.filetype_combo.currentText():
-                    continue
-                if self.tag_combo.currentText() and self.tag_combo.currentText() not in doc['tags']:
-                    continue
-                score = max(fuzz.partial_ratio(word.lower(), doc['text'].lower()) for word in expanded_query)
-                if score > 70:
-                    matched_text = doc['text']
-                    for word in expanded_query:
-                        matched_text = re.sub(rf'\b({word})\b', r'<b>\1</b>', matched_text, flags=re.IGNORECASE)
-                    results.append({
-                        'filename': doc['filename'],
-                        'matched_text': matched_text,
-                        'line_number': None,
-                        'tags': doc['tags'],
-                        'score': score,
-                        'image_paths': doc['image_paths']
-                    })
-                    image_paths.update(doc['image_paths'])
-
-        results = sorted(results, key=lambda x: x['score'], reverse=True)[:10]
+            self.statusBar().showMessage(f"Search failed: {message}", 3000)
+
+    def render_results(self, query: str, params: dict, offset: int, ranked: list):
+        logger.info(self.engine.result_cache.stats())
+        self.statusBar().showMessage(self.engine.result_cache.stats(), 5000)
+
+        page = self.engine.top_page(ranked, offset, self.RESULTS_PER_PAGE)
+        try:
+            results = self.engine.materialize(query, params, page)
+        except RemoteEngineError as e:
+            self.statusBar().showMessage(f"Search failed: {str(e)}", 5000)
+            return
+        self.last_search = (query, params)
+        self.result_offset = offset
+        self.more_button.setEnabled(len(ranked) > offset + self.RESULTS_PER_PAGE)
+
+        image_paths = set()
         self.results_text.clear()
         html = ""
+        if offset:
+            html += f"<p><i>Results {offset + 1}-{offset + len(results)} of {len(ranked)}</i></p>"
         grouped_results = {}
         for result in results:
             filename = result['filename']
             if filename not in grouped_results:
                 grouped_results[filename] = []
-            grouped_results[filename].append((result['matched_text'], result['score'], result['tags'], result['line_number']))
+            grouped_results[filename].append((result['matched_text'], result['score'], result['tags'], result['line_number'], result.get('page')))
+            image_paths.update(result['image_paths'])
 
         for filename, paras in grouped_results.items():
             html += f"<h3>📄 {filename}</h3>"
-            for text, score, tags, line_number in paras:
+            for text, score, tags, line_number, page in paras:
                 html += f"<p>Score: {score}% | Tags: {', '.join(tags)}"
+                if page:
+                    html += f" | <i>Page: {page}</i>"
                 if line_number:
                     html += f" | <i>Line: {line_number}</i>"
                 html += f"<br>{text}</p>"
@@ -662,8 +637,9 @@ class RetailSupportBotApp(QMainWindow):
     def load_faq(self, index):
         if index.isValid():
             faq_id = self.faq_model.item(index.row(), 0).data(Qt.UserRole)
-            faq = self.faq_table.get(Query().id == faq_id)
-            if faq:
+            faqs = self.faq_table.find(faq_id)
+            if faqs:
+                faq = faqs[0]
                 self.faq_question_input.setText(faq['question'])
                 self.faq_answer_input.setText(faq['answer'])
                 self.selected_faq_id = faq_id
@@ -687,7 +663,7 @@ class RetailSupportBotApp(QMainWindow):
     def load_synonym(self, index):
         if index.isValid():
             key = self.synonym_model.item(index.row()).data(Qt.UserRole)
-            self.synonym_input.setText(','.join(self.synonyms[key]))
+            self.synonym_input.setText(','.join(self.engine.synonyms[key]))
 
     def load_history_query(self, index):
         if index.isValid():
@@ -699,6 +675,9 @@ class RetailSupportBotApp(QMainWindow):
         self.query_input.clear()
         self.results_text.clear()
         self.display_images([])
+        self.last_search = None
+        self.more_button.setEnabled(False)
+        self.cancel_search()
 
     def clear_history(self):
         self.chat_history = []
@@ -711,86 +690,92 @@ class RetailSupportBotApp(QMainWindow):
             return
 
         filename = Path(file_path).name
-        if filename in self.get_indexed_documents():
-            QMessageBox.warning(self, "Warning", f"Document '{filename}' is already indexed")
-            return
+        try:
+            if filename in self.engine.indexed_documents():
+                QMessageBox.warning(self, "Warning", f"Document '{filename}' is already indexed")
+                return
 
-        doc_id = str(uuid.uuid4())
-        if file_path.lower().endswith('.pdf'):
-            extracted_data = self.extract_from_pdf(file_path, doc_id)
-            paragraphs = self.extract_pdf_paragraphs(file_path)
-            filetype = 'pdf'
-        elif file_path.lower().endswith('.docx'):
-            extracted_data = self.extract_from_docx(file_path, doc_id)
-            paragraphs = self.extract_docx_paragraphs(file_path)
-            filetype = 'docx'
-        else:
-            extracted_data = self.extract_from_txt(file_path)
-            paragraphs = self.extract_txt_paragraphs(file_path)
-            filetype = 'txt'
-
-        for para in paragraphs:
-            tags = self.generate_tags(para, filename)
-            self.paragraphs_table.insert({
-                'filename': filename,
-                'filetype': filetype,
-                'text': para,
-                'tags': tags,
-                'image_paths': extracted_data['image_paths']
-            })
+            if not self.engine.index_paths([file_path]):
+                QMessageBox.warning(self, "Warning", f"The content of '{filename}' is already indexed under another name")
+                return
+        except RemoteEngineError as e:
+            QMessageBox.critical(self, "Error", f"Failed to index '{filename}': {str(e)}")
+            return
 
         self.tag_combo.clear()
-        self.tag_combo.addItems(self.get_all_tags())
+        self.tag_combo.addItems(self.engine.all_tags())
         self.load_documents_list()
         QMessageBox.information(self, "Success", "Document indexed successfully")
 
-    def batch_index(self):
-        self.DOCS_DIR.mkdir(exist_ok=True)
-        doc_files = list(self.DOCS_DIR.glob("*.pdf")) + list(self.DOCS_DIR.glob("*.docx")) + list(self.DOCS_DIR.glob("*.txt"))
-        indexed_files = self.get_indexed_documents()
-        new_files = [f for f in doc_files if f.name not in indexed_files]
-
-        if not new_files:
-            QMessageBox.warning(self, "Warning", "No new .pdf, .docx, or .txt files found in docs/ folder")
-            return
-
+    def sync_docs(self) -> dict:
+        """Index added and changed files in docs/ and drop removed ones, with a status bar progress bar."""
+        if not self.remote:
+            self.engine.DOCS_DIR.mkdir(exist_ok=True)
         progress = QProgressBar(self)
-        progress.setMaximum(len(new_files))
         self.statusBar().showMessage("Indexing documents...")
         self.statusBar().addWidget(progress)
 
-        for i, file_path in enumerate(new_files):
-            progress.setValue(i + 1)
-            doc_id = str(uuid.uuid4())
-            if file_path.suffix.lower() == '.pdf':
-                extracted_data = self.extract_from_pdf(file_path, doc_id)
-                paragraphs = self.extract_pdf_paragraphs(file_path)
-                filetype = 'pdf'
-            elif file_path.suffix.lower() == '.docx':
-                extracted_data = self.extract_from_docx(file_path, doc_id)
-                paragraphs = self.extract_docx_paragraphs(file_path)
-                filetype = 'docx'
-            else:
-                extracted_data = self.extract_from_txt(file_path)
-                paragraphs = self.extract_txt_paragraphs(file_path)
-                filetype = 'txt'
-
-            for para in paragraphs:
-                tags = self.generate_tags(para, file_path.name)
-                self.paragraphs_table.insert({
-                    'filename': file_path.name,
-                    'filetype': filetype,
-                    'text': para,
-                    'tags': tags,
-                    'image_paths': extracted_data['image_paths']
-                })
+        def update_progress(done, total, name):
+            progress.setMaximum(total)
+            progress.setValue(done)
 
-        self.tag_combo.clear()
-        self.tag_combo.addItems(self.get_all_tags())
-        self.load_documents_list()
-        self.statusBar().removeWidget(progress)
-        self.statusBar().clearMessage()
-        QMessageBox.information(self, "Success", f"Indexed {len(new_files)} new documents")
+        try:
+            changes = self.engine.sync_sources(progress=update_progress)
+        finally:
+            self.statusBar().removeWidget(progress)
+            self.statusBar().clearMessage()
+        if any(changes[kind] for kind in ("added", "changed", "removed")):
+            self.tag_combo.clear()
+            self.tag_combo.addItems(self.engine.all_tags())
+            self.load_documents_list()
+        return changes
+
+    def batch_index(self):
+        try:
+            changes = self.sync_docs()
+        except RemoteEngineError as e:
+            QMessageBox.critical(self, "Error", f"Failed to sync documents: {str(e)}")
+            return
+        if not any(changes.values()):
+            QMessageBox.warning(self, "Warning", "No new, changed or removed .pdf, .docx, or .txt files in docs/ folder")
+            return
+        QMessageBox.information(self, "Success", f"Indexed {len(changes['added'])} new and {len(changes['changed'])} "
+                                f"changed documents, removed {len(changes['removed'])}, skipped "
+                                f"{len(changes['duplicates'])} duplicates")
+
+    def toggle_watch(self, enabled):
+        if enabled:
+            if not self.remote:
+                self.engine.DOCS_DIR.mkdir(exist_ok=True)
+            self.sync_watched()
+        else:
+            self.sync_timer.stop()
+            watched = self.docs_watcher.directories() + self.docs_watcher.files()
+            if watched:
+                self.docs_watcher.removePaths(watched)
+
+    def schedule_sync(self, path):
+        self.sync_timer.start()  # Restarting the single-shot timer debounces bursts of events
+
+    def sync_watched(self):
+        if not self.watch_action.isChecked():
+            return
+        try:
+            changes = self.sync_docs()
+        except Exception as e:
+            logger.error(f"Folder sync failed: {str(e)}")
+            self.statusBar().showMessage(f"Folder sync failed: {str(e)}", 5000)
+            changes = None
+        if changes and any(changes.values()):
+            self.statusBar().showMessage(f"docs/ synced: {len(changes['added'])} added, {len(changes['changed'])} "
+                                         f"changed, {len(changes['removed'])} removed", 5000)
+        # Watch the folder for adds and removes and each file for in-place edits; rewritten files drop out
+        # of the watch list, so it is refreshed after every sync
+        paths = [str(self.engine.DOCS_DIR)] + [str(f) for f in self.engine.collect_files([self.engine.DOCS_DIR])]
+        watched = set(self.docs_watcher.directories() + self.docs_watcher.files())
+        missing = [path for path in paths if path not in watched]
+        if missing:
+            self.docs_watcher.addPaths(missing)
 
     def add_faq(self):
         question = self.faq_question_input.text().strip()
@@ -824,10 +809,10 @@ class RetailSupportBotApp(QMainWindow):
             return
 
         faq_id = self.faq_model.item(index.row(), 0).data(Qt.UserRole)
-        self.faq_table.update({
+        self.faq_table.update_key(faq_id, {
             "question": new_question,
             "answer": new_answer
-        }, Query().id == faq_id)
+        })
         self.load_faq_buttons()
         self.load_faq_list()
         self.faq_question_input.clear()
@@ -841,7 +826,7 @@ class RetailSupportBotApp(QMainWindow):
             return
 
         faq_id = self.faq_model.item(index.row(), 0).data(Qt.UserRole)
-        self.faq_table.remove(Query().id == faq_id)
+        self.faq_table.remove_key(faq_id)
         self.load_faq_buttons()
         self.load_faq_list()
         QMessageBox.information(self, "Success", "FAQ deleted successfully")
@@ -858,9 +843,11 @@ class RetailSupportBotApp(QMainWindow):
             return
 
         key = words[0]
-        self.synonyms[key] = words
-        with open(self.SYNONYMS_PATH, 'w') as f:
-            json.dump(self.synonyms, f, indent=4)
+        try:
+            self.engine.set_synonym_group(key, words)
+        except RemoteEngineError as e:
+            QMessageBox.critical(self, "Error", f"Failed to save synonyms: {str(e)}")
+            return
         self.load_synonym_list()
         self.synonym_input.clear()
         QMessageBox.information(self, "Success", "Synonym group added/updated successfully")
@@ -872,9 +859,11 @@ class RetailSupportBotApp(QMainWindow):
             return
 
         key = self.synonym_model.item(index.row()).data(Qt.UserRole)
-        del self.synonyms[key]
-        with open(self.SYNONYMS_PATH, 'w') as f:
-            json.dump(self.synonyms, f, indent=4)
+        try:
+            self.engine.delete_synonym_group(key)
+        except RemoteEngineError as e:
+            QMessageBox.critical(self, "Error", f"Failed to save synonyms: {str(e)}")
+            return
         self.load_synonym_list()
         QMessageBox.information(self, "Success", "Synonym group deleted successfully")
 
@@ -887,20 +876,13 @@ class RetailSupportBotApp(QMainWindow):
         filename = self.documents_model.item(index.row()).text()
         reply = QMessageBox.question(self, "Confirm", f"Are you sure you want to delete '{filename}' and its associated images?", QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            image_paths = set()
-            docs_to_delete = self.paragraphs_table.search(Query().filename == filename)
-            for doc in docs_to_delete:
-                image_paths.update(doc['image_paths'])
-            
-            for path in image_paths:
-                try:
-                    os.remove(path)
-                except Exception as e:
-                    logger.warning(f"Failed to delete image {path}: {str(e)}")
-            
-            self.paragraphs_table.remove(Query().filename == filename)
+            try:
+                self.engine.delete(filename)
+            except RemoteEngineError as e:
+                QMessageBox.critical(self, "Error", f"Failed to delete '{filename}': {str(e)}")
+                return
             self.tag_combo.clear()
-            self.tag_combo.addItems(self.get_all_tags())
+            self.tag_combo.addItems(self.engine.all_tags())
             self.load_documents_list()
             QMessageBox.information(self, "Success", f"Document '{filename}' deleted successfully")
 
@@ -0,0 +1,464 @@
+# Search index helpers for the knowledge base apps
+# Keeps a persistent inverted index (term -> document/paragraph ids with term frequencies) so searches
+# only score candidate documents instead of scanning the whole TinyDB table, and ranks them with BM25.
+# A character-trigram index shortlists likely fuzzy matches, and a shared-character bound on fuzz.partial_ratio
+# lets the rest be skipped without changing which documents score above the apps' cutoff,
+# and a regex planner extracts the literals every match needs so regex search can skip most paragraphs.
+# Both indexes can also be attached to a memory-mapped snapshot (index_snapshot) and answer queries from it
+# directly; the first change copies the snapshot into the in-memory structures.
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from fuzzywuzzy import fuzz
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+TRIGRAM_MIN_OVERLAP = 0.1  # Default fraction of query trigrams a candidate must share
+TRIGRAM_MIN_GRAMS = 6  # Queries with fewer trigrams (under 8 characters) are scanned in full, see candidates()
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def trigrams(text):
+    """Return the set of lowercase character trigrams in text, with whitespace collapsed."""
+    text = " ".join(text.lower().split())
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def required_literals(pattern):
+    """Return lowercase literal substrings that every match of the regex pattern must contain.
+
+    Only the top-level sequence (and groups/repeats that must occur at least once) is inspected;
+    alternations are skipped, so the result may be empty but never includes an optional literal.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, sre_constants.error):
+        return []
+    literals = []
+
+    def walk(items):
+        run = ""
+        for op, arg in items:
+            if op == sre_constants.LITERAL:
+                run += chr(arg)
+                continue
+            if run:
+                literals.append(run.lower())
+                run = ""
+            if op == sre_constants.SUBPATTERN:
+                walk(arg[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and arg[0] >= 1:
+                walk(arg[2])
+        if run:
+            literals.append(run.lower())
+
+    walk(parsed)
+    return literals
+
+
+def partial_ratio_bound(query, text):
+    """Upper bound on fuzz.partial_ratio(query, text) from the characters the two strings share.
+
+    partial_ratio compares the shorter string with windows of the longer one; a window can match at most the
+    shared characters (I), so no window scores above 2I / (len(shorter) + I).
+    """
+    if query == text:
+        return 100
+    shorter = min(len(query), len(text))
+    if not shorter:
+        return 0
+    shared = sum(min(count, text.count(char)) for char, count in Counter(query).items())
+    return 200 * shared / (shorter + shared)
+
+
+def may_score_above(query, texts, cutoff=50):
+    """Return False only when no text can score above cutoff with fuzz.partial_ratio(query, text)."""
+    return any(partial_ratio_bound(query, text) > cutoff for text in texts)
+
+
+def line_offsets(text):
+    """Return the start offset of every line in text."""
+    offsets = [0]
+    pos = text.find("\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = text.find("\n", pos + 1)
+    return offsets
+
+
+class TrigramIndex:
+    """Trigram -> doc ids postings used to shortlist candidates before fuzzy matching.
+
+    min_overlap is the fraction of the query's trigrams a candidate must share; 0 or None disables pruning.
+    Short queries are never pruned, since one typo removes all of their trigrams ("wifi" and "wofi" share none
+    but score 75). Near-random matches of longer queries can also share none, so the apps only use the shortlist
+    to skip may_score_above for likely matches and still check every other document against it.
+    """
+
+    def __init__(self, min_overlap=TRIGRAM_MIN_OVERLAP):
+        self.min_overlap = min_overlap
+        self.postings = {}  # trigram -> set of doc ids
+        self.doc_trigrams = {}  # doc_id -> trigrams it was indexed under, for removal
+        self.mapped = None  # (trigram table, offsets, ids, id lookup, doc ids) while serving from a snapshot
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        if self.mapped is not None:
+            return len(self.mapped[4])
+        return len(self.doc_trigrams)
+
+    def add_to_snapshot(self, builder, name):
+        with self.lock:
+            self.thaw()
+            grams = sorted(self.postings)
+            builder.add_strings(f"{name}.grams", grams)
+            builder.add_lists(f"{name}.postings", [sorted(self.postings[gram]) for gram in grams])
+            builder.add_array(f"{name}.doc_ids", sorted(self.doc_trigrams), np.int64)
+
+    def attach(self, snapshot, name, id_lookup=None):
+        """Serve candidates from snapshot arrays; id_lookup maps stored integers back to ids (e.g. term strings)."""
+        offsets, ids = snapshot.lists(f"{name}.postings")
+        with self.lock:
+            self.postings = {}
+            self.doc_trigrams = {}
+            self.mapped = (snapshot.strings(f"{name}.grams"), offsets, ids, id_lookup, snapshot.array(f"{name}.doc_ids"))
+
+    def gram_postings(self, gram):
+        if self.mapped is None:
+            return self.postings.get(gram, ())
+        grams, offsets, ids, id_lookup, _ = self.mapped
+        i = grams.find(gram)
+        if i < 0:
+            return ()
+        row = ids[offsets[i]:offsets[i + 1]].tolist()
+        return [id_lookup(doc_id) for doc_id in row] if id_lookup else row
+
+    def thaw(self):
+        """Copy a snapshot into the in-memory postings so the index can change."""
+        if self.mapped is None:
+            return
+        grams, offsets, ids, id_lookup, doc_ids = self.mapped
+        self.mapped = None
+        self.doc_trigrams = {id_lookup(doc_id) if id_lookup else doc_id: set() for doc_id in doc_ids.tolist()}
+        for i, gram in enumerate(grams):
+            row = ids[offsets[i]:offsets[i + 1]].tolist()
+            members = {id_lookup(doc_id) for doc_id in row} if id_lookup else set(row)
+            self.postings[gram] = members
+            for doc_id in members:
+                self.doc_trigrams[doc_id].add(gram)
+
+    def add(self, doc_id, *texts):
+        """Index the trigrams of texts (e.g. name, tags, content) under doc_id."""
+        grams = set()
+        for text in texts:
+            grams |= trigrams(text)
+        with self.lock:
+            self.thaw()
+            if doc_id in self.doc_trigrams:
+                self.remove(doc_id)
+            self.doc_trigrams[doc_id] = grams
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self.thaw()
+            for gram in self.doc_trigrams.pop(doc_id, ()):
+                ids = self.postings.get(gram)
+                if ids:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del self.postings[gram]
+
+    def clear(self):
+        with self.lock:
+            self.postings = {}
+            self.doc_trigrams = {}
+            self.mapped = None
+
+    def overlaps(self, query):
+        """Return {id: number of query trigrams it shares} for every id sharing at least one."""
+        counts = {}
+        with self.lock:
+            for gram in trigrams(query):
+                for doc_id in self.gram_postings(gram):
+                    counts[doc_id] = counts.get(doc_id, 0) + 1
+        return counts
+
+    def candidates(self, query, min_overlap=None):
+        """Return ids sharing enough trigrams with query, or None when the query can't be pruned."""
+        min_overlap = self.min_overlap if min_overlap is None else min_overlap
+        grams = trigrams(query)
+        if not min_overlap or not grams:
+            return None
+        if min_overlap < 1 and len(grams) < TRIGRAM_MIN_GRAMS:
+            return None  # Fuzzy matches of short queries often share no trigram at all
+        required = max(1, math.ceil(min_overlap * len(grams)))
+        return {doc_id for doc_id, count in self.overlaps(query).items() if count >= required}
+
+
+class InvertedIndex:
+    """Term -> {doc id: term frequency} postings, persisted as JSON next to the database."""
+
+    def __init__(self, path=None, load=True):
+        self.path = path
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}  # doc_id -> number of tokens
+        self.total_length = 0  # Sum of doc_lengths, kept for the BM25 average document length
+        self.term_trigrams = TrigramIndex()  # Vocabulary trigrams, so match_terms skips unrelated terms
+        self.mapped = None  # Snapshot arrays (see attach) used instead of the dicts above until the first change
+        self.loaded = False
+        self.lock = threading.RLock()  # Ingest threads update the index while the GUI thread searches it
+        if load and path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        if self.mapped is not None:
+            return len(self.mapped["doc_ids"])
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id):
+        if self.mapped is not None:
+            return self.doc_position(doc_id) >= 0
+        return doc_id in self.doc_lengths
+
+    # Snapshot support
+    def add_to_snapshot(self, builder, name):
+        """Add the vocabulary, postings, document lengths and term trigrams to a SnapshotBuilder."""
+        with self.lock:
+            self.thaw()
+            terms = sorted(self.postings)
+            builder.add_strings(f"{name}.terms", terms)
+            builder.add_lists(f"{name}.postings", [list(self.postings[term]) for term in terms])
+            builder.add_lists(f"{name}.frequencies", [list(self.postings[term].values()) for term in terms], np.int32)
+            doc_ids = sorted(self.doc_lengths)
+            builder.add_array(f"{name}.doc_ids", doc_ids, np.int64)
+            builder.add_array(f"{name}.doc_lengths", [self.doc_lengths[doc_id] for doc_id in doc_ids], np.int64)
+            builder.meta[f"{name}.total_length"] = self.total_length
+            # The term trigram index stores term positions in the sorted vocabulary
+            positions = {term: i for i, term in enumerate(terms)}
+            grams = sorted(self.term_trigrams.postings)
+            builder.add_strings(f"{name}.term_trigrams.grams", grams)
+            builder.add_lists(f"{name}.term_trigrams.postings",
+                              [sorted(positions[term] for term in self.term_trigrams.postings[gram]) for gram in grams])
+            builder.add_array(f"{name}.term_trigrams.doc_ids", range(len(terms)), np.int64)
+
+    def attach(self, snapshot, name):
+        """Answer queries straight from a memory-mapped snapshot written by add_to_snapshot."""
+        offsets, doc_ids = snapshot.lists(f"{name}.postings")
+        terms = snapshot.strings(f"{name}.terms")
+        with self.lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.total_length = snapshot.meta[f"{name}.total_length"]
+            self.mapped = {
+                "terms": terms,
+                "offsets": offsets,
+                "postings": doc_ids,
+                "frequencies": snapshot.array(f"{name}.frequencies.values"),
+                "doc_ids": snapshot.array(f"{name}.doc_ids"),
+                "doc_lengths": snapshot.array(f"{name}.doc_lengths"),
+            }
+            self.term_trigrams.attach(snapshot, f"{name}.term_trigrams", id_lookup=terms.__getitem__)
+            self.loaded = True
+
+    def thaw(self):
+        """Copy an attached snapshot into the in-memory dicts so the index can change."""
+        if self.mapped is None:
+            return
+        mapped, self.mapped = self.mapped, None
+        self.term_trigrams.thaw()
+        offsets, doc_ids, frequencies = mapped["offsets"], mapped["postings"], mapped["frequencies"]
+        self.postings = {term: dict(zip(doc_ids[offsets[i]:offsets[i + 1]].tolist(),
+                                        frequencies[offsets[i]:offsets[i + 1]].tolist()))
+                         for i, term in enumerate(mapped["terms"])}
+        self.doc_lengths = dict(zip(mapped["doc_ids"].tolist(), mapped["doc_lengths"].tolist()))
+
+    def doc_position(self, doc_id):
+        doc_ids = self.mapped["doc_ids"]
+        i = int(np.searchsorted(doc_ids, doc_id))
+        return i if i < len(doc_ids) and doc_ids[i] == doc_id else -1
+
+    def term_count(self):
+        return len(self.mapped["terms"]) if self.mapped is not None else len(self.postings)
+
+    def all_terms(self):
+        return self.mapped["terms"] if self.mapped is not None else self.postings
+
+    def term_postings(self, term):
+        """{doc id: term frequency} for term; empty if the term is not indexed."""
+        if self.mapped is None:
+            return self.postings.get(term, {})
+        i = self.mapped["terms"].find(term)
+        if i < 0:
+            return {}
+        start, end = self.mapped["offsets"][i], self.mapped["offsets"][i + 1]
+        return dict(zip(self.mapped["postings"][start:end].tolist(), self.mapped["frequencies"][start:end].tolist()))
+
+    def doc_length(self, doc_id):
+        if self.mapped is None:
+            return self.doc_lengths[doc_id]
+        return int(self.mapped["doc_lengths"][self.doc_position(doc_id)])
+
+    def add(self, doc_id, text):
+        """Index text under doc_id, replacing any previous postings for it."""
+        tokens = tokenize(text)
+        with self.lock:
+            self.thaw()
+            if doc_id in self.doc_lengths:
+                self.remove(doc_id)
+            self.doc_lengths[doc_id] = len(tokens)
+            self.total_length += len(tokens)
+            for term in tokens:
+                if term not in self.postings:
+                    self.term_trigrams.add(term, term)
+                postings = self.postings.setdefault(term, {})
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+
+    def remove(self, doc_id, text=None):
+        """Drop doc_id from the index; passing its text avoids walking every posting list."""
+        with self.lock:
+            self.thaw()
+            if doc_id not in self.doc_lengths:
+                return
+            self.total_length -= self.doc_lengths.pop(doc_id)
+            terms = set(tokenize(text)) if text is not None else list(self.postings)
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings and doc_id in postings:
+                    del postings[doc_id]
+                    if not postings:
+                        del self.postings[term]
+                        self.term_trigrams.remove(term)
+
+    def clear(self):
+        with self.lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.total_length = 0
+            self.term_trigrams.clear()
+            self.mapped = None
+
+    def match_terms(self, word, cutoff=70):
+        """Return vocabulary terms that fuzzily match word (same partial_ratio rule as the scorer).
+
+        A shorter term also matches when it resembles the start or end of word, since the scorer compares word
+        with the whole text: "troubleshooting" finds "trouble shooting" through "trouble" and "shooting".
+        """
+        word = word.lower()
+        matches = set()
+        with self.lock:
+            if self.term_postings(word):
+                matches.add(word)
+            shortlist = self.term_trigrams.candidates(word)
+            for term in self.all_terms() if shortlist is None else shortlist:
+                if term in matches:
+                    continue
+                if len(term) >= len(word):
+                    score = fuzz.partial_ratio(word, term)
+                else:
+                    score = max(fuzz.ratio(word, term), fuzz.ratio(term, word[:len(term)]),
+                                fuzz.ratio(term, word[-len(term):]))
+                if score > cutoff:
+                    matches.add(term)
+        return matches
+
+    def candidates(self, words, cutoff=70):
+        """Return ids of documents containing a term that matches any of words (multi-word phrases are split)."""
+        doc_ids = set()
+        with self.lock:
+            for word in words:
+                for token in tokenize(word):
+                    for term in self.match_terms(token, cutoff):
+                        doc_ids.update(self.term_postings(term))
+        return doc_ids
+
+    def related(self, words, limit):
+        """Return ids of documents holding the terms that share the most trigrams with words, stopping once
+        about limit documents are collected; a bounded fallback for words that match no term."""
+        doc_ids = set()
+        with self.lock:
+            counts = {}
+            for word in words:
+                for term, count in self.term_trigrams.overlaps(word).items():
+                    counts[term] = max(counts.get(term, 0), count)
+            for term in sorted(counts, key=lambda term: (-counts[term], term)):
+                if len(doc_ids) >= limit:
+                    break
+                doc_ids.update(self.term_postings(term))
+        return doc_ids
+
+    def containing(self, fragment):
+        """Return ids of documents with a term containing fragment (a run of word characters)."""
+        fragment = fragment.lower()
+        doc_ids = set()
+        with self.lock:
+            shortlist = self.term_trigrams.candidates(fragment, min_overlap=1.0)
+            for term in self.all_terms() if shortlist is None else shortlist:
+                if fragment in term:
+                    doc_ids.update(self.term_postings(term))
+        return doc_ids
+
+    def bm25_scores(self, terms, k1=1.5, b=0.75):
+        """Score documents against terms with Okapi BM25; only documents in the posting lists are touched."""
+        scores = {}
+        with self.lock:
+            doc_count = len(self)
+            if not doc_count:
+                return scores
+            avg_length = self.total_length / doc_count or 1.0
+            for term in set(terms):
+                postings = self.term_postings(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = k1 * (1 - b + b * self.doc_length(doc_id) / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def load(self):
+        """Load postings from self.path; JSON keys come back as strings so ids are restored to int."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            with self.lock:
+                self.mapped = None
+                self.postings = {term: {int(doc_id): tf for doc_id, tf in postings.items()}
+                                 for term, postings in data.get("postings", {}).items()}
+                self.doc_lengths = {int(doc_id): length for doc_id, length in data.get("doc_lengths", {}).items()}
+                self.total_length = sum(self.doc_lengths.values())
+                self.term_trigrams.clear()
+                for term in self.postings:
+                    self.term_trigrams.add(term, term)
+                self.loaded = True
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load search index {self.path}: {str(e)}")
+            self.clear()
+
+    def save(self):
+        """Write postings to self.path via a temp file so a crash never leaves a half-written index."""
+        if not self.path or self.mapped is not None:
+            return  # Unchanged since the snapshot was built from the saved file
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"postings": self.postings, "doc_lengths": self.doc_lengths}, f)
+            os.replace(tmp_path, self.path)
+            self.loaded = True
@@ -2,45 +2,24 @@ import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
-from tinydb import TinyDB, Query
-from docx import Document as DocxDocument
-import fitz  # PyMuPDF
 from PIL import Image, ImageTk
 from fuzzywuzzy import fuzz
-from sklearn.feature_extraction.text import TfidfVectorizer
+from search_index import TrigramIndex, may_score_above
+from kb_engine import extract_text, generate_tags
+from kb_storage import open_store
+from blob_store import file_sha256
+from doc_manifest import SourceManifest, list_documents
 
 # Initialize database and folders
-db = TinyDB("knowledge_base.json")
+db = open_store("knowledge_base.json", "_default")
+trigram_index = TrigramIndex(min_overlap=0.1)  # Shortlists likely fuzzy matches; the rest go through may_score_above
 kb_folder = "kb_documents"
 img_folder = "images"
 os.makedirs(kb_folder, exist_ok=True)
 os.makedirs(img_folder, exist_ok=True)
+folder_manifest = SourceManifest("kb_documents_manifest.json")  # Shared with index_documents; read here, never written
 
 # Helper functions
-def extract_text(file_path):
-    ext = file_path.lower()
-    if ext.endswith(".txt"):
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-    elif ext.endswith(".docx"):
-        doc = DocxDocument(file_path)
-        return "\n".join([p.text for p in doc.paragraphs])
-    elif ext.endswith(".pdf"):
-        doc = fitz.open(file_path)
-        return "\n".join([page.get_text() for page in doc])
-    return ""
-
-def generate_tags(text, top_n=5):
-    vectorizer = TfidfVectorizer(stop_words="english", max_features=50)
-    try:
-        X = vectorizer.fit_transform([text])
-        scores = X.toarray()[0]
-        words = vectorizer.get_feature_names_out()
-        top_indices = scores.argsort()[::-1][:top_n]
-        return [words[i] for i in top_indices if scores[i] > 0]
-    except:
-        return []
-
 def highlight_text(text_widget, keyword):
     text_widget.tag_remove("highlight", "1.0", tk.END)
     if keyword:
@@ -54,8 +33,20 @@ def highlight_text(text_widget, keyword):
             idx = lastidx
         text_widget.tag_config("highlight", background="yellow")
 
-def is_duplicate(file_name):
-    return any(doc["name"] == file_name for doc in db.all())
+def index_document(doc_id, doc):
+    trigram_index.add(doc_id, doc["name"], doc["content"], *doc.get("tags", []))
+
+def folder_hashes():
+    # SHA-256 -> name for kb_folder, hashing only files the manifest has not seen at their current size and mtime
+    folder_manifest.load()
+    entries = folder_manifest.diff(list_documents(kb_folder)).entries
+    return {entry["sha256"]: os.path.basename(path) for path, entry in entries.items()}
+
+def is_duplicate(file_name, path=None, hashes=None):
+    # Same name in the database, or (given folder_hashes()) the same content already in kb_folder
+    if db.find(file_name):
+        return True
+    return path is not None and hashes is not None and file_sha256(path) in hashes
 
 # GUI
 class KnowledgeBaseApp:
@@ -68,6 +59,9 @@ class KnowledgeBaseApp:
         self.main_frame = ttk.Frame(root, padding=5)
         self.main_frame.pack(fill=tk.BOTH, expand=True)
 
+        for doc in db.all():
+            index_document(doc.doc_id, doc)
+
         self.setup_menu()
         self.setup_layout()
         self.load_documents()
@@ -114,34 +108,40 @@ class KnowledgeBaseApp:
 
     def add_document(self):
         file_paths = filedialog.askopenfilenames(filetypes=[("Documents", "*.txt *.pdf *.docx")])
+        hashes = folder_hashes() if file_paths else {}
         for path in file_paths:
             name = os.path.basename(path)
-            if is_duplicate(name):
+            if is_duplicate(name, path, hashes):
                 continue
-            text = extract_text(path)
+            text = extract_text(path, max_images=0)[0]
             tags = generate_tags(text)
-            db.insert({"name": name, "content": text, "tags": tags})
+            doc = {"name": name, "content": text, "tags": tags}
+            index_document(db.insert(doc), doc)
             dest = os.path.join(kb_folder, name)
             if not os.path.exists(dest):
                 with open(dest, "wb") as f_out, open(path, "rb") as f_in:
                     f_out.write(f_in.read())
+            hashes[file_sha256(dest)] = name
         self.load_documents()
 
     def scan_folder(self):
         folder = filedialog.askdirectory()
         if not folder:
             return
+        hashes = folder_hashes()
         for file in os.listdir(folder):
             if file.lower().endswith((".txt", ".pdf", ".docx")):
                 full_path = os.path.join(folder, file)
-                if not is_duplicate(file):
-                    text = extract_text(full_path)
+                if not is_duplicate(file, full_path, hashes):
+                    text = extract_text(full_path, max_images=0)[0]
                     tags = generate_tags(text)
-                    db.insert({"name": file, "content": text, "tags": tags})
+                    doc = {"name": file, "content": text, "tags": tags}
+                    index_document(db.insert(doc), doc)
                     dest = os.path.join(kb_folder, file)
                     if not os.path.exists(dest):
                         with open(dest, "wb") as f_out, open(full_path, "rb") as f_in:
                             f_out.write(f_in.read())
+                    hashes[file_sha256(dest)] = file
         self.load_documents()
 
     def load_documents(self):
@@ -154,7 +154,7 @@ class KnowledgeBaseApp:
         if not selection:
             return
         name = self.doc_listbox.get(selection[0])
-        doc = next((d for d in db.all() if d["name"] == name), None)
+        doc = next(iter(db.find(name)), None)
         if doc:
             self.text_preview.delete("1.0", tk.END)
             self.text_preview.insert(tk.END, doc["content"])
@@ -177,11 +177,16 @@ class KnowledgeBaseApp:
         if not query:
             return
         results = []
+        # Documents outside the trigram shortlist are scored only if the character bound allows a match
+        shortlist = trigram_index.candidates(query) or ()
         for doc in db.all():
+            texts = [doc["name"].lower(), doc["content"].lower(), *(tag.lower() for tag in doc.get("tags", []))]
+            if doc.doc_id not in shortlist and not may_score_above(query.lower(), texts):
+                continue
             score = max(
-                fuzz.partial_ratio(query.lower(), doc["name"].lower()),
-                fuzz.partial_ratio(query.lower(), doc["content"].lower()),
-                max((fuzz.partial_ratio(query.lower(), tag.lower()) for tag in doc.get("tags", [])), default=0)
+                fuzz.partial_ratio(query.lower(), texts[0]),
+                fuzz.partial_ratio(query.lower(), texts[1]),
+                max((fuzz.partial_ratio(query.lower(), tag) for tag in texts[2:]), default=0)
             )
             if score > 50:
                 results.append((score, doc))
@@ -0,0 +1,45 @@
+# Compiled synonym lookup for query expansion
+# Turns the synonym groups from synonyms.json into a reverse word/phrase -> group dictionary, so expanding
+# a query costs a few dict lookups no matter how many groups are defined
+import re
+
+
+def normalize_phrase(text):
+    """Lowercase text and collapse whitespace so multi-word synonyms compare equal."""
+    return " ".join(text.lower().split())
+
+
+class SynonymMap:
+    """Reverse lookup from each synonym (single word or phrase) to every word in its groups."""
+
+    def __init__(self, synonyms=None):
+        self.compile(synonyms or {})
+
+    def compile(self, synonyms):
+        """Rebuild the lookup from a {key: [synonyms]} dict; call after synonyms.json changes."""
+        self.groups = {}  # normalized word or phrase -> set of synonyms
+        self.max_phrase_words = 1
+        for key, words in synonyms.items():
+            group = {normalize_phrase(w) for w in [key] + list(words) if w.strip()}
+            for phrase in group:
+                self.groups.setdefault(phrase, set()).update(group)
+                self.max_phrase_words = max(self.max_phrase_words, len(phrase.split()))
+
+    def expand(self, query):
+        """Return the query words plus every synonym of any word or phrase in the query."""
+        words = normalize_phrase(query).split()
+        expanded = set(words)
+        for start in range(len(words)):
+            for length in range(1, min(self.max_phrase_words, len(words) - start) + 1):
+                group = self.groups.get(" ".join(words[start:start + length]))
+                if group:
+                    expanded.update(group)
+        return sorted(expanded)
+
+
+def highlight_pattern(words):
+    """Compile one case-insensitive pattern matching any of words, longest first, for single-pass highlighting."""
+    alternatives = sorted({re.escape(w) for w in words if w}, key=len, reverse=True)
+    if not alternatives:
+        return None
+    return re.compile(rf"\b({'|'.join(alternatives)})\b", re.IGNORECASE)
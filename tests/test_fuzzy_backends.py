@@ -0,0 +1,38 @@
+"""rapidfuzz and fuzzywuzzy back ends of batch_partial_ratio on sample queries."""
+import numpy as np
+import pytest
+from fuzzywuzzy import fuzz
+
+import fuzzy_scoring
+from test_term_matching import PARAGRAPHS, QUERIES
+
+pytest.importorskip("rapidfuzz")
+
+WORDS = sorted({word for query in QUERIES for word in query.split()})
+TEXTS = [text.lower() for text in PARAGRAPHS.values()]
+
+
+@pytest.fixture
+def both_backends(monkeypatch):
+    """(rapidfuzz scores, fuzzywuzzy scores) for every sample word against every paragraph."""
+    rapid_scores = fuzzy_scoring.batch_partial_ratio(WORDS, TEXTS, score_cutoff=0)
+    monkeypatch.setattr(fuzzy_scoring, "rapid_process", None)
+    monkeypatch.setattr(fuzzy_scoring, "fuzz", fuzz, raising=False)
+    return rapid_scores, fuzzy_scoring.batch_partial_ratio(WORDS, TEXTS, score_cutoff=0)
+
+
+def test_rapidfuzz_never_scores_lower(both_backends):
+    rapid_scores, fuzzywuzzy_scores = both_backends
+    assert (np.rint(rapid_scores) >= fuzzywuzzy_scores).all()
+    assert (np.rint(rapid_scores) > fuzzywuzzy_scores).any()  # Scores do change with the back end
+
+
+def test_backends_match_the_same_paragraphs(both_backends):
+    rapid_scores, fuzzywuzzy_scores = both_backends
+    assert ((rapid_scores > 70) == (fuzzywuzzy_scores > 70)).all()
+
+
+def test_known_difference():
+    text = "connect to the office wofi network"
+    assert fuzz.partial_ratio("wifi", text) == 50
+    assert fuzzy_scoring.best_scores(["wifi"], [text], score_cutoff=0)[0] == 75
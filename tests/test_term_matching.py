@@ -0,0 +1,52 @@
+"""Inverted-index candidates must find every paragraph the full scan finds."""
+from fuzzy_scoring import best_scores
+from search_index import InvertedIndex
+
+PARAGRAPHS = {
+    1: "Printer trouble shooting: check the paper tray first.",
+    2: "Troubleshooting the VPN client on Windows laptops.",
+    3: "Reset a forgotten password from the login screen.",
+    4: "The wi-fi network name is on the back of the router.",
+    5: "Use the set up wizard to pair a bar code scanner.",
+    6: "Log in with your employee id and pass word.",
+    7: "Receipt printers need a new paper roll every shift.",
+    8: "Cash drawer will not open after a power outage.",
+    9: "Update the point of sale software nightly.",
+    10: "Handheld scanners charge in the dock overnight.",
+    11: "Sign-in problems are usually caused by caps lock.",
+    12: "Ask the store manager for refund approval codes.",
+}
+
+QUERIES = [
+    "troubleshooting", "trouble shooting", "troubleshoting", "wifi", "setup", "barcode", "password", "login",
+    "signin", "printer", "receipts", "drawer", "powerout", "pointofsale", "scaner", "refund", "overnight",
+    "handheld", "employee", "paper roll", "caps lock", "nightly",
+]
+
+
+def matches(words, doc_ids):
+    """The engine's fuzzy rule: a paragraph matches when some word's partial_ratio with it exceeds 70."""
+    doc_ids = sorted(doc_ids)
+    scores = best_scores(words, [PARAGRAPHS[doc_id].lower() for doc_id in doc_ids], score_cutoff=70)
+    return {doc_id for doc_id, score in zip(doc_ids, scores) if score > 70}
+
+
+def build_index():
+    index = InvertedIndex()
+    for doc_id, text in PARAGRAPHS.items():
+        index.add(doc_id, text)
+    return index
+
+
+def test_candidates_match_full_scan():
+    index = build_index()
+    for query in QUERIES:
+        words = query.split()
+        assert matches(words, index.candidates(words)) == matches(words, PARAGRAPHS), query
+
+
+def test_words_split_in_the_text_are_found():
+    index = build_index()
+    assert 1 in index.candidates(["troubleshooting"])
+    assert 4 in index.candidates(["wifi"])
+    assert 9 in index.candidates(["pointofsale"])
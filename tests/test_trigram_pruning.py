@@ -0,0 +1,80 @@
+"""Trigram pruning must not change which documents the fuzzy search finds."""
+from fuzzywuzzy import fuzz
+
+from search_index import TrigramIndex, may_score_above, partial_ratio_bound
+
+DOCUMENTS = {
+    1: "Wofi network in the office",
+    2: "Printer troubleshooting guide",
+    3: "Reset your password in the portal",
+    4: "VPN client setup for remote workers",
+    5: "Outlook calendar sharing permissions",
+    6: "Replacing the toner cartridge",
+    7: "Laptop battery drains quickly",
+    8: "Two-factor authentication enrolment",
+    9: "Install the accounting software update",
+    10: "Projector does not detect HDMI input",
+    11: "Mailbox is full, archive old messages",
+    12: "Request a new monitor or keyboard",
+}
+
+SHORT_QUERIES = ["wifi", "wofi", "vpn", "printer", "priner", "battery", "tonner", "network", "hdmi"]
+
+LONG_QUERIES = [
+    "troubleshoting", "trouble shooting", "pasword reset", "outlok calender", "two factor", "authentification",
+    "software updates", "acounting", "remote worker", "projecter hdmi", "mail box full", "archive messages",
+    "new keyboard", "monitor request", "calendar permissions", "toner cartrige", "password portal",
+    "laptop battery", "drains quick", "office network", "client setup", "enrollment",
+]
+
+
+def search(query, index=None):
+    """The apps' fuzzy search, keeping scores above 50; with an index, documents outside its shortlist
+    are only scored when the character bound allows a match."""
+    query = query.lower()
+    shortlist = (index.candidates(query) or ()) if index is not None else None
+    scores = {}
+    for doc_id, text in DOCUMENTS.items():
+        if shortlist is not None and doc_id not in shortlist and not may_score_above(query, [text.lower()]):
+            continue
+        scores[doc_id] = fuzz.partial_ratio(query, text.lower())
+    return {doc_id: score for doc_id, score in scores.items() if score > 50}
+
+
+def build_index(min_overlap=None):
+    index = TrigramIndex() if min_overlap is None else TrigramIndex(min_overlap=min_overlap)
+    for doc_id, text in DOCUMENTS.items():
+        index.add(doc_id, text)
+    return index
+
+
+def test_wifi_matches_wofi_without_shared_trigrams():
+    index = build_index()
+    assert fuzz.partial_ratio("wifi", "wofi") == 75
+    assert 1 in search("wifi")
+    assert search("wifi", index) == search("wifi")
+
+
+def test_short_queries_are_not_pruned():
+    index = build_index()
+    for query in SHORT_QUERIES:
+        assert index.candidates(query) is None
+        assert search(query, index) == search(query), query
+
+
+def test_pruning_keeps_every_match():
+    index = build_index()
+    for query in LONG_QUERIES:
+        assert search(query, index) == search(query), query
+
+
+def test_bound_is_never_below_the_score():
+    for query in SHORT_QUERIES + LONG_QUERIES:
+        for text in DOCUMENTS.values():
+            for a, b in ((query, text.lower()), (query, query[:3]), (text.lower()[:5], query)):
+                assert round(partial_ratio_bound(a, b)) >= fuzz.partial_ratio(a, b), (a, b)
+
+
+def test_exact_containment_is_still_pruned():
+    index = build_index()
+    assert index.candidates("hdmi", min_overlap=1.0) == {10}
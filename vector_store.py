@@ -0,0 +1,261 @@
+# Corpus-level term vectors for tagging and similarity search
+# One shared vocabulary plus a sparse float32 term-count matrix (CSR: data, indices, indptr), saved as .npy
+# files and memory-mapped at startup. Row i belongs to doc_ids[i]; TF-IDF weights are derived from the
+# counts at query time, so tags and similarity are a few NumPy operations over the whole matrix. Document
+# frequencies are kept up to date by add/remove, so tagging a new document never touches the matrix; added rows
+# are merged into the CSR arrays only by save() or a similarity query.
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\b\w\w+\b")  # Same tokens as scikit-learn's default token_pattern
+
+
+def term_counts(text):
+    """Count lowercased tokens of two or more characters, minus English stop words."""
+    return Counter(token for token in TOKEN_RE.findall(text.lower()) if token not in ENGLISH_STOP_WORDS)
+
+
+class VectorStore:
+    """Sparse document-term matrix keyed by doc id, persisted next to prefix as .npy files plus a JSON vocabulary."""
+
+    def __init__(self, prefix):
+        self.prefix = str(prefix)
+        self.lock = threading.RLock()
+        self.clear()
+        self.load()
+
+    def path(self, part):
+        return f"{self.prefix}.{part}"
+
+    def clear(self):
+        with self.lock:
+            self.terms = []  # Column -> term
+            self.vocabulary = {}  # Term -> column
+            self.doc_ids = []  # Row -> doc id, None for removed rows
+            self.rows = {}  # Doc id -> row
+            self.data = np.zeros(0, dtype=np.float32)
+            self.indices = np.zeros(0, dtype=np.int32)
+            self.indptr = np.zeros(1, dtype=np.int64)
+            self.pending = []  # (doc id, columns, counts) added since the matrix was last rebuilt
+            self.row_ids = None  # Row of every stored value, derived from indptr on demand
+            self.df = np.zeros(0, dtype=np.int64)  # Column -> live documents containing it; may run past len(terms)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.rows
+
+    def load(self):
+        """Memory-map the saved matrix; a missing or unreadable store starts empty."""
+        try:
+            with open(self.path("vocab.json"), "r") as f:
+                meta = json.load(f)
+            data = np.load(self.path("data.npy"), mmap_mode="r")
+            indices = np.load(self.path("indices.npy"), mmap_mode="r")
+            indptr = np.load(self.path("indptr.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"Failed to load vector store {self.prefix}: {str(e)}")
+            return
+        with self.lock:
+            self.terms = meta["terms"]
+            self.vocabulary = {term: col for col, term in enumerate(self.terms)}
+            self.doc_ids = meta["doc_ids"]
+            self.rows = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+            self.data, self.indices, self.indptr = data, indices, indptr
+            self.row_ids = None
+            self.pending = []
+            self.df = self.count_documents()
+
+    def count_documents(self):
+        """Document frequency per column, counted over the live stored rows and the pending ones."""
+        row_ids = np.repeat(np.arange(len(self.doc_ids)), np.diff(self.indptr))
+        live = np.array([doc_id is not None for doc_id in self.doc_ids], dtype=bool)
+        indices = np.asarray(self.indices)
+        df = np.bincount(indices[live[row_ids]] if len(row_ids) else indices[:0], minlength=len(self.terms))
+        for _, columns, _ in self.pending:
+            df[columns] += 1
+        return df.astype(np.int64)
+
+    def grow_counts(self):
+        if len(self.df) < len(self.terms):
+            # Grow geometrically, so adding documents with new terms stays linear overall
+            grown = np.zeros(max(len(self.terms), 2 * len(self.df)), dtype=np.int64)
+            grown[:len(self.df)] = self.df
+            self.df = grown
+
+    def count(self, columns, change):
+        self.grow_counts()
+        self.df[columns] += change
+
+    def add(self, doc_id, text):
+        """Add or replace a document's term counts; call save() to persist."""
+        counts = term_counts(text)
+        with self.lock:
+            self.remove(doc_id)
+            columns = np.array([self.column(term) for term in counts], dtype=np.int32)
+            values = np.array(list(counts.values()), dtype=np.float32)
+            order = np.argsort(columns)
+            self.pending.append((doc_id, columns[order], values[order]))
+            self.count(columns, 1)
+            self.rows[doc_id] = len(self.doc_ids) + len(self.pending) - 1
+
+    def column(self, term):
+        col = self.vocabulary.get(term)
+        if col is None:
+            col = self.vocabulary[term] = len(self.terms)
+            self.terms.append(term)
+        return col
+
+    def remove(self, doc_id):
+        with self.lock:
+            row = self.rows.pop(doc_id, None)
+            if row is None:
+                return
+            if row < len(self.doc_ids):
+                self.doc_ids[row] = None
+                self.count(np.asarray(self.indices[int(self.indptr[row]):int(self.indptr[row + 1])]), -1)
+            else:
+                self.count(self.pending[row - len(self.doc_ids)][1], -1)
+                self.pending = [entry for entry in self.pending if entry[0] != doc_id]
+                self.renumber()
+
+    def renumber(self):
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.doc_ids) if doc_id is not None}
+        for i, (doc_id, _, _) in enumerate(self.pending):
+            self.rows[doc_id] = len(self.doc_ids) + i
+
+    def merge_pending(self):
+        """Append pending rows to the CSR arrays (copies the memory-mapped arrays into memory)."""
+        if not self.pending:
+            return
+        lengths = [len(columns) for _, columns, _ in self.pending]
+        self.data = np.concatenate([self.data] + [values for _, _, values in self.pending])
+        self.indices = np.concatenate([self.indices] + [columns for _, columns, _ in self.pending])
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths, dtype=np.int64)])
+        self.doc_ids.extend(doc_id for doc_id, _, _ in self.pending)
+        self.pending = []
+        self.row_ids = None
+
+    def compact(self):
+        """Drop removed rows from the arrays."""
+        live = [row for row, doc_id in enumerate(self.doc_ids) if doc_id is not None]
+        if len(live) == len(self.doc_ids):
+            return
+        starts, ends = self.indptr[live], self.indptr[np.array(live, dtype=np.int64) + 1]
+        keep = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)]) if live else np.zeros(0, dtype=np.int64)
+        self.data = np.asarray(self.data)[keep]
+        self.indices = np.asarray(self.indices)[keep]
+        self.indptr = np.concatenate([[0], np.cumsum(ends - starts)]).astype(np.int64)
+        self.doc_ids = [self.doc_ids[row] for row in live]
+        self.renumber()
+        self.row_ids = None
+
+    def save(self):
+        """Write the matrix and vocabulary, replacing each file atomically, then re-map it."""
+        with self.lock:
+            self.merge_pending()
+            self.compact()
+            # Copy out of the memory maps first so the files can be replaced
+            arrays = {"data": np.array(self.data, dtype=np.float32), "indices": np.array(self.indices, dtype=np.int32),
+                      "indptr": np.array(self.indptr, dtype=np.int64)}
+            self.data, self.indices, self.indptr = arrays["data"], arrays["indices"], arrays["indptr"]
+            for part, array in arrays.items():
+                tmp_path = self.path(f"{part}.npy.tmp")
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, self.path(f"{part}.npy"))
+            tmp_path = self.path("vocab.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"terms": self.terms, "doc_ids": self.doc_ids}, f)
+            os.replace(tmp_path, self.path("vocab.json"))
+        self.load()
+
+    # Weighting
+    def matrix(self):
+        """Merge pending rows and return (data, indices, row_ids, live row mask) for the whole corpus."""
+        self.merge_pending()
+        if self.row_ids is None:
+            self.row_ids = np.repeat(np.arange(len(self.doc_ids)), np.diff(self.indptr))
+        live = np.array([doc_id is not None for doc_id in self.doc_ids], dtype=bool)
+        return np.asarray(self.data), np.asarray(self.indices), self.row_ids, live
+
+    def idf(self):
+        """Smoothed inverse document frequency per column, like TfidfVectorizer(smooth_idf=True)."""
+        self.grow_counts()
+        return np.log((1 + len(self.rows)) / (1 + self.df[:len(self.terms)])) + 1
+
+    def top_terms(self, text, top_n=5):
+        """Return the top_n terms of text by TF-IDF against the stored corpus (new terms weigh most)."""
+        counts = term_counts(text)
+        if not counts:
+            return []
+        with self.lock:
+            idf = self.idf()
+            unseen = math.log(1 + len(self.rows)) + 1
+            scored = [(count * (idf[self.vocabulary[term]] if term in self.vocabulary else unseen), term)
+                      for term, count in counts.items()]
+        return [term for _, term in sorted(scored, key=lambda item: (-item[0], item[1]))[:top_n]]
+
+    def scores(self, query_weights):
+        """Cosine similarity of every stored row against a dense, already IDF-weighted query vector."""
+        data, indices, row_ids, live = self.matrix()
+        idf = self.idf()
+        weights = data * idf[indices]
+        norms = np.sqrt(np.bincount(row_ids, weights=weights * weights, minlength=len(self.doc_ids)))
+        dots = np.bincount(row_ids, weights=weights * query_weights[indices], minlength=len(self.doc_ids))
+        query_norm = np.linalg.norm(query_weights) or 1.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = np.where((norms > 0) & live, dots / (norms * query_norm), 0.0)
+        return similarity
+
+    def ranked(self, similarity, top_n, exclude=None):
+        order = np.argsort(-similarity, kind="stable")
+        results = []
+        for row in order:
+            if similarity[row] <= 0 or len(results) >= top_n:
+                break
+            doc_id = self.doc_ids[row]
+            if doc_id is not None and doc_id != exclude:
+                results.append((doc_id, float(similarity[row])))
+        return results
+
+    def query(self, text, top_n=10):
+        """Return [(doc id, cosine similarity)] for the stored documents most similar to text."""
+        counts = term_counts(text)
+        with self.lock:
+            self.merge_pending()
+            query_weights = np.zeros(len(self.terms), dtype=np.float64)
+            for term, count in counts.items():
+                col = self.vocabulary.get(term)
+                if col is not None:
+                    query_weights[col] = count
+            if not query_weights.any():
+                return []
+            query_weights *= self.idf()
+            return self.ranked(self.scores(query_weights), top_n)
+
+    def similar(self, doc_id, top_n=10):
+        """Return [(doc id, cosine similarity)] for the documents most similar to a stored one."""
+        with self.lock:
+            self.merge_pending()
+            row = self.rows.get(doc_id)
+            if row is None:
+                return []
+            start, end = int(self.indptr[row]), int(self.indptr[row + 1])
+            query_weights = np.zeros(len(self.terms), dtype=np.float64)
+            query_weights[np.asarray(self.indices[start:end])] = np.asarray(self.data[start:end])
+            query_weights *= self.idf()
+            return self.ranked(self.scores(query_weights), top_n, exclude=doc_id)